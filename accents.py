@@ -0,0 +1,103 @@
+"""
+Разметка ударений и буквы ё отдельным этапом
+
+Текст книги размечается один раз (знак + перед ударной гласной,
+восстановленная ё, омографы) и сохраняется в ACCENTS_DIR по хешу
+исходного текста. Синтез получает размеченный текст с выключенной
+автоматической расстановкой, поэтому лингвистическая работа не
+повторяется для каждого фрагмента, голоса и перерендера. Разметку
+можно поправить вручную — исправленная версия заменяет сохранённую.
+"""
+
+import hashlib
+import os
+import tempfile
+import threading
+from pathlib import Path
+
+from config import ACCENTS_DIR
+from text_processing import count_accent_marks
+
+
+class AccentorUnavailable(RuntimeError):
+    """Разметчик ударений не установлен или не загрузился."""
+
+
+_accentor = None
+_lock = threading.Lock()
+
+
+def _get_accentor():
+    """Загружает разметчик silero-stress при первом обращении."""
+    global _accentor
+    with _lock:
+        if _accentor is None:
+            try:
+                from silero_stress import load_accentor
+            except ImportError as e:
+                raise AccentorUnavailable(
+                    "пакет silero-stress не установлен (pip install silero-stress)"
+                ) from e
+            try:
+                _accentor = load_accentor()
+            except Exception as e:
+                raise AccentorUnavailable(f"не удалось загрузить разметчик: {e}") from e
+        return _accentor
+
+
+def annotation_path(text: str) -> Path:
+    """Файл разметки для исходного текста."""
+    return ACCENTS_DIR / f"{hashlib.sha256(text.encode('utf-8')).hexdigest()[:32]}.txt"
+
+
+def load_annotation(text: str) -> str | None:
+    try:
+        return annotation_path(text).read_text(encoding="utf-8")
+    except OSError:
+        return None
+
+
+def save_annotation(text: str, annotated: str) -> Path:
+    """Сохраняет разметку (в том числе исправленную вручную) атомарно."""
+    path = annotation_path(text)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_name = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(annotated)
+        os.replace(tmp_name, path)
+    except BaseException:
+        Path(tmp_name).unlink(missing_ok=True)
+        raise
+    return path
+
+
+def annotate_text(text: str, on_progress=None) -> tuple[str, bool]:
+    """
+    Возвращает (размеченный текст, взят_из_сохранённого). Разметка
+    считается построчно — строка книги обычно абзац, так что память
+    разметчика не зависит от длины текста. on_progress(fraction).
+    Бросает AccentorUnavailable, если разметчика нет.
+    """
+    annotated = load_annotation(text)
+    if annotated is not None:
+        return annotated, True
+
+    accentor = _get_accentor()
+    lines = text.split("\n")
+    out = []
+    for i, line in enumerate(lines):
+        out.append(accentor(line) if line.strip() else line)
+        if on_progress and i % 200 == 0:
+            on_progress(i / len(lines))
+    annotated = "\n".join(out)
+    save_annotation(text, annotated)
+    return annotated, False
+
+
+def count_accents(text: str, annotated: str) -> int:
+    """
+    Число ударений, расставленных разметкой, — для отчёта анализа.
+    Знаки, которые уже были в исходном тексте, не считаются.
+    """
+    return max(count_accent_marks(annotated) - count_accent_marks(text), 0)
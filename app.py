@@ -6,8 +6,21 @@ Audiobook Maker — Конвертер текста в аудиокниги на
 """
 
 import gradio as gr
+from config import PREVIEW_WARMUP
+from previews import start_preview_warmup
+from telemetry import start_metrics_server
+from storage import prepare_storage
 from ui import create_app, CUSTOM_CSS
+from workers import start_model
 
+# Остатки упавших процессов и квота каталога результатов
+prepare_storage()
+# Модель грузится в фоне, интерфейс доступен сразу. С пулом процессов —
+# только в воркерах: основной процесс копию весов не держит
+start_model()
+if PREVIEW_WARMUP:
+    start_preview_warmup()
+start_metrics_server()
 app = create_app()
 
 if __name__ == "__main__":
@@ -0,0 +1,547 @@
+"""
+Потоковая обработка PCM: запись WAV, изменение скорости и темпа блоками
+"""
+
+import math
+import os
+import struct
+import wave
+from fractions import Fraction
+from pathlib import Path
+
+import numpy as np
+from scipy import signal
+
+from config import SAMPLE_RATE
+
+WAV_HEADER_SIZE = 44
+BLOCK_FRAMES = 1 << 16
+
+
+def to_int16(audio: np.ndarray) -> np.ndarray:
+    return np.clip(np.rint(audio), -32768, 32767).astype(np.int16)
+
+
+class PcmWavWriter:
+    """
+    Запись моно int16 WAV с возможностью дописывания.
+    Заголовок содержит размеры только после close(), поэтому при
+    возобновлении файл обрезается до последнего подтверждённого смещения.
+    """
+
+    def __init__(self, path: Path, offset: int | None = None):
+        self.path = Path(path)
+        if offset is None or not self.path.exists():
+            self._f = open(self.path, "w+b")
+            self._f.write(self._header(0))
+        else:
+            self._f = open(self.path, "r+b")
+            self._f.truncate(offset)
+            self._f.seek(offset)
+
+    @staticmethod
+    def _header(data_size: int) -> bytes:
+        return struct.pack(
+            "<4sI4s4sIHHIIHH4sI",
+            b"RIFF", 36 + data_size, b"WAVE",
+            b"fmt ", 16, 1, 1, SAMPLE_RATE, SAMPLE_RATE * 2, 2, 16,
+            b"data", data_size,
+        )
+
+    def write(self, pcm: bytes):
+        self._f.write(pcm)
+
+    def commit(self) -> int:
+        """Сбрасывает данные на диск и возвращает смещение конца файла."""
+        self._f.flush()
+        os.fsync(self._f.fileno())
+        return self._f.tell()
+
+    @property
+    def frames(self) -> int:
+        return (self._f.tell() - WAV_HEADER_SIZE) // 2
+
+    def close(self):
+        if self._f.closed:
+            return
+        data_size = self._f.tell() - WAV_HEADER_SIZE
+        self._f.seek(0)
+        self._f.write(self._header(data_size))
+        self._f.close()
+
+
+def iter_wav_blocks(path: Path, block_frames: int = BLOCK_FRAMES):
+    """Читает моно int16 WAV блоками фиксированного размера."""
+    with wave.open(str(path), "rb") as wav_file:
+        while True:
+            data = wav_file.readframes(block_frames)
+            if not data:
+                break
+            yield np.frombuffer(data, dtype="<i2")
+
+
+class PolyphaseResampler:
+    """
+    Потоковый полифазный ресемплер up/down с тем же фильтром и
+    компенсацией задержки, что у scipy.signal.resample_poly.
+    Хранит только хвост входа длиной в фильтр, поэтому память постоянна.
+    """
+
+    def __init__(self, up: int, down: int, block_frames: int = BLOCK_FRAMES):
+        g = math.gcd(up, down)
+        self.up, self.down = up // g, down // g
+        self.block_frames = block_frames
+        max_rate = max(self.up, self.down)
+        half_len = 10 * max_rate
+        h = signal.firwin(2 * half_len + 1, 1.0 / max_rate, window=("kaiser", 5.0)) * self.up
+        self._taps = -(-len(h) // self.up)
+        h = np.concatenate([h, np.zeros(self._taps * self.up - len(h))])
+        # _phases[p, t] = h[p + t * up]
+        self._phases = h.reshape(self._taps, self.up).T.astype(np.float32)
+        self._delay = half_len
+        # История до начала сигнала — нули
+        self._buf = np.zeros(self._taps - 1, dtype=np.float32)
+        self._buf_start = -(self._taps - 1)
+        self._filled = 0
+        self._received = 0
+        self._produced = 0
+
+    def _input_index(self, n):
+        return (n * self.down + self._delay) // self.up
+
+    def _drain(self, limit: int | None = None) -> np.ndarray:
+        # Выход n готов, если вход до индекса _input_index(n) уже получен
+        last = self._filled * self.up - 1 - self._delay
+        n_end = last // self.down + 1 if last >= 0 else 0
+        if limit is not None:
+            n_end = min(n_end, limit)
+
+        out = []
+        offsets = np.arange(self._taps)
+        while self._produced < n_end:
+            n1 = min(n_end, self._produced + self.block_frames)
+            m = np.arange(self._produced, n1, dtype=np.int64) * self.down + self._delay
+            idx = (m // self.up - self._buf_start)[:, None] - offsets
+            out.append(np.einsum("nt,nt->n", self._phases[m % self.up], self._buf[idx]))
+            self._produced = n1
+
+        keep_from = self._input_index(self._produced) - (self._taps - 1)
+        drop = keep_from - self._buf_start
+        if drop > 0:
+            self._buf = self._buf[drop:]
+            self._buf_start = keep_from
+        return to_int16(np.concatenate(out)) if out else np.zeros(0, dtype=np.int16)
+
+    def process(self, block: np.ndarray) -> np.ndarray:
+        self._buf = np.concatenate([self._buf, block.astype(np.float32)])
+        self._filled += len(block)
+        self._received += len(block)
+        return self._drain()
+
+    def flush(self) -> np.ndarray:
+        """Дополняет вход нулями и выдаёт остаток до ceil(N * up / down)."""
+        total = -(-self._received * self.up // self.down)
+        if total == 0:
+            return np.zeros(0, dtype=np.int16)
+        needed = -(-((total - 1) * self.down + self._delay + 1) // self.up)
+        if needed > self._filled:
+            pad = needed - self._filled
+            self._buf = np.concatenate([self._buf, np.zeros(pad, dtype=np.float32)])
+            self._filled += pad
+        return self._drain(limit=total)
+
+
+class WsolaTimeStretch:
+    """
+    Потоковое изменение темпа без сдвига высоты тона (WSOLA).
+    Кадры с окном Ханна накладываются с шагом 50 %; каждый следующий
+    кадр сдвигается в пределах tolerance так, чтобы лучше всего
+    продолжать предыдущий по взаимной корреляции.
+    """
+
+    def __init__(
+        self,
+        speed: float,
+        sample_rate: int = SAMPLE_RATE,
+        frame_ms: float = 40.0,
+        tolerance_ms: float = 10.0,
+    ):
+        self.speed = speed
+        self._n = int(sample_rate * frame_ms / 1000) // 2 * 2
+        self._hs = self._n // 2
+        self._ha = self._hs * speed
+        self._tol = int(sample_rate * tolerance_ms / 1000)
+        self._win = signal.get_window("hann", self._n).astype(np.float32)
+        self._acc = np.zeros(self._n, dtype=np.float32)
+        # Вход предваряется _hs нулями, чтобы первый кадр не давал нарастания
+        self._buf = np.zeros(self._hs, dtype=np.float32)
+        self._buf_start = 0
+        self._filled = self._hs
+        self._received = 0
+        self._k = 0
+        self._prev_pos = 0
+        self._skip = self._hs
+        self._produced = 0
+
+    def _nominal(self, k: int) -> int:
+        return int(round(k * self._ha))
+
+    def _frame_ready(self) -> bool:
+        a = self._nominal(self._k)
+        need = a + self._tol + self._n
+        if self._k:
+            need = max(need, self._prev_pos + self._hs + self._n)
+        return need <= self._filled
+
+    def _frame(self) -> np.ndarray:
+        a = self._nominal(self._k)
+        if self._k == 0:
+            pos = 0
+        else:
+            b = self._buf_start
+            natural = self._prev_pos + self._hs
+            template = self._buf[natural - b:natural - b + self._n]
+            lo = max(a - self._tol, 0)
+            region = self._buf[lo - b:a + self._tol + self._n - b]
+            corr = signal.correlate(region, template, mode="valid", method="fft")
+            pos = lo + int(np.argmax(corr)) if corr.max() > 0 else a
+
+        b = self._buf_start
+        self._acc += self._buf[pos - b:pos - b + self._n] * self._win
+        out = self._acc[:self._hs].copy()
+        self._acc = np.concatenate([self._acc[self._hs:], np.zeros(self._hs, dtype=np.float32)])
+        self._prev_pos = pos
+        self._k += 1
+
+        keep_from = min(self._prev_pos + self._hs, max(self._nominal(self._k) - self._tol, 0))
+        if keep_from > self._buf_start:
+            self._buf = self._buf[keep_from - self._buf_start:]
+            self._buf_start = keep_from
+        return out
+
+    def _drain(self) -> np.ndarray:
+        out = []
+        while self._frame_ready():
+            out.append(self._frame())
+        if not out:
+            return np.zeros(0, dtype=np.int16)
+        y = np.concatenate(out)
+        if self._skip:
+            cut = min(self._skip, len(y))
+            y = y[cut:]
+            self._skip -= cut
+        self._produced += len(y)
+        return to_int16(y)
+
+    def process(self, block: np.ndarray) -> np.ndarray:
+        self._buf = np.concatenate([self._buf, block.astype(np.float32)])
+        self._filled += len(block)
+        self._received += len(block)
+        return self._drain()
+
+    def flush(self) -> np.ndarray:
+        """Дополняет вход нулями и выдаёт остаток до round(N / speed)."""
+        total = int(round(self._received / self.speed))
+        out = []
+        pad = np.zeros(self._n + self._tol + self._hs, dtype=np.float32)
+        while self._produced < total:
+            self._buf = np.concatenate([self._buf, pad])
+            self._filled += len(pad)
+            out.append(self._drain())
+        y = np.concatenate(out) if out else np.zeros(0, dtype=np.int16)
+        extra = self._produced - total
+        return y[:len(y) - extra] if extra > 0 else y
+
+
+def make_speed_processor(speed: float, preserve_pitch: bool = True):
+    """
+    Возвращает потоковый обработчик скорости (process/flush) или None,
+    если скорость не меняется. Без сохранения высоты тона — эквивалент
+    прежнего «ускорения плёнки» через ресемплинг.
+    """
+    if abs(speed - 1.0) < 1e-6:
+        return None
+    if preserve_pitch:
+        return WsolaTimeStretch(speed)
+    ratio = Fraction(1 / speed).limit_denominator(100)
+    return PolyphaseResampler(ratio.numerator, ratio.denominator)
+
+
+# Громкость по ITU-R BS.1770 / EBU R128: блоки 400 мс с шагом 100 мс,
+# абсолютный порог −70 LUFS, относительный — на 10 LU ниже среднего
+_LOUDNESS_STEP_SEC = 0.1
+_LOUDNESS_WINDOW_STEPS = 4
+_ABSOLUTE_GATE_LUFS = -70.0
+_RELATIVE_GATE_LU = 10.0
+# Гистограмма блоков с шагом 0.1 LU: интегральная громкость без хранения блоков
+_HIST_MIN_LUFS, _HIST_MAX_LUFS, _HIST_STEP_LU = -70.0, 10.0, 0.1
+# Отклонение фрагмента от средней громкости, которое выравнивается;
+# бóльшая разница — интонация, её не трогаем
+_MAX_CHUNK_CORRECTION_LU = 4.0
+# Пиковый уровень после усиления, dBFS
+_PEAK_CEILING_DBFS = -1.0
+# Порог тишины по RMS кадров 10 мс, dBFS
+_SILENCE_THRESHOLD_DBFS = -50.0
+_SILENCE_FRAME_SEC = 0.01
+
+
+def _k_weighting_sos(sample_rate: int) -> np.ndarray:
+    """K-фильтр BS.1770 (полка +4 дБ на ВЧ и ФВЧ ~38 Гц) для любой частоты."""
+    k = math.tan(math.pi * 1681.974450955533 / sample_rate)
+    q = 0.7071752369554196
+    vh = 10 ** (3.999843853973347 / 20)
+    vb = vh ** 0.4996667741545416
+    a0 = 1 + k / q + k * k
+    shelf = [
+        (vh + vb * k / q + k * k) / a0, 2 * (k * k - vh) / a0, (vh - vb * k / q + k * k) / a0,
+        1.0, 2 * (k * k - 1) / a0, (1 - k / q + k * k) / a0,
+    ]
+    k = math.tan(math.pi * 38.13547087602444 / sample_rate)
+    q = 0.5003270373238773
+    a0 = 1 + k / q + k * k
+    highpass = [1.0, -2.0, 1.0, 1.0, 2 * (k * k - 1) / a0, (1 - k / q + k * k) / a0]
+    return np.array([shelf, highpass])
+
+
+def _lufs(power):
+    return -0.691 + 10 * np.log10(np.maximum(power, 1e-20))
+
+
+class LoudnessMeter:
+    """
+    Потоковый измеритель громкости EBU R128. Сигнал проходит K-фильтр с
+    сохранением состояния между вызовами, мощность считается по шагам
+    100 мс, блоки 400 мс складываются в гистограмму — память постоянна
+    при любой длине книги. add() возвращает мощности новых блоков.
+    """
+
+    def __init__(self, sample_rate: int = SAMPLE_RATE, block_frames: int = BLOCK_FRAMES):
+        self._sos = _k_weighting_sos(sample_rate)
+        self._zi = np.zeros((len(self._sos), 2))
+        self._step = int(sample_rate * _LOUDNESS_STEP_SEC)
+        self._block_frames = block_frames // self._step * self._step or self._step
+        self._partial = np.zeros(0)
+        self._recent = np.zeros(0)
+        bins = int(round((_HIST_MAX_LUFS - _HIST_MIN_LUFS) / _HIST_STEP_LU))
+        self._counts = np.zeros(bins, dtype=np.int64)
+        self._powers = np.zeros(bins)
+
+    def add(self, audio: np.ndarray) -> np.ndarray:
+        # Мощность нормирована на полную шкалу int16
+        steps = []
+        for offset in range(0, len(audio), self._block_frames):
+            block = audio[offset:offset + self._block_frames].astype(np.float64) / 32768.0
+            weighted, self._zi = signal.sosfilt(self._sos, block, zi=self._zi)
+            weighted = np.concatenate([self._partial, weighted])
+            whole = len(weighted) // self._step * self._step
+            self._partial = weighted[whole:]
+            if whole:
+                steps.append(np.mean(weighted[:whole].reshape(-1, self._step) ** 2, axis=1))
+        if not steps:
+            return np.zeros(0)
+
+        powers = np.concatenate([self._recent, *steps])
+        n = _LOUDNESS_WINDOW_STEPS
+        self._recent = powers[-(n - 1):]
+        if len(powers) < n:
+            return np.zeros(0)
+        cumulative = np.concatenate([[0.0], np.cumsum(powers)])
+        windows = (cumulative[n:] - cumulative[:-n]) / n
+
+        loudness = _lufs(windows)
+        gated = loudness > _ABSOLUTE_GATE_LUFS
+        bins = np.clip(
+            ((loudness[gated] - _HIST_MIN_LUFS) / _HIST_STEP_LU).astype(np.int64),
+            0, len(self._counts) - 1,
+        )
+        np.add.at(self._counts, bins, 1)
+        np.add.at(self._powers, bins, windows[gated])
+        return windows
+
+    @property
+    def integrated(self) -> float | None:
+        """Интегральная громкость, LUFS; None, пока нет блоков громче −70 LUFS."""
+        total = self._counts.sum()
+        if not total:
+            return None
+        gate = float(_lufs(self._powers.sum() / total)) - _RELATIVE_GATE_LU
+        first = int(np.clip((gate - _HIST_MIN_LUFS) / _HIST_STEP_LU, 0, len(self._counts)))
+        count = self._counts[first:].sum()
+        return float(_lufs(self._powers[first:].sum() / count)) if count else None
+
+
+def trim_edge_silence(
+    audio: np.ndarray,
+    keep_frames: int,
+    sample_rate: int = SAMPLE_RATE,
+    threshold_dbfs: float = _SILENCE_THRESHOLD_DBFS,
+    block_frames: int = BLOCK_FRAMES,
+) -> np.ndarray:
+    """
+    Укорачивает тишину в начале и конце фрагмента до keep_frames.
+    Края просматриваются блоками до первого кадра громче порога,
+    поэтому середина фрагмента не читается. Не удлиняет и не трогает
+    полностью тихий фрагмент. Возвращает срез без копирования.
+    """
+    frame = max(1, int(sample_rate * _SILENCE_FRAME_SEC))
+    threshold = (10 ** (threshold_dbfs / 20) * 32768.0) ** 2
+    block_frames = max(block_frames // frame, 1) * frame
+
+    def loud_frames(segment: np.ndarray) -> np.ndarray:
+        whole = len(segment) // frame * frame
+        power = np.mean(segment[:whole].astype(np.float32).reshape(-1, frame) ** 2, axis=1)
+        return np.flatnonzero(power > threshold)
+
+    start = None
+    for offset in range(0, len(audio), block_frames):
+        loud = loud_frames(audio[offset:offset + block_frames])
+        if len(loud):
+            start = offset + loud[0] * frame
+            break
+    if start is None:
+        return audio
+
+    end = start
+    for stop in range(len(audio), start, -block_frames):
+        offset = max(stop - block_frames, start)
+        segment = audio[offset:stop]
+        # Кадры выравниваются от конца блока, чтобы хвост не выпадал
+        loud = loud_frames(segment[len(segment) % frame:])
+        if len(loud):
+            end = offset + len(segment) % frame + (loud[-1] + 1) * frame
+            break
+    return audio[max(start - keep_frames, 0):min(end + keep_frames, len(audio))]
+
+
+class ChunkPostProcessor:
+    """
+    Постобработка фрагментов между apply_tts и записью: подрезка тишины
+    по краям до edge_silence_ms и выравнивание громкости к target_lufs.
+    Один проход: интегральная громкость копится LoudnessMeter по мере
+    синтеза, усиление фрагмента = отклонение средней от цели плюс
+    ограниченная (±4 LU) поправка на громкость самого фрагмента и
+    не выше пикового уровня −1 dBFS. Фрагмент уже в памяти после
+    apply_tts, дополнительно держатся только блоки BLOCK_FRAMES.
+    После возобновления задания средняя копится заново.
+    """
+
+    def __init__(
+        self,
+        target_lufs: float,
+        edge_silence_ms: int,
+        sample_rate: int = SAMPLE_RATE,
+        block_frames: int = BLOCK_FRAMES,
+    ):
+        self.target_lufs = target_lufs
+        self._keep = int(sample_rate * edge_silence_ms / 1000)
+        self._sample_rate = sample_rate
+        self._block_frames = block_frames
+        self._input = LoudnessMeter(sample_rate, block_frames)
+        self._output = LoudnessMeter(sample_rate, block_frames)
+        self._ceiling = 10 ** (_PEAK_CEILING_DBFS / 20) * 32767
+        self._gain_db = 0.0
+        self.trimmed_frames = 0
+
+    def process(self, audio_int16: np.ndarray) -> np.ndarray:
+        trimmed = trim_edge_silence(audio_int16, self._keep, self._sample_rate, block_frames=self._block_frames)
+        self.trimmed_frames += len(audio_int16) - len(trimmed)
+        if not len(trimmed):
+            return trimmed
+
+        windows = self._input.add(trimmed)
+        integrated = self._input.integrated
+        if integrated is not None:
+            self._gain_db = self.target_lufs - integrated
+            loudness = _lufs(windows)
+            voiced = windows[loudness > max(_ABSOLUTE_GATE_LUFS, integrated - _RELATIVE_GATE_LU)]
+            if len(voiced):
+                deviation = integrated - float(_lufs(voiced.mean()))
+                self._gain_db += float(np.clip(deviation, -_MAX_CHUNK_CORRECTION_LU, _MAX_CHUNK_CORRECTION_LU))
+
+        peak = 0
+        for offset in range(0, len(trimmed), self._block_frames):
+            block = trimmed[offset:offset + self._block_frames]
+            peak = max(peak, int(np.abs(block.astype(np.int32)).max()))
+        gain = 10 ** (self._gain_db / 20)
+        if peak:
+            gain = min(gain, self._ceiling / peak)
+
+        out = np.empty_like(trimmed)
+        for offset in range(0, len(trimmed), self._block_frames):
+            block = trimmed[offset:offset + self._block_frames]
+            out[offset:offset + len(block)] = to_int16(block.astype(np.float32) * gain)
+        self._output.add(out)
+        return out
+
+    @property
+    def output_lufs(self) -> float | None:
+        """Интегральная громкость записанного результата, LUFS."""
+        return self._output.integrated
+
+
+def make_post_processor(enabled: bool, target_lufs: float, edge_silence_ms: int):
+    """Возвращает ChunkPostProcessor или None, если постобработка выключена."""
+    if not enabled:
+        return None
+    return ChunkPostProcessor(target_lufs, edge_silence_ms)
+
+
+# Сравнение звучания двух синтезов (бенчмарк режимов инференса)
+_MEL_BANDS = 40
+_MEL_FMIN, _MEL_FMAX = 50.0, 12000.0
+_SPECTRUM_FRAME = 2048
+_SPECTRUM_HOP = 512
+# Динамический диапазон спектра: тишина не должна доминировать
+_SPECTRUM_RANGE_DB = 60.0
+
+
+def _mel_filterbank(sample_rate: int, n_fft: int, bands: int) -> np.ndarray:
+    def to_mel(f):
+        return 2595 * np.log10(1 + f / 700)
+
+    points = 700 * (10 ** (np.linspace(to_mel(_MEL_FMIN), to_mel(_MEL_FMAX), bands + 2) / 2595) - 1)
+    freqs = np.fft.rfftfreq(n_fft, 1 / sample_rate)
+    bank = np.zeros((bands, len(freqs)))
+    for b in range(bands):
+        low, center, high = points[b:b + 3]
+        bank[b] = np.clip(np.minimum((freqs - low) / (center - low), (high - freqs) / (high - center)), 0, None)
+    return bank
+
+
+def log_mel_spectrogram(audio_int16: np.ndarray, sample_rate: int = SAMPLE_RATE) -> np.ndarray:
+    """Лог-мел-спектр (кадры × полосы, дБ) с ограниченным снизу диапазоном."""
+    audio = audio_int16.astype(np.float64) / 32768
+    if len(audio) < _SPECTRUM_FRAME:
+        audio = np.pad(audio, (0, _SPECTRUM_FRAME - len(audio)))
+    frames = np.lib.stride_tricks.sliding_window_view(audio, _SPECTRUM_FRAME)[::_SPECTRUM_HOP]
+    power = np.abs(np.fft.rfft(frames * np.hanning(_SPECTRUM_FRAME), axis=1)) ** 2
+    mel = power @ _mel_filterbank(sample_rate, _SPECTRUM_FRAME, _MEL_BANDS).T
+    db = 10 * np.log10(np.maximum(mel, 1e-12))
+    return np.maximum(db, db.max() - _SPECTRUM_RANGE_DB)
+
+
+def spectral_distance(reference: np.ndarray, test: np.ndarray, sample_rate: int = SAMPLE_RATE) -> float:
+    """
+    Лог-спектральное расстояние двух синтезов одного текста: RMS разницы
+    лог-мел-спектров по полосам (дБ), в среднем по кадрам. Кадры
+    выравниваются DTW — иначе небольшой сдвиг длительностей звуков
+    считался бы искажением тембра. 0 — спектры совпадают.
+    """
+    a = log_mel_spectrogram(reference, sample_rate)
+    b = log_mel_spectrogram(test, sample_rate)
+    # Попарные расстояния кадров без тензора кадры × кадры × полосы
+    squared = (a ** 2).sum(1)[:, None] + (b ** 2).sum(1)[None, :] - 2 * a @ b.T
+    cost = np.sqrt(np.maximum(squared, 0) / a.shape[1])
+
+    # Симметричный DTW (диагональный шаг с весом 2), нормировка на n + m.
+    # Шаг по строке — накопленный минимум: D[j] = S[j] + min_{k≤j}(E[k] − S[k])
+    total = np.empty(len(b))
+    total[0] = 2 * cost[0, 0]
+    total[1:] = total[0] + np.cumsum(cost[0, 1:])
+    for i in range(1, len(a)):
+        row = cost[i]
+        entry = total + row
+        entry[1:] = np.minimum(entry[1:], total[:-1] + 2 * row[1:])
+        prefix = np.cumsum(row)
+        total = prefix + np.minimum.accumulate(entry - prefix)
+    return float(total[-1] / (len(a) + len(b)))
@@ -0,0 +1,425 @@
+"""
+Бенчмарк конвейера: время каждой стадии, пропускная способность, пиковая память
+
+По умолчанию работает без сети и без модели: вместо Silero подставляется
+детерминированная заглушка, длина аудио которой зависит от текста.
+С --real загружается настоящая модель и меряется RTF каждого голоса,
+с --real --modes — RTF режимов инференса (fp32, inference_mode, int8) и
+спектральное расстояние их звука до fp32.
+
+Примеры:
+    python benchmark.py
+    python benchmark.py --save-baseline
+    python benchmark.py --size-mb 20 --json result.json
+    python benchmark.py --real --repeat 5
+    TTS_ONEDNN=1 python benchmark.py --real --modes --json modes.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import zipfile
+from pathlib import Path
+from xml.sax.saxutils import escape
+
+# Условная скорость речи заглушки: секунд аудио на символ текста
+STUB_SECONDS_PER_CHAR = 0.06
+
+_WORDS = (
+    "он она они мы дом лес город дорога время день ночь утро вечер окно "
+    "дверь рука голова слово мысль жизнь человек письмо книга история "
+    "тихо быстро долго вдруг снова потом сегодня вчера далеко рядом "
+    "сказал ответил подумал посмотрел увидел пошёл вернулся открыл "
+    "старый новый тёмный светлый холодный тёплый большой маленький"
+).split()
+_REPLIES = ("Да.", "Нет.", "Почему?", "Не знаю.", "Конечно!", "Что?", "Хорошо.")
+
+REAL_TEXT = (
+    "В тот вечер над городом шёл тихий снег. Он вернулся домой поздно, "
+    "открыл окно и долго смотрел на пустую улицу. Где-то далеко играла "
+    "музыка, и ему вдруг показалось, что всё ещё можно изменить."
+)
+
+
+def log(message: str):
+    print(message, file=sys.stderr, flush=True)
+
+
+class _StubAudio:
+    def __init__(self, audio):
+        self._audio = audio
+
+    def numpy(self):
+        return self._audio
+
+
+class StubTTSModel:
+    """
+    Детерминированная замена модели: тон фиксированной формы, длина
+    пропорциональна числу символов текста (разметка SSML не считается).
+    """
+
+    def __init__(self, sample_rate: int):
+        import numpy as np
+
+        self._np = np
+        t = np.arange(sample_rate, dtype=np.float32) / sample_rate
+        self._tone = (0.3 * np.sin(2 * np.pi * 220 * t)).astype(np.float32)
+        self._sample_rate = sample_rate
+
+    def apply_tts(self, text=None, ssml_text=None, speaker="xenia", sample_rate=48000, **kwargs):
+        import re
+
+        plain = re.sub(r"<[^>]+>", "", ssml_text) if ssml_text else text
+        frames = int(len(plain) * STUB_SECONDS_PER_CHAR * sample_rate)
+        return _StubAudio(self._np.resize(self._tone, frames))
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss в Linux — КБ, в macOS — байты
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def make_book_text(size_bytes: int, seed: int = 42) -> str:
+    """Детерминированный «роман»: главы, повествование и короткие реплики."""
+    rng = random.Random(seed)
+    paragraphs = []
+    size = 0
+    chapter = 0
+    while size < size_bytes:
+        if len(paragraphs) % 300 == 0:
+            chapter += 1
+            paragraphs.append(f"Глава {chapter}")
+        if rng.random() < 0.4:
+            para = f"— {rng.choice(_REPLIES)}"
+        else:
+            sentences = []
+            for _ in range(rng.randint(2, 6)):
+                words = [rng.choice(_WORDS) for _ in range(rng.randint(4, 16))]
+                sentences.append(" ".join(words).capitalize() + rng.choice(".!?."))
+            para = " ".join(sentences)
+        paragraphs.append(para)
+        size += len(para.encode("utf-8")) + 1
+    return "\n".join(paragraphs)
+
+
+def write_docx(text: str, path: Path):
+    """Минимальный DOCX: «Глава N» — стиль Heading1, остальное — обычные абзацы."""
+    ns = "http://schemas.openxmlformats.org/wordprocessingml/2006/main"
+    body = []
+    for line in text.split("\n"):
+        style = '<w:pPr><w:pStyle w:val="Heading1"/></w:pPr>' if line.startswith("Глава ") else ""
+        body.append(f'<w:p>{style}<w:r><w:t xml:space="preserve">{escape(line)}</w:t></w:r></w:p>')
+    document = (
+        f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        f'<w:document xmlns:w="{ns}"><w:body>{"".join(body)}</w:body></w:document>'
+    )
+    content_types = (
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Override PartName="/word/document.xml" ContentType="application/'
+        'vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/></Types>'
+    )
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr("[Content_Types].xml", content_types)
+        zf.writestr("word/document.xml", document)
+
+
+def measure(name: str, results: dict, fn, amount: float, unit: str):
+    """Выполняет стадию, пишет время, пропускную способность и пик RSS."""
+    started = time.perf_counter()
+    value = fn()
+    seconds = time.perf_counter() - started
+    results[name] = {
+        "seconds": round(seconds, 4),
+        "throughput": round(amount / seconds, 2) if seconds > 0 else None,
+        "unit": unit,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+    log(f"  {name:<16} {seconds:8.3f} сек  {results[name]['throughput']:>12} {unit}")
+    return value
+
+
+def run_stub(size_mb: float, synth_chars: int, workdir: Path) -> dict:
+    import tts_model
+    from config import FORMATS, SAMPLE_RATE
+    from converters import convert_to_text
+    from text_processing import pack_sentences, preprocess_text, split_into_sentences, split_long_sentence
+    from pipeline import render_text
+    from audio_processing import ChunkPostProcessor, iter_wav_blocks, make_speed_processor
+    from encoder import open_encoder
+    from pydub.utils import get_encoder_name
+
+    tts_model.use_model(StubTTSModel(SAMPLE_RATE))
+    stages = {}
+
+    log(f"Подготовка текста ~{size_mb} MB...")
+    book = make_book_text(int(size_mb * 1024 * 1024))
+    txt_path = workdir / "book.txt"
+    txt_path.write_text(book, encoding="utf-8")
+    docx_path = workdir / "book.docx"
+    write_docx(book, docx_path)
+    chars = len(book)
+
+    log("Стадии:")
+    text, _ = measure("convert_txt", stages, lambda: convert_to_text(str(txt_path)), chars, "chars/s")
+    measure("convert_docx", stages, lambda: convert_to_text(str(docx_path)), chars, "chars/s")
+    clean = measure("preprocess", stages, lambda: preprocess_text(text), chars, "chars/s")
+
+    def segment():
+        sentences = []
+        for s in split_into_sentences(clean):
+            sentences.extend(split_long_sentence(s))
+        return pack_sentences(sentences, pause=0.5)
+
+    chunks = measure("segmentation", stages, segment, len(clean), "chars/s")
+    stages["segmentation"]["chunks"] = len(chunks)
+
+    # Синтез с записью PCM — на фрагменте книги, иначе WAV займёт гигабайты
+    sample = book[:synth_chars]
+    wav_path = workdir / "book.wav"
+    stats = measure(
+        "synthesis_write", stages,
+        lambda: render_text(
+            sample, "xenia", 0.3, 1.0, True, FORMATS["WAV (без сжатия)"],
+            wav_path, {}, {}, [],
+        ),
+        len(sample), "chars/s",
+    )
+    stages["synthesis_write"]["chunks"] = stats["chunks"]
+    audio_seconds = stats["duration"]
+
+    def change_speed(preserve_pitch: bool):
+        processor = make_speed_processor(1.25, preserve_pitch)
+        for block in iter_wav_blocks(wav_path):
+            processor.process(block)
+        processor.flush()
+
+    measure("speed_wsola", stages, lambda: change_speed(True), audio_seconds, "audio-s/s")
+    measure("speed_resample", stages, lambda: change_speed(False), audio_seconds, "audio-s/s")
+
+    def post_process():
+        processor = ChunkPostProcessor(-18.0, 100)
+        for block in iter_wav_blocks(wav_path):
+            processor.process(block)
+
+    measure("postprocess", stages, post_process, audio_seconds, "audio-s/s")
+
+    if shutil.which(get_encoder_name()):
+        def export():
+            encoder = open_encoder(workdir / "book.mp3", FORMATS["MP3 (192 kbps)"])
+            for block in iter_wav_blocks(wav_path):
+                encoder.write(block)
+            encoder.close()
+
+        measure("export_mp3", stages, export, audio_seconds, "audio-s/s")
+    else:
+        log("  export_mp3       пропущено: ffmpeg не найден")
+
+    return stages
+
+
+def run_real(speakers: list[str], repeat: int) -> dict:
+    from config import SAMPLE_RATE
+    from tts_model import get_model
+    from workers import render_chunk
+
+    log("Загрузка модели...")
+    get_model()
+    stages = {}
+    log(f"RTF по голосам ({repeat} повт., медиана; меньше 1 — быстрее реального времени):")
+    for speaker in speakers:
+        times = []
+        frames = 0
+        for _ in range(repeat):
+            started = time.perf_counter()
+            frames = len(render_chunk(REAL_TEXT, speaker))
+            times.append(time.perf_counter() - started)
+        seconds = statistics.median(times)
+        audio_seconds = frames / SAMPLE_RATE
+        stages[f"rtf_{speaker}"] = {
+            "seconds": round(seconds, 4),
+            "throughput": round(audio_seconds / seconds, 2),
+            "unit": "audio-s/s",
+            "rtf": round(seconds / audio_seconds, 4),
+            "peak_rss_mb": peak_rss_mb(),
+        }
+        log(f"  {speaker:<10} RTF {seconds / audio_seconds:.3f}  ({audio_seconds:.1f} сек аудио за {seconds:.2f} сек)")
+    return stages
+
+
+def run_modes(speakers: list[str], repeat: int) -> dict:
+    """
+    Режимы инференса настоящей модели по голосам: RTF и спектральное
+    расстояние звука до fp32 (лог-мел, дБ). Для fp32 расстояние между
+    первым и последним повтором — порог шума: режим с расстоянием около
+    него звучит как исходная модель. oneDNN и потоки берутся из
+    настроек (TTS_ONEDNN, TTS_THREADS, TTS_INTEROP_THREADS) для всех режимов.
+    """
+    import numpy as np
+
+    from audio_processing import spectral_distance
+    from config import SAMPLE_RATE, TTS_THREADS
+    from tts_model import configure_torch, quantize_model, read_model, run_tts
+    from workers import APPLY_TTS_FLAGS
+
+    configure_torch(TTS_THREADS)
+    log("Загрузка модели: fp32 и копия для int8...")
+    fp32 = read_model()
+    int8 = read_model()
+    layers = quantize_model(int8)
+    if not layers:
+        log("[WARN]int8: нет слоёв Linear/LSTM вне TorchScript — режим совпадает с inference_mode")
+    variants = (("fp32", fp32, False), ("inference_mode", fp32, True), ("int8", int8, True))
+
+    def render(model, inference_mode: bool, speaker: str) -> np.ndarray:
+        audio = run_tts(
+            model, inference_mode,
+            text=REAL_TEXT, speaker=speaker, sample_rate=SAMPLE_RATE, **APPLY_TTS_FLAGS,
+        )
+        return (audio.numpy() * 32767).astype(np.int16)
+
+    stages = {}
+    log(f"Режимы инференса ({repeat} повт., медиана; расстояние до fp32 в дБ, int8: слоёв {layers}):")
+    for speaker in speakers:
+        reference = None
+        for mode, model, inference_mode in variants:
+            render(model, inference_mode, speaker)  # прогрев режима
+            times, outputs = [], []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                outputs.append(render(model, inference_mode, speaker))
+                times.append(time.perf_counter() - started)
+            audio = outputs[-1]
+            if reference is None:
+                reference = outputs[0]
+            seconds = statistics.median(times)
+            audio_seconds = len(audio) / SAMPLE_RATE
+            distance = spectral_distance(reference, audio)
+            stages[f"rtf_{speaker}_{mode}"] = {
+                "seconds": round(seconds, 4),
+                "throughput": round(audio_seconds / seconds, 2),
+                "unit": "audio-s/s",
+                "rtf": round(seconds / audio_seconds, 4),
+                "spectral_distance_db": round(distance, 3),
+                "duration_ratio": round(len(audio) / len(reference), 4),
+                "peak_rss_mb": peak_rss_mb(),
+            }
+            log(f"  {speaker:<10} {mode:<15} RTF {seconds / audio_seconds:.3f}  "
+                f"расстояние {distance:.2f} дБ  длительность ×{len(audio) / len(reference):.3f}")
+    return stages
+
+
+def compare(stages: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Стадии, чья пропускная способность упала больше чем на tolerance."""
+    regressions = []
+    log(f"Сравнение с базой (допуск {tolerance:.0%}):")
+    for name, current in stages.items():
+        base = baseline.get(name)
+        if not base or not base.get("throughput") or not current.get("throughput"):
+            continue
+        ratio = current["throughput"] / base["throughput"]
+        mark = "OK"
+        if ratio < 1 - tolerance:
+            mark = "РЕГРЕССИЯ"
+            regressions.append(name)
+        log(f"  {name:<16} {ratio:6.2f}x  {mark}")
+    return regressions
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Audiobook Maker: бенчмарк конвейера синтеза")
+    parser.add_argument("--real", action="store_true", help="настоящая модель: RTF по голосам")
+    parser.add_argument("--size-mb", type=float, default=5.0, help="размер текстовых фикстур")
+    parser.add_argument("--synth-chars", type=int, default=20000,
+                        help="символов текста для стадий синтеза и аудио")
+    parser.add_argument("--modes", action="store_true",
+                        help="с --real: режимы инференса (fp32, inference_mode, int8) — "
+                             "RTF и спектральное расстояние до fp32")
+    parser.add_argument("--speakers", nargs="+", help="голоса для --real (по умолчанию все)")
+    parser.add_argument("--repeat", type=int, default=3, help="повторов на голос для --real")
+    parser.add_argument("--baseline", default="benchmark_baseline.json", help="файл базы")
+    parser.add_argument("--save-baseline", action="store_true", help="сохранить результат как базу")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="допустимое падение, доля")
+    parser.add_argument("--json", help="записать результат в файл ('-' — в stdout)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    mode = ("modes" if args.modes else "real") if args.real else "stub"
+
+    # Заглушка живёт в этом процессе, а кеш исказил бы замеры синтеза
+    if not args.real:
+        os.environ["TTS_WORKERS"] = "1"
+    os.environ["CHUNK_CACHE_MAX_MB"] = "0"
+    os.environ["STREAM_EXPORT"] = "0"
+
+    from config import (
+        SPEAKERS, TTS_INFERENCE_MODE, TTS_INTEROP_THREADS, TTS_ONEDNN, TTS_QUANTIZE, TTS_THREADS,
+    )
+
+    with tempfile.TemporaryDirectory(prefix="bench_") as workdir:
+        if args.real and args.modes:
+            stages = run_modes(args.speakers or list(SPEAKERS.values()), args.repeat)
+        elif args.real:
+            stages = run_real(args.speakers or list(SPEAKERS.values()), args.repeat)
+        else:
+            stages = run_stub(args.size_mb, args.synth_chars, Path(workdir))
+
+    result = {
+        "mode": mode,
+        "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "machine": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+        },
+        "params": {
+            "size_mb": args.size_mb,
+            "synth_chars": args.synth_chars,
+            # Настройки инференса для --real (в --modes режимы перебираются)
+            "inference": {
+                "threads": TTS_THREADS, "interop_threads": TTS_INTEROP_THREADS,
+                "inference_mode": TTS_INFERENCE_MODE, "quantize": TTS_QUANTIZE, "onednn": TTS_ONEDNN,
+            },
+        },
+        "peak_rss_mb": peak_rss_mb(),
+        "stages": stages,
+    }
+    log(f"Пиковая память процесса: {result['peak_rss_mb']} MB")
+
+    exit_code = 0
+    baseline_path = Path(args.baseline)
+    if args.save_baseline:
+        baselines = json.loads(baseline_path.read_text(encoding="utf-8")) if baseline_path.exists() else {}
+        baselines[mode] = result
+        baseline_path.write_text(json.dumps(baselines, ensure_ascii=False, indent=2), encoding="utf-8")
+        log(f"База сохранена: {baseline_path}")
+    elif baseline_path.exists():
+        baseline = json.loads(baseline_path.read_text(encoding="utf-8")).get(mode)
+        if baseline:
+            regressions = compare(stages, baseline["stages"], args.tolerance)
+            result["regressions"] = regressions
+            exit_code = 1 if regressions else 0
+
+    if args.json:
+        payload = json.dumps(result, ensure_ascii=False, indent=2)
+        if args.json == "-":
+            print(payload)
+        else:
+            Path(args.json).write_text(payload, encoding="utf-8")
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
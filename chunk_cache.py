@@ -0,0 +1,281 @@
+"""
+Дисковый кеш синтезированных фрагментов (PCM int16) с вытеснением LRU
+"""
+
+import hashlib
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import unicodedata
+from collections import OrderedDict
+from concurrent.futures import Future
+from pathlib import Path
+
+import numpy as np
+
+from config import (
+    CACHE_DIR, CHUNK_CACHE_MAX_MB, DEDUP_MEMO_MB, DEDUP_SPILL_MB, MODEL_PATH, SAMPLE_RATE,
+    TTS_QUANTIZE,
+)
+
+
+def model_fingerprint(model_path: Path = MODEL_PATH) -> str:
+    """
+    Идентификатор модели: имя, размер и время изменения файла, а также
+    квантизация — int8 звучит иначе, чем fp32.
+    """
+    try:
+        st = model_path.stat()
+        fingerprint = f"{model_path.name}:{st.st_size}:{st.st_mtime_ns}"
+    except OSError:
+        fingerprint = model_path.name
+    return fingerprint if TTS_QUANTIZE == "none" else f"{fingerprint}:{TTS_QUANTIZE}"
+
+
+class ChunkCache:
+    """
+    Контентно-адресуемый кеш: ключ — хеш текста фрагмента и всех
+    параметров, влияющих на звук. Файлы — сырой PCM int16, моно.
+    Порядок LRU хранится в памяти и восстанавливается по mtime файлов.
+    """
+
+    def __init__(self, root: Path, max_bytes: int):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._index: OrderedDict[str, int] = OrderedDict()
+        self._total = 0
+        self._model_id = model_fingerprint()
+        self._load_index()
+
+    def _load_index(self):
+        self.root.mkdir(parents=True, exist_ok=True)
+        entries = []
+        for path in self.root.glob("*/*.pcm"):
+            try:
+                st = path.stat()
+            except OSError:
+                continue
+            entries.append((st.st_mtime, path.stem, st.st_size))
+        for _, key, size in sorted(entries):
+            self._index[key] = size
+            self._total += size
+
+    def _path(self, key: str) -> Path:
+        return self.root / key[:2] / f"{key}.pcm"
+
+    def key(self, text: str, speaker: str, flags: dict) -> str:
+        """Ключ фрагмента: текст, голос, частота, модель и флаги ударений."""
+        payload = json.dumps(
+            {
+                "text": text,
+                "speaker": speaker,
+                "sample_rate": SAMPLE_RATE,
+                "model": self._model_id,
+                "flags": flags,
+            },
+            ensure_ascii=False,
+            sort_keys=True,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> np.ndarray | None:
+        with self._lock:
+            if key not in self._index:
+                return None
+            path = self._path(key)
+            try:
+                audio = np.fromfile(path, dtype="<i2")
+                os.utime(path)
+            except OSError:
+                # Файл удалён извне — забываем запись
+                self._total -= self._index.pop(key)
+                return None
+            self._index.move_to_end(key)
+            return audio
+
+    def put(self, key: str, audio: np.ndarray):
+        data = audio.astype("<i2", copy=False).tobytes()
+        if len(data) > self.max_bytes:
+            return
+        path = self._path(key)
+        with self._lock:
+            if key in self._index:
+                return
+            path.parent.mkdir(exist_ok=True)
+            tmp_path = path.with_suffix(f".tmp{os.getpid()}")
+            try:
+                with open(tmp_path, "wb") as f:
+                    f.write(data)
+                os.replace(tmp_path, path)
+            except OSError:
+                tmp_path.unlink(missing_ok=True)
+                return
+            self._index[key] = len(data)
+            self._total += len(data)
+            self._evict()
+
+    def _evict(self):
+        while self._total > self.max_bytes and self._index:
+            key, size = self._index.popitem(last=False)
+            self._total -= size
+            self._path(key).unlink(missing_ok=True)
+
+    @property
+    def size_bytes(self) -> int:
+        return self._total
+
+
+_cache: ChunkCache | None = None
+_cache_lock = threading.Lock()
+
+
+def get_chunk_cache() -> ChunkCache | None:
+    """Возвращает общий кеш фрагментов или None, если он отключён."""
+    global _cache
+    if CHUNK_CACHE_MAX_MB <= 0:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = ChunkCache(CACHE_DIR / "chunks", CHUNK_CACHE_MAX_MB * 1024 * 1024)
+        return _cache
+
+
+# Тире реплики в начале фрагмента не озвучивается: «— Да.» и «Да.» звучат одинаково
+_LEADING_DASH_RE = re.compile(r'^[—–-]+\s*')
+
+
+def normalize_chunk(text: str) -> str:
+    """Текст фрагмента без различий, которые не влияют на звук."""
+    text = unicodedata.normalize("NFC", text)
+    text = " ".join(text.split())
+    return _LEADING_DASH_RE.sub("", text)
+
+
+class ChunkMemo:
+    """
+    Память повторов внутри одного задания: PCM уже синтезированных
+    фрагментов по нормализованному тексту и параметрам голоса.
+    Записи живут в RAM (LRU, не больше max_bytes); вытесненные и крупные
+    (больше восьмой части бюджета) уходят во временный каталог на диске,
+    который тоже ограничен spill_bytes. Фрагмент, который ещё синтезируется,
+    тоже находится — повтор ждёт тот же Future, а не идёт в модель.
+    Главы рендерятся параллельно, поэтому методы под блокировкой.
+    """
+
+    def __init__(self, max_bytes: int, spill_bytes: int, spill_root: Path):
+        self.max_bytes = max_bytes
+        self.spill_bytes = spill_bytes
+        self.hits = 0
+        self.lookups = 0
+        self._lock = threading.Lock()
+        self._ram: OrderedDict[str, np.ndarray] = OrderedDict()
+        self._ram_total = 0
+        self._disk: OrderedDict[str, int] = OrderedDict()
+        self._disk_total = 0
+        self._inflight: dict[str, Future] = {}
+        self._spill_root = Path(spill_root)
+        self._spill_dir: Path | None = None
+
+    @staticmethod
+    def key(text: str, speaker: str, flags: dict) -> str:
+        payload = json.dumps(
+            {"text": normalize_chunk(text), "speaker": speaker, "flags": flags},
+            ensure_ascii=False, sort_keys=True,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def lookup(self, key: str) -> np.ndarray | Future | None:
+        """Готовый PCM, Future синтезирующегося повтора или None."""
+        with self._lock:
+            self.lookups += 1
+            found = self._ram.get(key)
+            if found is not None:
+                self._ram.move_to_end(key)
+            elif key in self._disk:
+                try:
+                    found = np.fromfile(self._spill_path(key), dtype="<i2")
+                    self._disk.move_to_end(key)
+                except OSError:
+                    self._disk_total -= self._disk.pop(key)
+            else:
+                found = self._inflight.get(key)
+            if found is not None:
+                self.hits += 1
+            return found
+
+    def reserve(self, key: str, future: Future):
+        """Отмечает фрагмент, который сейчас синтезируется."""
+        with self._lock:
+            self._inflight[key] = future
+
+    def discard(self, key: str):
+        """Синтез не удался — повтор попробует снова."""
+        with self._lock:
+            self._inflight.pop(key, None)
+
+    def put(self, key: str, audio: np.ndarray):
+        with self._lock:
+            self._inflight.pop(key, None)
+            if key in self._ram or key in self._disk:
+                return
+            size = audio.nbytes
+            if size > self.max_bytes // 8:
+                self._spill(key, audio)
+                return
+            self._ram[key] = audio
+            self._ram_total += size
+            while self._ram_total > self.max_bytes:
+                old_key, old_audio = self._ram.popitem(last=False)
+                self._ram_total -= old_audio.nbytes
+                self._spill(old_key, old_audio)
+
+    def _spill_path(self, key: str) -> Path:
+        return self._spill_dir / f"{key}.pcm"
+
+    def _spill(self, key: str, audio: np.ndarray):
+        # Вызывается под блокировкой
+        data = audio.astype("<i2", copy=False).tobytes()
+        if len(data) > self.spill_bytes:
+            return
+        try:
+            if self._spill_dir is None:
+                self._spill_root.mkdir(parents=True, exist_ok=True)
+                self._spill_dir = Path(tempfile.mkdtemp(prefix=f"memo_{os.getpid()}_", dir=self._spill_root))
+            with open(self._spill_path(key), "wb") as f:
+                f.write(data)
+        except OSError:
+            return
+        self._disk[key] = len(data)
+        self._disk_total += len(data)
+        while self._disk_total > self.spill_bytes:
+            old_key, old_size = self._disk.popitem(last=False)
+            self._disk_total -= old_size
+            self._spill_path(old_key).unlink(missing_ok=True)
+
+    @property
+    def hit_rate(self) -> float:
+        return self.hits / self.lookups if self.lookups else 0.0
+
+    def close(self):
+        """Освобождает память и удаляет выгруженные на диск записи."""
+        with self._lock:
+            self._ram.clear()
+            self._disk.clear()
+            self._inflight.clear()
+            self._ram_total = self._disk_total = 0
+            if self._spill_dir is not None:
+                shutil.rmtree(self._spill_dir, ignore_errors=True)
+                self._spill_dir = None
+
+
+def new_chunk_memo() -> ChunkMemo | None:
+    """Память повторов для нового задания или None, если она отключена."""
+    if DEDUP_MEMO_MB <= 0:
+        return None
+    return ChunkMemo(
+        DEDUP_MEMO_MB * 1024 * 1024, DEDUP_SPILL_MB * 1024 * 1024, CACHE_DIR / "dedup",
+    )
@@ -0,0 +1,276 @@
+"""
+Пакетная конвертация книг из командной строки, без Gradio
+
+Примеры:
+    python cli.py book.docx
+    python cli.py books/ -o audiobooks/ -f m4b --workers 8 --summary summary.json
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+FORMAT_ALIASES = {
+    "mp3": "MP3 (192 kbps)",
+    "mp3-128": "MP3 (128 kbps)",
+    "mp3-320": "MP3 (320 kbps)",
+    "wav": "WAV (без сжатия)",
+    "ogg": "OGG Vorbis",
+    "m4b": "M4B (AAC, главы)",
+}
+
+_print_lock = threading.Lock()
+
+
+def log(message: str):
+    with _print_lock:
+        print(message, file=sys.stderr, flush=True)
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Audiobook Maker: пакетная конвертация текстов в аудиокниги",
+    )
+    parser.add_argument("inputs", nargs="+", help="файлы или каталоги с книгами")
+    parser.add_argument("-o", "--output-dir", default="output", help="каталог результатов")
+    parser.add_argument("-f", "--format", default="mp3", choices=sorted(FORMAT_ALIASES),
+                        help="формат результата")
+    parser.add_argument("-v", "--voice", default="xenia",
+                        help="голос: id (xenia, aidar, ...) или имя из интерфейса")
+    parser.add_argument("--speed", type=float, default=1.0, help="скорость речи")
+    parser.add_argument("--no-preserve-pitch", action="store_true",
+                        help="менять скорость вместе с высотой голоса")
+    parser.add_argument("--pause", type=float, default=0.5, help="пауза между предложениями, сек")
+    parser.add_argument("--artist", default="", help="тег «Автор»")
+    parser.add_argument("--per-chapter", action="store_true", help="отдельный файл на главу (ZIP)")
+    parser.add_argument("--workers", type=int, help="процессов синтеза (TTS_WORKERS)")
+    parser.add_argument("--worker-threads", type=int, help="потоков PyTorch на процесс")
+    parser.add_argument("--jobs", type=int, default=2,
+                        help="книг одновременно: следующая книга загружает пул, "
+                             "пока предыдущая кодируется")
+    parser.add_argument("--annotate", action="store_true",
+                        help="разметить ударения один раз на книгу (silero-stress) и "
+                             "синтезировать по разметке; сохраняется для других голосов")
+    parser.add_argument("--force", action="store_true",
+                        help="перерендерить, даже если результат новее исходника")
+    parser.add_argument("--summary", help="записать JSON-сводку в файл ('-' — в stdout)")
+    return parser.parse_args(argv)
+
+
+def collect_inputs(paths: list[str], extensions) -> list[tuple[Path, Path]]:
+    """
+    Разворачивает каталоги в список поддерживаемых файлов.
+    Возвращает пары (файл, путь результата без расширения относительно
+    каталога результатов): структура входного каталога повторяется,
+    чтобы одноимённые книги из разных подкаталогов не совпали.
+    """
+    files = []
+    for raw in paths:
+        path = Path(raw)
+        if path.is_dir():
+            files.extend(
+                (p, p.relative_to(path).with_suffix(""))
+                for p in sorted(path.rglob("*"))
+                if p.is_file() and p.suffix.lower() in extensions and not p.name.startswith(".")
+            )
+        elif path.is_file():
+            files.append((path, Path(path.stem)))
+        else:
+            log(f"[WARN]Не найден: {raw}")
+    return files
+
+
+def find_collisions(books: list[tuple[Path, Path]]) -> dict[Path, list[Path]]:
+    """Результаты, в которые попали бы несколько книг (book.txt и book.docx)."""
+    targets: dict[Path, list[Path]] = {}
+    for path, target in books:
+        targets.setdefault(target, []).append(path)
+    return {target: paths for target, paths in targets.items() if len(paths) > 1}
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+
+    # config читает переменные окружения при импорте — задаём их до импорта
+    if args.workers:
+        os.environ["TTS_WORKERS"] = str(args.workers)
+    if args.worker_threads:
+        os.environ["TTS_WORKER_THREADS"] = str(args.worker_threads)
+
+    from config import FORMATS, SPEAKERS
+    from converters import converters, convert_to_text, open_paragraph_stream
+    from jobs import source_fingerprint
+    from pipeline import book_job_ids, render_book, render_book_stream, stream_job_id
+    from workers import ANNOTATED_TTS_FLAGS, APPLY_TTS_FLAGS, memory_report
+    from accents import AccentorUnavailable, annotate_text
+    from storage import StorageFull, estimate_job_bytes, prepare_storage, storage
+
+    speaker = SPEAKERS.get(args.voice, args.voice)
+    if speaker not in SPEAKERS.values():
+        log(f"[ERROR]Неизвестный голос: {args.voice}")
+        return 2
+    speaker_name = next(name for name, sid in SPEAKERS.items() if sid == speaker)
+    output_format = FORMAT_ALIASES[args.format]
+    fmt = FORMATS[output_format]
+    preserve_pitch = not args.no_preserve_pitch
+
+    output_dir = Path(args.output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    books = collect_inputs(args.inputs, set(converters))
+    if not books:
+        log("[ERROR]Нет файлов для конвертации")
+        return 2
+    collisions = find_collisions(books)
+    if collisions:
+        # Иначе вторая книга молча перезапишет первую
+        for target, paths in collisions.items():
+            log(f"[ERROR]Один результат {target}{fmt['ext']} у книг: {', '.join(map(str, paths))}")
+        return 2
+    prepare_storage()
+
+    def process(index: int, book: tuple[Path, Path]) -> dict:
+        path, target = book
+        label = f"[{index}/{len(books)}] {path.name}"
+        output_path = output_dir / target.parent / f"{target.name}{fmt['ext']}"
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        artifact = output_path.with_suffix(".zip") if args.per_chapter else output_path
+        record = {"input": str(path), "output": str(artifact)}
+        # Книги этого запуска не вытесняются квотой ради следующих книг
+        storage.keep(artifact)
+
+        if (not args.force and artifact.exists()
+                and artifact.stat().st_mtime >= path.stat().st_mtime):
+            log(f"{label}: актуален, пропуск")
+            return {**record, "status": "skipped"}
+
+        started = time.time()
+        # Один файл без глав синтезируется прямо из потока абзацев:
+        # озвучивание начинается, пока документ ещё разбирается.
+        # Разметке ударений нужен весь текст
+        read_progress = {}
+        paragraphs = None
+        if not args.per_chapter and not fmt.get("chapters") and not args.annotate:
+            paragraphs = open_paragraph_stream(str(path), read_progress)
+        text = None
+        if paragraphs is None:
+            text, debug_info = convert_to_text(str(path))
+            if not text or not text.strip():
+                log(f"{label}: [ERROR]не удалось извлечь текст")
+                return {**record, "status": "error", "error": debug_info}
+        tts_flags = APPLY_TTS_FLAGS
+        if args.annotate and text is not None:
+            try:
+                text, cached = annotate_text(text)
+                tts_flags = ANNOTATED_TTS_FLAGS
+                log(f"{label}: ударения — {'сохранённая разметка' if cached else 'разметка выполнена'}")
+            except AccentorUnavailable as e:
+                log(f"{label}: [WARN]ударения расставит модель: {e}")
+
+        # Одиночный файл пишется под временным именем и переименовывается
+        # после успеха, чтобы оборванный рендер не считался актуальным
+        render_path = output_path if args.per_chapter else output_path.with_name(
+            f".{path.stem}.part{fmt['ext']}"
+        )
+        last_step = [-1]
+
+        def on_progress(fraction: float, desc: str):
+            step = int(fraction * 10)
+            if step != last_step[0]:
+                last_step[0] = step
+                log(f"{label}: {fraction * 100:.0f}% {desc}")
+
+        log_lines = []
+        job_header = {
+            "title": path.stem, "artist": args.artist, "speaker_name": speaker_name,
+            "speed": args.speed, "preserve_pitch": preserve_pitch, "pause": args.pause,
+            "output_format": output_format, "per_chapter": args.per_chapter,
+            "annotated": tts_flags is ANNOTATED_TTS_FLAGS,
+        }
+        # Без текста (поток абзацев) объём оценивается по размеру исходника
+        chars = len(text) if text is not None else path.stat().st_size
+        if paragraphs is not None:
+            job_ids = [stream_job_id(source_fingerprint(path), speaker, args.pause)]
+        else:
+            job_ids = book_job_ids(text, speaker, args.pause, fmt, args.per_chapter, tts_flags)
+        try:
+            reservation = storage.reserve(
+                estimate_job_bytes(chars, fmt, args.speed, args.per_chapter), render_path, path.name,
+                job_ids,
+            )
+        except StorageFull as e:
+            log(f"{label}: {e}")
+            return {**record, "status": "error", "error": str(e)}
+        try:
+            if paragraphs is not None:
+                stats = render_book_stream(
+                    paragraphs, source_fingerprint(path), read_progress, speaker,
+                    args.speed, args.pause, fmt, preserve_pitch, render_path,
+                    path.stem, args.artist, job_header, log_lines, on_progress,
+                )
+            else:
+                stats = render_book(
+                    text, speaker, args.speed, args.pause, fmt, preserve_pitch,
+                    args.per_chapter, render_path, path.stem, args.artist,
+                    job_header, log_lines, on_progress, tts_flags=tts_flags,
+                )
+        except Exception as e:
+            log(f"{label}: {str(e).splitlines()[0]}")
+            return {**record, "status": "error", "error": str(e),
+                    "elapsed": round(time.time() - started, 2)}
+        finally:
+            reservation.release()
+
+        if not args.per_chapter:
+            os.replace(render_path, output_path)
+        elapsed = time.time() - started
+        log(f"{label}: [OK]{stats['duration'] / 60:.1f} мин аудио за {elapsed:.0f} сек")
+        return {
+            **record,
+            "status": "ok",
+            "elapsed": round(elapsed, 2),
+            "duration": round(stats["duration"], 2),
+            "chars": stats.get("chars", len(text or "")),
+            "chunks": stats["chunks"],
+            "failed_chunks": stats["failed"],
+            "cache_hits": stats["cache_hits"],
+            "cache_misses": stats["cache_misses"],
+            "dedup_hits": stats["dedup_hits"],
+            "record": stats["record_path"],
+            "warnings": [line for line in log_lines if line.startswith("[WARN]")],
+        }
+
+    started = time.time()
+    # Несколько книг в работе одновременно: пул воркеров не простаивает,
+    # пока одна книга конвертируется из DOCX или кодируется в MP3
+    with ThreadPoolExecutor(max_workers=max(1, args.jobs), thread_name_prefix="book") as pool:
+        results = list(pool.map(process, range(1, len(books) + 1), books))
+
+    summary = {
+        "elapsed": round(time.time() - started, 2),
+        "voice": speaker,
+        "format": output_format,
+        "ok": sum(1 for r in results if r["status"] == "ok"),
+        "skipped": sum(1 for r in results if r["status"] == "skipped"),
+        "failed": sum(1 for r in results if r["status"] == "error"),
+        "audio_seconds": round(sum(r.get("duration", 0) for r in results), 2),
+        "memory": memory_report(),
+        "books": results,
+    }
+    if args.summary:
+        payload = json.dumps(summary, ensure_ascii=False, indent=2)
+        if args.summary == "-":
+            print(payload)
+        else:
+            Path(args.summary).write_text(payload, encoding="utf-8")
+    log(f"Готово: {summary['ok']} успешно, {summary['skipped']} пропущено, "
+        f"{summary['failed']} с ошибками за {summary['elapsed']:.0f} сек")
+    return 1 if summary["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
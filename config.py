@@ -8,8 +8,86 @@ from pathlib import Path
 SAMPLE_RATE = 48000
 OUTPUT_DIR = Path("output")
 OUTPUT_DIR.mkdir(exist_ok=True)
+# Манифесты и временные WAV незавершённых заданий
+JOBS_DIR = OUTPUT_DIR / "_jobs"
+# JSON-записи заданий с таймингами фрагментов
+RECORDS_DIR = OUTPUT_DIR / "_records"
+# Порт HTTP-эндпоинта /metrics (Prometheus) и /records/<id>.json; 0 — выключен
+METRICS_PORT = int(os.environ.get("METRICS_PORT", "9090"))
+# Прогрессивное прослушивание: готовое аудио публикуется сегментами во время
+# синтеза — в плеер интерфейса и HLS-плейлистом /live/<id>/index.m3u8
+LIVE_STREAM = os.environ.get("LIVE_STREAM", "1") == "1"
+LIVE_DIR = OUTPUT_DIR / "_live"
+LIVE_SEGMENT_SEC = float(os.environ.get("LIVE_SEGMENT_SEC", "6"))
+# Сколько секунд отдавать плееру Gradio: он держит сегменты в памяти сессии
+LIVE_PLAYER_MAX_SEC = int(os.environ.get("LIVE_PLAYER_MAX_SEC", "1800"))
+# Квота каталога результатов (0 — без квоты): давно не использованные книги,
+# логи и прерванные задания вытесняются; запас свободного места на диске
+OUTPUT_QUOTA_MB = int(os.environ.get("OUTPUT_QUOTA_MB", "10240"))
+OUTPUT_MIN_FREE_MB = int(os.environ.get("OUTPUT_MIN_FREE_MB", "512"))
 
 MODEL_DIR = Path(os.environ.get("MODEL_DIR", "."))
+MODEL_PATH = MODEL_DIR / "v5_ru.pt"
+
+# Потоковый экспорт: кодирование идёт параллельно с синтезом, без временного WAV
+STREAM_EXPORT = os.environ.get("STREAM_EXPORT", "0") == "1"
+
+# Постобработка фрагментов между синтезом и записью: подрезка тишины по краям
+# до EDGE_SILENCE_MS и выравнивание громкости к LOUDNESS_TARGET_LUFS (EBU R128)
+AUDIO_POSTPROCESS = os.environ.get("AUDIO_POSTPROCESS", "0") == "1"
+LOUDNESS_TARGET_LUFS = float(os.environ.get("LOUDNESS_TARGET_LUFS", "-18"))
+EDGE_SILENCE_MS = int(os.environ.get("EDGE_SILENCE_MS", "100"))
+
+# Главы: сколько рендерить одновременно и сколько раз повторять при ошибке
+CHAPTER_WORKERS = int(os.environ.get("CHAPTER_WORKERS", "2"))
+CHAPTER_RETRIES = int(os.environ.get("CHAPTER_RETRIES", "1"))
+
+# Кеш синтезированных фрагментов (0 — отключён)
+CACHE_DIR = Path(os.environ.get("CACHE_DIR", "cache"))
+CHUNK_CACHE_MAX_MB = int(os.environ.get("CHUNK_CACHE_MAX_MB", "2048"))
+# Повторы фрагментов внутри задания («— Да.», разделители сцен): память
+# под готовый PCM (0 — выключено) и предел выгрузки крупных записей на диск
+DEDUP_MEMO_MB = int(os.environ.get("DEDUP_MEMO_MB", "64"))
+DEDUP_SPILL_MB = int(os.environ.get("DEDUP_SPILL_MB", "256"))
+# Короткие повторяющиеся предложения (до стольких символов) не упаковываются
+# с соседями: повтор целиком совпадает с фрагментом и берётся из памяти
+# повторов. 0 — упаковывать как все
+DEDUP_SENTENCE_CHARS = int(os.environ.get("DEDUP_SENTENCE_CHARS", "80"))
+# Ударения и ё расставляются один раз на книгу (пакет silero-stress, ставится
+# отдельно) и хранятся здесь; модель получает размеченный текст без
+# автоматической разметки
+ACCENT_ANNOTATION = os.environ.get("ACCENT_ANNOTATION", "0") == "1"
+ACCENTS_DIR = CACHE_DIR / "accents"
+# Превью голосов: рендер всех голосов при старте и лимит пользовательских фраз
+PREVIEW_WARMUP = os.environ.get("PREVIEW_WARMUP", "1") == "1"
+PREVIEW_CACHE_MAX = int(os.environ.get("PREVIEW_CACHE_MAX", "200"))
+
+# Потоки PyTorch в основном процессе и в каждом воркере пула
+TTS_THREADS = int(os.environ.get("TTS_THREADS", "4"))
+TTS_WORKER_THREADS = int(os.environ.get("TTS_WORKER_THREADS", "1"))
+# Число процессов синтеза (1 — синтез в основном процессе)
+TTS_WORKERS = int(os.environ.get("TTS_WORKERS", "1"))
+# Заданий интерфейса одновременно: остальные ждут в очереди с оценкой старта.
+# Фрагменты выполняющихся заданий чередуются, превью — вне очереди
+MAX_ACTIVE_JOBS = int(os.environ.get("MAX_ACTIVE_JOBS", "2"))
+# Одна копия весов на все процессы: модель грузится в forkserver до форка воркеров
+TTS_SHARE_MODEL = os.environ.get("TTS_SHARE_MODEL", "1") == "1"
+# Целевая длина фрагмента: соседние предложения упаковываются в один вызов
+# apply_tts (предел Silero ~1000 символов). 0 — каждое предложение отдельно.
+CHUNK_TARGET_CHARS = int(os.environ.get("CHUNK_TARGET_CHARS", "800"))
+# Первый фрагмент короче: с него начинается прослушивание, пока идёт остальной синтез
+FIRST_CHUNK_CHARS = int(os.environ.get("FIRST_CHUNK_CHARS", "200"))
+# Прогрев модели сразу после загрузки
+TTS_WARMUP = os.environ.get("TTS_WARMUP", "1") == "1"
+# Ускорение CPU-инференса (по умолчанию выключено, сравнение — benchmark.py
+# --real --modes): torch.inference_mode без учёта autograd, динамическая
+# int8-квантизация слоёв Linear/LSTM (none | int8; меняет звук — отдельный
+# кеш фрагментов), oneDNN-слияние графов TorchScript и сброс денормалов,
+# потоки межоператорного параллелизма (0 — по умолчанию PyTorch)
+TTS_INFERENCE_MODE = os.environ.get("TTS_INFERENCE_MODE", "0") == "1"
+TTS_QUANTIZE = os.environ.get("TTS_QUANTIZE", "none")
+TTS_ONEDNN = os.environ.get("TTS_ONEDNN", "0") == "1"
+TTS_INTEROP_THREADS = int(os.environ.get("TTS_INTEROP_THREADS", "0"))
 
 SPEAKERS = {
     "Ксения (женский)": "xenia",
@@ -25,4 +103,9 @@ FORMATS = {
     "MP3 (320 kbps)": {"format": "mp3", "ext": ".mp3", "params": {"bitrate": "320k"}},
     "WAV (без сжатия)": {"format": "wav", "ext": ".wav", "params": {}},
     "OGG Vorbis": {"format": "ogg", "ext": ".ogg", "params": {}},
+    "M4B (AAC, главы)": {
+        "format": "ipod", "ext": ".m4b",
+        "params": {"bitrate": "96k", "codec": "aac"},
+        "chapters": True,
+    },
 }
@@ -1,9 +1,19 @@
 """
 Модуль для конвертации различных форматов документов в текст
 """
+import codecs
+import io
+import os
+import posixpath
+import re
 import zipfile
 import xml.etree.ElementTree as ET
+from html.parser import HTMLParser
 from pathlib import Path
+from urllib.parse import unquote
+
+# Стили заголовков Word: "Heading1", "Title", локализованные "1", "Заголовок1"
+_DOCX_HEADING_STYLE_RE = re.compile(r'^(?:heading\s*\d*|title|заголовок\s*\d*|\d)$', re.IGNORECASE)
 
 
 def extract_text_from_pages(file_path: str) -> tuple[str | None, str]:
@@ -91,59 +101,578 @@ def extract_text_from_pages(file_path: str) -> tuple[str | None, str]:
         return None, '\n'.join(debug)
 
 
-def extract_text_from_docx(file_path: str) -> tuple[str | None, str]:
-    """Извлекает текст из файла .docx (Microsoft Word)."""
-    debug = []
-    try:
-        with zipfile.ZipFile(file_path, 'r') as zip_ref:
-            # DOCX - это тоже ZIP архив
-            if 'word/document.xml' not in zip_ref.namelist():
-                debug.append("[ERROR]Неверная структура .docx файла")
-                return None, '\n'.join(debug)
+_W = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
 
-            with zip_ref.open('word/document.xml') as xml_file:
-                tree = ET.parse(xml_file)
-                root = tree.getroot()
 
-                # Namespace для Word XML
-                ns = {'w': 'http://schemas.openxmlformats.org/wordprocessingml/2006/main'}
+def _is_docx_heading_style(value: str) -> bool:
+    return bool(_DOCX_HEADING_STYLE_RE.match(value))
 
-                # Извлекаем текст из параграфов
-                paragraphs = []
-                for para in root.findall('.//w:p', ns):
-                    texts = para.findall('.//w:t', ns)
-                    if texts:
-                        para_text = ''.join(t.text for t in texts if t.text)
-                        if para_text.strip():
-                            paragraphs.append(para_text)
 
-                if paragraphs:
-                    text = '\n'.join(paragraphs)
-                    debug.append(f"[OK]Извлечено {len(paragraphs)} параграфов")
-                    return text, '\n'.join(debug)
+def _is_docx_outline_heading(value: str) -> bool:
+    # Уровни структуры 0–8 — заголовки, 9 — основной текст
+    return value.isdigit() and int(value) <= 8
 
-                debug.append("[ERROR]Документ пуст")
-                return None, '\n'.join(debug)
 
+def iter_docx_paragraphs(file_path: str, progress: dict | None = None):
+    """
+    Потоково читает абзацы .docx через iterparse. Каждый абзац отдаётся
+    сразу после закрывающего тега и вычищается из дерева, поэтому память
+    ограничена одним абзацем, а синтез может начаться до конца разбора.
+    Заголовки помечаются markdown-префиксом "# " для поиска глав.
+    В progress["fraction"] пишется доля прочитанного document.xml.
+    Бросает KeyError, если в архиве нет word/document.xml.
+    """
+    with zipfile.ZipFile(file_path, 'r') as zip_ref:
+        info = zip_ref.getinfo('word/document.xml')
+        with zip_ref.open(info) as xml_file:
+            body = None
+            # Стек абзацев: во вложенных (надписи, сноски) — свой текст
+            stack: list[dict] = []
+            for event, elem in ET.iterparse(xml_file, events=("start", "end")):
+                tag = elem.tag
+                if event == "start":
+                    if tag == f"{_W}p":
+                        stack.append({"texts": [], "heading": False})
+                    elif tag == f"{_W}body":
+                        body = elem
+                    continue
+
+                if not stack:
+                    continue
+                if tag == f"{_W}t":
+                    if elem.text:
+                        stack[-1]["texts"].append(elem.text)
+                elif tag == f"{_W}outlineLvl":
+                    if _is_docx_outline_heading(elem.get(f"{_W}val", "")):
+                        stack[-1]["heading"] = True
+                elif tag == f"{_W}pStyle":
+                    if _is_docx_heading_style(elem.get(f"{_W}val", "")):
+                        stack[-1]["heading"] = True
+                elif tag == f"{_W}p":
+                    para = stack.pop()
+                    text = ''.join(para["texts"]).strip()
+                    elem.clear()
+                    if not stack and body is not None:
+                        # Обработанные абзацы больше не нужны в дереве
+                        body.clear()
+                    if progress is not None and info.file_size:
+                        progress["fraction"] = xml_file.tell() / info.file_size
+                    if text:
+                        yield f"# {text}" if para["heading"] else text
+
+
+def _join_paragraphs(iter_paragraphs, file_path: str, kind: str) -> tuple[str | None, str]:
+    # Общая обёртка над потоковыми читателями для convert_to_text
+    debug = []
+    try:
+        paragraphs = list(iter_paragraphs(file_path))
+    except (KeyError, StopIteration, zipfile.BadZipFile):
+        debug.append(f"[ERROR]Неверная структура {kind} файла")
+        return None, '\n'.join(debug)
+    except ET.ParseError as e:
+        debug.append(f"[ERROR]Ошибка разбора XML: {e}")
+        return None, '\n'.join(debug)
     except Exception as e:
         debug.append(f"[ERROR]Ошибка: {str(e)}")
         return None, '\n'.join(debug)
 
+    if paragraphs:
+        debug.append(f"[OK]Извлечено {len(paragraphs)} параграфов")
+        return '\n'.join(paragraphs), '\n'.join(debug)
+
+    debug.append("[ERROR]Документ пуст")
+    return None, '\n'.join(debug)
+
+
+def extract_text_from_docx(file_path: str) -> tuple[str | None, str]:
+    """Извлекает текст из файла .docx (Microsoft Word)."""
+    # DOCX - это тоже ZIP архив
+    return _join_paragraphs(iter_docx_paragraphs, file_path, '.docx')
+
+
+def _local(tag: str) -> str:
+    # Имя тега без пространства имён
+    return tag.rsplit('}', 1)[-1]
+
+
+def _squash(text: str) -> str:
+    return ' '.join(text.split())
+
+
+# Элементы FB2, которые читаются как отдельные абзацы
+_FB2_BLOCKS = {'p', 'v', 'subtitle', 'text-author'}
+# Не озвучиваются: метаданные, картинки в base64, тела со сносками
+_FB2_SKIP = {'description', 'binary'}
+_FB2_NOTE_BODIES = {'notes', 'comments', 'footnotes'}
+
+
+def _fb2_text(elem) -> str:
+    # Текст абзаца с оформлением (emphasis, strong...), без ссылок на сноски
+    parts = [elem.text or '']
+    for child in elem:
+        if not (_local(child.tag) == 'a' and child.get('type') == 'note'):
+            parts.append(_fb2_text(child))
+        parts.append(child.tail or '')
+    return ''.join(parts)
+
+
+def iter_fb2_paragraphs(file_path: str, progress: dict | None = None):
+    """
+    Потоково читает абзацы .fb2 через iterparse. Заголовки секций
+    отдаются с markdown-префиксом "# " — по ним ищутся главы. Разобранные
+    элементы удаляются из дерева, картинки (binary) и сноски
+    выбрасываются без декодирования base64, поэтому память ограничена
+    текущим абзацем или картинкой, а не размером книги.
+    """
+    size = os.path.getsize(file_path)
+    with open(file_path, 'rb') as f:
+        stack = []
+        skip = 0   # глубина внутри пропускаемых элементов
+        keep = 0   # глубина внутри абзацев и заголовков: их дети нужны до конца
+        for event, elem in ET.iterparse(f, events=("start", "end")):
+            tag = _local(elem.tag)
+            if event == "start":
+                if skip or tag in _FB2_SKIP or (
+                        tag == 'body' and elem.get('name') in _FB2_NOTE_BODIES):
+                    skip += 1
+                elif tag in _FB2_BLOCKS or tag == 'title':
+                    keep += 1
+                stack.append((elem, tag))
+                continue
+
+            stack.pop()
+            parent = stack[-1][0] if stack else None
+            if skip:
+                skip -= 1
+                elem.clear()
+                if not skip and parent is not None:
+                    parent.remove(elem)
+                continue
+
+            if tag in _FB2_BLOCKS or tag == 'title':
+                keep -= 1
+            if keep:
+                continue
+
+            if tag == 'title':
+                heading = '. '.join(
+                    t for t in (_squash(_fb2_text(p)) for p in elem if _local(p.tag) == 'p') if t
+                )
+                if heading:
+                    # Заголовок тела — название книги, заголовок секции — глава
+                    in_section = bool(stack) and stack[-1][1] == 'section'
+                    yield f"# {heading}" if in_section else heading
+            elif tag in _FB2_BLOCKS:
+                text = _squash(_fb2_text(elem))
+                if text:
+                    yield text
+
+            if parent is not None:
+                parent.remove(elem)
+            if progress is not None and size:
+                progress["fraction"] = f.tell() / size
+
+
+def extract_text_from_fb2(file_path: str) -> tuple[str | None, str]:
+    """Извлекает текст из файла .fb2 (FictionBook)."""
+    return _join_paragraphs(iter_fb2_paragraphs, file_path, '.fb2')
+
+
+_EPUB_OPS_TYPE = '{http://www.idpf.org/2007/ops}type'
+# Порция, которой документы EPUB подаются в HTML-парсер, байт
+_EPUB_FEED_BYTES = 64 * 1024
+
+
+class _XhtmlParagraphs(HTMLParser):
+    """
+    Собирает абзацы XHTML-документа по мере подачи данных. Используется
+    HTMLParser, а не XML-парсер: документы EPUB часто содержат
+    HTML-сущности (&nbsp;), на которых строгий XML-разбор падает.
+    """
+
+    _BLOCKS = {
+        'p', 'div', 'li', 'blockquote', 'br', 'tr', 'td', 'dd', 'dt', 'pre',
+        'section', 'article', 'figcaption', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6',
+    }
+    _HEADINGS = {'h1', 'h2', 'h3', 'h4', 'h5', 'h6'}
+    _SKIP = {'head', 'script', 'style'}
+    _NOTE_TYPES = {'noteref', 'footnote', 'endnote', 'rearnote'}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.paragraphs = []
+        self._buf = []
+        self._heading = False
+        self._skip_tag = None
+        self._skip_depth = 0
+
+    def _flush(self):
+        text = _squash(''.join(self._buf))
+        self._buf = []
+        if text:
+            self.paragraphs.append((text, self._heading))
+
+    def handle_starttag(self, tag, attrs):
+        if self._skip_tag:
+            self._skip_depth += tag == self._skip_tag
+            return
+        if tag in self._SKIP or dict(attrs).get('epub:type') in self._NOTE_TYPES:
+            self._skip_tag, self._skip_depth = tag, 1
+            return
+        if tag in self._BLOCKS:
+            self._flush()
+            self._heading = tag in self._HEADINGS
+
+    def handle_endtag(self, tag):
+        if self._skip_tag:
+            if tag == self._skip_tag:
+                self._skip_depth -= 1
+                if not self._skip_depth:
+                    self._skip_tag = None
+            return
+        if tag in self._BLOCKS:
+            self._flush()
+            self._heading = False
+
+    def handle_data(self, data):
+        if not self._skip_tag:
+            self._buf.append(data)
+
+    def close(self):
+        super().close()
+        self._flush()
+
+
+def _epub_href(base: str, href: str) -> str:
+    return posixpath.normpath(posixpath.join(base, unquote(href.split('#', 1)[0])))
+
+
+def _epub_toc(zip_ref, nav: str | None, ncx: str | None) -> dict:
+    """Путь документа → название из оглавления (nav EPUB3 или toc.ncx)."""
+    labels = {}
+    try:
+        if nav:
+            root = ET.fromstring(zip_ref.read(nav))
+            for elem in root.iter():
+                if _local(elem.tag) == 'nav' and elem.get(_EPUB_OPS_TYPE) == 'toc':
+                    for a in elem.iter():
+                        if _local(a.tag) == 'a' and a.get('href'):
+                            label = _squash(''.join(a.itertext()))
+                            if label:
+                                labels.setdefault(_epub_href(posixpath.dirname(nav), a.get('href')), label)
+        elif ncx:
+            root = ET.fromstring(zip_ref.read(ncx))
+            for point in root.iter():
+                if _local(point.tag) != 'navPoint':
+                    continue
+                label = src = None
+                for child in point:
+                    if _local(child.tag) == 'navLabel':
+                        label = _squash(''.join(child.itertext()))
+                    elif _local(child.tag) == 'content':
+                        src = child.get('src')
+                if label and src:
+                    labels.setdefault(_epub_href(posixpath.dirname(ncx), src), label)
+    except (KeyError, ET.ParseError):
+        # Без оглавления главы определяются только по заголовкам h1–h6
+        pass
+    return labels
+
+
+def _epub_spine(zip_ref) -> tuple[list[str], dict]:
+    """Документы EPUB в порядке чтения (spine) и названия глав из оглавления."""
+    container = ET.fromstring(zip_ref.read('META-INF/container.xml'))
+    opf_path = next(
+        e.get('full-path') for e in container.iter() if _local(e.tag) == 'rootfile'
+    )
+    opf = ET.fromstring(zip_ref.read(opf_path))
+    base = posixpath.dirname(opf_path)
+    manifest = {}
+    nav = ncx = None
+    for item in opf.iter():
+        if _local(item.tag) != 'item' or not item.get('href'):
+            continue
+        path = _epub_href(base, item.get('href'))
+        manifest[item.get('id')] = path
+        if 'nav' in (item.get('properties') or '').split():
+            nav = path
+        elif item.get('media-type') == 'application/x-dtbncx+xml':
+            ncx = path
+    # linear="no" — вспомогательные документы вне основного чтения (сноски)
+    spine = [
+        manifest[ref.get('idref')] for ref in opf.iter()
+        if _local(ref.tag) == 'itemref' and ref.get('linear') != 'no'
+        and ref.get('idref') in manifest
+    ]
+    return spine, _epub_toc(zip_ref, nav, ncx)
+
+
+def iter_epub_paragraphs(file_path: str, progress: dict | None = None):
+    """
+    Потоково читает абзацы .epub: документы в порядке spine, каждый
+    подаётся в HTML-парсер порциями, поэтому в памяти только текущий
+    абзац. Начало документа из оглавления и заголовки h1–h6 отдаются
+    с префиксом "# " — границы глав сохраняются для их поиска.
+    Бросает KeyError/StopIteration при неверной структуре архива.
+    """
+    with zipfile.ZipFile(file_path, 'r') as zip_ref:
+        spine, toc = _epub_spine(zip_ref)
+        names = set(zip_ref.namelist())
+        for index, path in enumerate(spine):
+            if path not in names:
+                continue
+            info = zip_ref.getinfo(path)
+            label = toc.get(path)
+            first = True
+            parser = _XhtmlParagraphs()
+            decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+            with zip_ref.open(info) as doc:
+                while True:
+                    data = doc.read(_EPUB_FEED_BYTES)
+                    if data:
+                        parser.feed(decoder.decode(data))
+                    else:
+                        parser.feed(decoder.decode(b'', final=True))
+                        parser.close()
+                    for text, heading in parser.paragraphs:
+                        if first and label:
+                            # Название из оглавления, если документ не начинается
+                            # с заголовка (или заголовок оформлен простым абзацем)
+                            if heading or text.lower() == label.lower():
+                                heading = True
+                            else:
+                                yield f"# {label}"
+                        first = False
+                        yield f"# {text}" if heading else text
+                    parser.paragraphs.clear()
+                    if progress is not None and spine:
+                        done = doc.tell() / info.file_size if info.file_size else 1.0
+                        progress["fraction"] = (index + done) / len(spine)
+                    if not data:
+                        break
+
+
+def extract_text_from_epub(file_path: str) -> tuple[str | None, str]:
+    """Извлекает текст из файла .epub."""
+    return _join_paragraphs(iter_epub_paragraphs, file_path, '.epub')
+
+
+# Сколько байт начала файла смотрим для определения кодировки
+_ENCODING_SAMPLE_BYTES = 64 * 1024
+# Порция декодирования и предел абзаца в потоке, символов
+_TEXT_BLOCK_CHARS = 256 * 1024
+_MAX_PARAGRAPH_CHARS = 64 * 1024
+
+_BOMS = (
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF32_LE, 'utf-32'),
+    (codecs.BOM_UTF32_BE, 'utf-32'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+)
+
+# Частоты строчных букв русского текста: в верной однобайтовой кодировке
+# выборка даёт частые буквы, в неверной — заглавные и псевдографику
+_RU_LETTER_FREQ = {
+    'о': 11.0, 'е': 8.5, 'а': 8.0, 'и': 7.3, 'н': 6.7, 'т': 6.3, 'с': 5.5,
+    'р': 4.7, 'в': 4.5, 'л': 4.4, 'к': 3.5, 'м': 3.2, 'д': 3.0, 'п': 2.8,
+    'у': 2.6, 'я': 2.0, 'ы': 1.9, 'ь': 1.7, 'г': 1.7, 'з': 1.6, 'б': 1.6,
+    'ч': 1.5, 'й': 1.2, 'х': 1.0, 'ж': 0.9, 'ш': 0.7, 'ю': 0.6, 'ц': 0.5,
+    'щ': 0.4, 'э': 0.3, 'ф': 0.3, 'ё': 0.1, 'ъ': 0.1,
+}
+
+_PARAGRAPH_BREAK_RE = re.compile(r'\n[ \t]*\n\s*')
+_SENTENCE_END_RE = re.compile(r'[.!?…]\s')
+
+
+def _cyrillic_score(sample: bytes, encoding: str) -> float:
+    text = sample.decode(encoding, errors='replace')
+    return sum(_RU_LETTER_FREQ.get(ch, 0.0) for ch in text)
+
+
+def _mostly_utf8(sample: bytes) -> bool:
+    # Отдельные битые байты в UTF-8-тексте, а не другая кодировка:
+    # в cp1251/cp866 почти все байты старше 0x7F — ошибки UTF-8
+    text = sample.decode('utf-8', errors='replace')
+    bad = text.count('\ufffd')
+    return sum(1 for ch in text if ord(ch) > 0x7F) - bad > 10 * bad
+
+
+def detect_encoding(sample: bytes, final: bool = True) -> str:
+    """
+    Определяет кодировку по началу файла: BOM, затем валидность UTF-8,
+    затем частотная оценка cp1251 против cp866. Однобайтовый текст,
+    где байты старше 0x7F редки на фоне латиницы, читается как latin-1.
+    final=False — выборка обрезана, и последний символ может быть неполным.
+    """
+    for bom, encoding in _BOMS:
+        if sample.startswith(bom):
+            return encoding
+    try:
+        # Инкрементальный декодер не считает ошибкой символ,
+        # обрезанный границей выборки
+        codecs.getincrementaldecoder('utf-8')().decode(sample, final=final)
+        return 'utf-8'
+    except UnicodeDecodeError:
+        pass
+    high = sum(1 for b in sample if b > 0x7F)
+    paired = sum(1 for a, b in zip(sample, sample[1:]) if a > 0x7F and b > 0x7F)
+    # Русские слова целиком из байтов старше 0x7F, а западноевропейские
+    # диакритики стоят поодиночке среди латиницы
+    if paired * 2 < high:
+        return 'latin-1'
+    scores = {enc: _cyrillic_score(sample, enc) for enc in ('cp1251', 'cp866')}
+    best = max(scores, key=scores.get)
+    return best if scores[best] > 0 else 'latin-1'
+
+
+def iter_text_blocks(file_path: str, progress: dict | None = None, encoding: str | None = None):
+    """
+    Читает текстовый файл за один проход: кодировка определяется по
+    выборке, затем файл декодируется порциями по _TEXT_BLOCK_CHARS
+    символов. Переводы строк (CRLF, CR) приводятся к LF, недекодируемые
+    байты заменяются на U+FFFD. В progress["encoding"] пишется
+    кодировка, в progress["fraction"] — доля прочитанного файла,
+    в progress["replaced"] — число символов U+FFFD.
+    Выборка из одной латиницы (длинное английское предисловие) о
+    кодировке остального файла ничего не говорит: такой UTF-8 читается
+    строго, и на первой недекодируемой порции кодировка определяется
+    заново по ней (progress["redetected_at"] — смещение в байтах).
+    """
+    with open(file_path, 'rb') as raw:
+        strict = False
+        if encoding is None:
+            sample = raw.read(_ENCODING_SAMPLE_BYTES)
+            encoding = detect_encoding(sample, final=len(sample) < _ENCODING_SAMPLE_BYTES)
+            strict = encoding == 'utf-8' and sample.isascii()
+            raw.seek(0)
+        size = os.fstat(raw.fileno()).st_size
+        if progress is not None:
+            progress.update(encoding=encoding, replaced=0)
+        # Переводы строк приводятся вручную: смещение в байтах считается
+        # по декодированному тексту как есть
+        f = io.TextIOWrapper(raw, encoding=encoding, errors='strict' if strict else 'replace', newline='')
+        offset = 0
+        pending_cr = ''
+        try:
+            while True:
+                try:
+                    block = f.read(_TEXT_BLOCK_CHARS)
+                except UnicodeDecodeError:
+                    # Ошибка — внутри порции, прочитанной последним read():
+                    # в UTF-8 она не длиннее 4 байт на символ
+                    f.detach()
+                    raw.seek(offset)
+                    sample = raw.read(4 * _TEXT_BLOCK_CHARS + _ENCODING_SAMPLE_BYTES)
+                    if not _mostly_utf8(sample):
+                        encoding = detect_encoding(sample, final=raw.tell() >= size)
+                    raw.seek(offset)
+                    strict = False
+                    if progress is not None:
+                        progress.update(encoding=encoding, redetected_at=offset)
+                    f = io.TextIOWrapper(raw, encoding=encoding, errors='replace', newline='')
+                    continue
+                if not block:
+                    break
+                if strict:
+                    offset += len(block.encode(encoding))
+                if progress is not None:
+                    progress["replaced"] += block.count('\ufffd')
+                    if size:
+                        progress["fraction"] = min(1.0, raw.tell() / size)
+                # CR в конце порции может оказаться началом CRLF
+                block = pending_cr + block
+                pending_cr = '\r' if block.endswith('\r') else ''
+                if pending_cr:
+                    block = block[:-1]
+                if block:
+                    yield block.replace('\r\n', '\n').replace('\r', '\n')
+            if pending_cr:
+                yield '\n'
+        finally:
+            f.detach()
+
+
+def _split_oversized(paragraph: str) -> tuple[str, str]:
+    # Абзац без пустых строк режется по последнему концу предложения,
+    # иначе по пробелу, чтобы память потока оставалась ограниченной
+    cut = None
+    for match in _SENTENCE_END_RE.finditer(paragraph):
+        cut = match.end()
+    if cut is None:
+        cut = paragraph.rfind(' ') + 1 or len(paragraph)
+    return paragraph[:cut], paragraph[cut:]
+
+
+def iter_txt_paragraphs(file_path: str, progress: dict | None = None):
+    """
+    Потоково читает абзацы текстового файла (разделитель — пустая строка).
+    Переносы строк внутри абзаца сохраняются, как при чтении целиком.
+    """
+    carry = ''
+    for block in iter_text_blocks(file_path, progress):
+        parts = _PARAGRAPH_BREAK_RE.split(carry + block)
+        carry = parts.pop()
+        for part in parts:
+            if part.strip():
+                yield part.strip()
+        while len(carry) > _MAX_PARAGRAPH_CHARS:
+            head, carry = _split_oversized(carry)
+            if head.strip():
+                yield head.strip()
+    if carry.strip():
+        yield carry.strip()
+
 
 def extract_text_from_txt(file_path: str) -> tuple[str | None, str]:
     """Извлекает текст из обычного текстового файла."""
     debug = []
-    for enc in ("utf-8", "cp1251", "cp866", "latin-1"):
-        try:
-            with open(file_path, "r", encoding=enc) as f:
-                text = f.read()
-            debug.append(f"[OK]Кодировка: {enc}")
-            return text, '\n'.join(debug)
-        except (UnicodeDecodeError, UnicodeError):
-            continue
+    info = {}
+    try:
+        text = ''.join(iter_text_blocks(file_path, info))
+    except (OSError, LookupError) as e:
+        debug.append(f"[ERROR]Ошибка чтения: {e}")
+        return None, '\n'.join(debug)
 
-    debug.append("[ERROR]Не удалось определить кодировку")
-    return None, '\n'.join(debug)
+    debug.append(f"[OK]Кодировка: {info.get('encoding', 'utf-8')}")
+    if "redetected_at" in info:
+        debug.append(f"[INFO]Начало файла — латиница, кодировка определена с байта {info['redetected_at']}")
+    replaced = info.get('replaced', 0)
+    if replaced:
+        debug.append(f"[WARN]Недекодируемых символов заменено: {replaced}")
+    return text, '\n'.join(debug)
+
+
+# Расширение файла → функция извлечения текста
+converters = {
+    '.pages': extract_text_from_pages,
+    '.docx': extract_text_from_docx,
+    '.fb2': extract_text_from_fb2,
+    '.epub': extract_text_from_epub,
+    '.txt': extract_text_from_txt,
+    '.md': extract_text_from_txt,
+    '.text': extract_text_from_txt,
+}
+
+
+# Форматы, которые можно читать потоково, абзац за абзацем
+paragraph_streams = {
+    '.docx': iter_docx_paragraphs,
+    '.fb2': iter_fb2_paragraphs,
+    '.epub': iter_epub_paragraphs,
+    '.txt': iter_txt_paragraphs,
+    '.md': iter_txt_paragraphs,
+    '.text': iter_txt_paragraphs,
+}
+
+
+def open_paragraph_stream(file_path: str, progress: dict | None = None):
+    """
+    Генератор абзацев файла для потокового синтеза или None, если
+    формат читается только целиком.
+    """
+    stream = paragraph_streams.get(Path(file_path).suffix.lower())
+    return stream(file_path, progress) if stream else None
 
 
 def convert_to_text(file_path: str) -> tuple[str | None, str]:
@@ -153,14 +682,6 @@ def convert_to_text(file_path: str) -> tuple[str | None, str]:
     """
     file_ext = Path(file_path).suffix.lower()
 
-    converters = {
-        '.pages': extract_text_from_pages,
-        '.docx': extract_text_from_docx,
-        '.txt': extract_text_from_txt,
-        '.md': extract_text_from_txt,
-        '.text': extract_text_from_txt,
-    }
-
     if file_ext in converters:
         return converters[file_ext](file_path)
     else:
@@ -0,0 +1,162 @@
+"""
+Потоковый экспорт PCM в итоговый формат: WAV напрямую, MP3/OGG/M4B через ffmpeg
+"""
+
+import os
+import re
+import subprocess
+import tempfile
+import wave
+from pathlib import Path
+
+import numpy as np
+from pydub.utils import get_encoder_name
+
+from config import SAMPLE_RATE
+from audio_processing import PcmWavWriter, iter_wav_blocks
+
+
+def _escape_ffmetadata(value: str) -> str:
+    return re.sub(r'([=;#\\\n])', r'\\\1', str(value))
+
+
+def _write_ffmetadata(chapters: list[tuple[str, int, int]]) -> str:
+    """Пишет файл FFMETADATA с главами (title, start_frame, end_frame)."""
+    fd, path = tempfile.mkstemp(prefix="chapters_", suffix=".txt")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        f.write(";FFMETADATA1\n")
+        for title, start, end in chapters:
+            f.write("[CHAPTER]\n")
+            f.write(f"TIMEBASE=1/{SAMPLE_RATE}\n")
+            f.write(f"START={start}\nEND={end}\n")
+            f.write(f"title={_escape_ffmetadata(title)}\n")
+    return path
+
+
+class FfmpegEncoder:
+    """
+    Кодирует PCM int16, поступающий блоками в stdin процесса ffmpeg.
+    chapters — метки глав (title, start_frame, end_frame) для MP4/M4B,
+    output_args — дополнительные параметры муксера (например, для HLS).
+    """
+
+    def __init__(
+        self,
+        output_path: Path,
+        fmt: dict,
+        tags: dict | None = None,
+        chapters: list[tuple[str, int, int]] | None = None,
+        output_args: list[str] | None = None,
+    ):
+        self.output_path = Path(output_path)
+        self.frames = 0
+        self._metadata_path = _write_ffmetadata(chapters) if chapters else None
+        cmd = [
+            get_encoder_name(), "-y", "-hide_banner", "-loglevel", "error",
+            "-f", "s16le", "-ar", str(SAMPLE_RATE), "-ac", "1", "-i", "pipe:0",
+        ]
+        if self._metadata_path:
+            cmd += ["-f", "ffmetadata", "-i", self._metadata_path,
+                    "-map", "0:a", "-map_chapters", "1"]
+        codec = fmt["params"].get("codec")
+        if codec:
+            cmd += ["-c:a", codec]
+        bitrate = fmt["params"].get("bitrate")
+        if bitrate:
+            cmd += ["-b:a", bitrate]
+        for key, value in (tags or {}).items():
+            cmd += ["-metadata", f"{key}={value}"]
+        if fmt["format"] == "mp3" and tags:
+            cmd += ["-id3v2_version", "4"]
+        cmd += list(output_args or [])
+        cmd += ["-f", fmt["format"], str(self.output_path)]
+
+        # stderr во временный файл, чтобы заполненный pipe не блокировал ffmpeg
+        self._stderr = tempfile.TemporaryFile()
+        self._proc = subprocess.Popen(
+            cmd, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=self._stderr,
+        )
+
+    def write(self, audio_int16: np.ndarray):
+        self._proc.stdin.write(audio_int16.astype("<i2", copy=False).tobytes())
+        self.frames += len(audio_int16)
+
+    def close(self):
+        if self._proc.stdin.closed:
+            return
+        self._proc.stdin.close()
+        returncode = self._proc.wait()
+        self._stderr.seek(0)
+        err = self._stderr.read().decode("utf-8", errors="ignore").strip()
+        self._stderr.close()
+        self._remove_metadata()
+        if returncode != 0:
+            raise RuntimeError(f"ffmpeg завершился с кодом {returncode}: {err[-300:]}")
+
+    def _remove_metadata(self):
+        if self._metadata_path:
+            Path(self._metadata_path).unlink(missing_ok=True)
+            self._metadata_path = None
+
+    def abort(self):
+        """Прерывает кодирование и удаляет недописанный файл."""
+        if not self._proc.stdin.closed:
+            self._proc.stdin.close()
+        self._proc.kill()
+        self._proc.wait()
+        self._stderr.close()
+        self._remove_metadata()
+        self.output_path.unlink(missing_ok=True)
+
+
+class WavEncoder:
+    """Пишет PCM int16 прямо в итоговый WAV без перекодирования."""
+
+    def __init__(self, output_path: Path):
+        self.output_path = Path(output_path)
+        self.frames = 0
+        self._writer = PcmWavWriter(self.output_path)
+
+    def write(self, audio_int16: np.ndarray):
+        self._writer.write(audio_int16.astype("<i2", copy=False).tobytes())
+        self.frames += len(audio_int16)
+
+    def close(self):
+        self._writer.close()
+
+    def abort(self):
+        self._writer.close()
+        self.output_path.unlink(missing_ok=True)
+
+
+def open_encoder(output_path: Path, fmt: dict, tags: dict | None = None):
+    """Открывает потоковый кодировщик для формата из config.FORMATS."""
+    if fmt["format"] == "wav":
+        return WavEncoder(output_path)
+    return FfmpegEncoder(output_path, fmt, tags)
+
+
+def mux_chapters(parts: list[tuple[str, Path]], output_path: Path, fmt: dict, tags: dict) -> float:
+    """
+    Склеивает WAV-файлы глав (title, path) в один файл с метками глав.
+    PCM читается блоками, поэтому память не зависит от длины книги.
+    Возвращает длительность в секундах.
+    """
+    chapters = []
+    start = 0
+    for title, path in parts:
+        with wave.open(str(path), "rb") as wav_file:
+            frames = wav_file.getnframes()
+        chapters.append((title, start, start + frames))
+        start += frames
+
+    encoder = FfmpegEncoder(output_path, fmt, tags, chapters=chapters)
+    try:
+        for _, path in parts:
+            for block in iter_wav_blocks(path):
+                encoder.write(block)
+        encoder.close()
+    except BaseException:
+        encoder.abort()
+        raise
+    return encoder.frames / SAMPLE_RATE
@@ -0,0 +1,264 @@
+"""
+Оценка времени синтеза по замерам прошлых заданий
+
+Время фрагмента на этой машине приближается прямой
+inference_s ≈ a + b·chars отдельно для каждого голоса (и общей для всех
+голосов, пока замеров голоса мало). Модель строится по таймингам
+фрагментов из записей заданий (RECORDS_DIR) с той же конфигурацией
+процессора и воркеров и уточняется после каждого завершённого задания.
+Оценка книги — сумма по её фрагментам, делённая на число воркеров, с
+90% интервалом из разброса остатков и неопределённости коэффициентов.
+Во время синтеза LiveEta смешивает эту оценку с фактической скоростью.
+"""
+
+import json
+import math
+import os
+import threading
+import time
+
+from config import (
+    RECORDS_DIR, TTS_INFERENCE_MODE, TTS_ONEDNN, TTS_QUANTIZE, TTS_THREADS, TTS_WORKER_THREADS,
+    TTS_WORKERS,
+)
+
+# Оценка до первых замеров: секунд синтеза на символ и её разброс
+_DEFAULT_SECONDS_PER_CHAR = 0.02
+_DEFAULT_RANGE = (0.4, 2.5)
+# Сколько последних записей читать при старте
+_HISTORY_RECORDS = 200
+# Вес прошлых заданий уменьшается с каждым новым: модель следует за машиной
+_DECAY = 0.97
+# Меньше замеров — голос оценивается общей моделью
+_MIN_SAMPLES = 10
+# 90% интервал; не уже ±10% — сказываются нагрузка машины и кодирование
+_Z = 1.645
+_MIN_RELATIVE_RANGE = 0.1
+# Накладные расходы пула сверх чистого синтеза (сглаживание и пределы)
+_OVERHEAD_ALPHA = 0.3
+_OVERHEAD_LIMITS = (0.5, 4.0)
+# Сколько фрагментов собственного замера весят как оценка модели
+_LIVE_PRIOR_CHUNKS = 4
+# Псевдоголос для общей модели
+_ALL = "*"
+
+
+def hardware_key() -> str:
+    """Конфигурация, от которой зависит скорость: ядра, воркеры, потоки и режим инференса."""
+    threads = TTS_WORKER_THREADS if TTS_WORKERS > 1 else TTS_THREADS
+    key = f"{os.cpu_count() or 1}cpu-{TTS_WORKERS}x{threads}"
+    if TTS_QUANTIZE != "none":
+        key += f"-{TTS_QUANTIZE}"
+    if TTS_INFERENCE_MODE:
+        key += "-im"
+    if TTS_ONEDNN:
+        key += "-onednn"
+    return key
+
+
+def format_duration(seconds: float) -> str:
+    if seconds < 60:
+        return f"{seconds:.0f} сек"
+    if seconds < 3600:
+        return f"{seconds / 60:.0f} мин"
+    return f"{seconds / 3600:.1f} ч"
+
+
+def format_range(estimate: dict) -> str:
+    """«~12 мин (9–15 мин)» для отчётов и журнала задания."""
+    low, high = format_duration(estimate["low"]), format_duration(estimate["high"])
+    low_value, low_unit = low.split(" ")
+    if high.endswith(f" {low_unit}"):
+        low = low_value
+    return f"~{format_duration(estimate['seconds'])} ({low}–{high})"
+
+
+class _LineFit:
+    """Взвешенные суммы для наименьших квадратов y = a + b·x."""
+
+    def __init__(self):
+        self.n = self.sx = self.sy = self.sxx = self.sxy = self.syy = 0.0
+
+    def decay(self, factor: float):
+        for name in ("n", "sx", "sy", "sxx", "sxy", "syy"):
+            setattr(self, name, getattr(self, name) * factor)
+
+    def add(self, x: float, y: float):
+        self.n += 1
+        self.sx += x
+        self.sy += y
+        self.sxx += x * x
+        self.sxy += x * y
+        self.syy += y * y
+
+    def solve(self) -> dict | None:
+        """
+        Коэффициенты, дисперсия остатков и ковариация коэффициентов.
+        Если длины фрагментов почти одинаковы или свободный член
+        выходит отрицательным — прямая через ноль.
+        """
+        if self.n < 3 or self.sxx <= 0:
+            return None
+        det = self.n * self.sxx - self.sx ** 2
+        a = b = None
+        if det > 1e-3 * self.n * self.sxx:
+            b = (self.n * self.sxy - self.sx * self.sy) / det
+            a = (self.sy - b * self.sx) / self.n
+        if a is None or a < 0 or b <= 0:
+            a, b, det = 0.0, self.sxy / self.sxx, None
+            if b <= 0:
+                return None
+        sse = (self.syy - 2 * a * self.sy - 2 * b * self.sxy
+               + a * a * self.n + 2 * a * b * self.sx + b * b * self.sxx)
+        variance = max(sse, 0.0) / max(self.n - 2, 1.0)
+        return {"a": a, "b": b, "variance": variance, "det": det}
+
+    def predict(self, fit: dict, chunks: int, chars: int) -> tuple[float, float]:
+        """Сумма времени chunks фрагментов общей длиной chars и её дисперсия."""
+        seconds = fit["a"] * chunks + fit["b"] * chars
+        if fit["det"] is None:
+            params = chars ** 2 / self.sxx
+        else:
+            params = (self.sxx * chunks ** 2 - 2 * self.sx * chunks * chars
+                      + self.n * chars ** 2) / fit["det"]
+        return seconds, fit["variance"] * (params + chunks)
+
+
+class ThroughputModel:
+    """
+    Модели скорости по голосам для текущей конфигурации (hardware_key).
+    Записи прошлых заданий читаются при первом обращении; observe()
+    добавляет только что завершённое задание.
+    """
+
+    def __init__(self):
+        self.hardware = hardware_key()
+        self._lock = threading.Lock()
+        self._fits: dict[str, _LineFit] = {}
+        self.overhead = 1.0
+        self._loaded = False
+
+    def _ensure_loaded(self):
+        # Вызывается под блокировкой
+        if self._loaded:
+            return
+        self._loaded = True
+        if not RECORDS_DIR.exists():
+            return
+        paths = sorted(RECORDS_DIR.glob("*.json"))[-_HISTORY_RECORDS:]
+        for path in paths:
+            try:
+                data = json.loads(path.read_text(encoding="utf-8"))
+            except (OSError, ValueError):
+                continue
+            self._observe(data)
+
+    def observe(self, record: dict):
+        """Добавляет тайминги записи задания (JobRecord.to_dict())."""
+        with self._lock:
+            self._ensure_loaded()
+            self._observe(record)
+
+    def _observe(self, record: dict):
+        if record.get("params", {}).get("hardware") != self.hardware:
+            return
+        timings = [
+            c for c in record.get("chunk_timings", [])
+            if c.get("inference_s") and not c.get("cached") and "error" not in c
+        ]
+        if not timings:
+            return
+        for speaker in (record.get("speaker"), _ALL):
+            fit = self._fits.get(speaker)
+            if fit is None:
+                fit = self._fits[speaker] = _LineFit()
+            fit.decay(_DECAY)
+            for c in timings:
+                fit.add(c["chars"], c["inference_s"])
+
+        # Накладные расходы — только по заданиям, которые шли без соседей
+        # и почти без кеша: иначе время делилось с другими
+        span = (record.get("finished") or 0) - (record.get("created") or 0)
+        span -= (record.get("queue_wait_s") or 0) + (record.get("encode_s") or 0)
+        workers = min(TTS_WORKERS, len(timings))
+        if (record.get("status") == "ok" and record.get("max_active_jobs") == 1
+                and len(timings) >= _MIN_SAMPLES
+                and len(timings) >= 0.9 * len(record["chunk_timings"]) and span > 0):
+            ratio = span / (sum(c["inference_s"] for c in timings) / workers)
+            ratio = min(max(ratio, _OVERHEAD_LIMITS[0]), _OVERHEAD_LIMITS[1])
+            self.overhead += _OVERHEAD_ALPHA * (ratio - self.overhead)
+
+    def samples(self, speaker: str) -> int:
+        with self._lock:
+            self._ensure_loaded()
+            fit = self._fits.get(speaker)
+            return round(fit.n) if fit else 0
+
+    def estimate(self, chunk_chars: list[int], speaker: str | None = None) -> dict:
+        """
+        Время синтеза фрагментов длиной chunk_chars: {"seconds", "low",
+        "high", "source", "samples"}. source — "speaker" (замеры голоса),
+        "all" (замеры всех голосов) или "default" (замеров нет).
+        """
+        chunks, chars = len(chunk_chars), sum(chunk_chars)
+        workers = max(1, min(TTS_WORKERS, chunks))
+        with self._lock:
+            self._ensure_loaded()
+            for source, key in (("speaker", speaker), ("all", _ALL)):
+                line = self._fits.get(key) if key else None
+                if line is None or line.n < _MIN_SAMPLES:
+                    continue
+                fit = line.solve()
+                if fit is None:
+                    continue
+                seconds, variance = line.predict(fit, chunks, chars)
+                scale = self.overhead / workers
+                seconds *= scale
+                half = max(_Z * math.sqrt(variance) * scale, _MIN_RELATIVE_RANGE * seconds)
+                return {
+                    "seconds": seconds, "low": max(seconds - half, 0.0), "high": seconds + half,
+                    "source": source, "samples": round(line.n),
+                }
+        seconds = _DEFAULT_SECONDS_PER_CHAR * chars / workers
+        return {
+            "seconds": seconds, "low": seconds * _DEFAULT_RANGE[0],
+            "high": seconds * _DEFAULT_RANGE[1], "source": "default", "samples": 0,
+        }
+
+
+class LiveEta:
+    """
+    Оставшееся время выполняющегося задания. До первых фрагментов —
+    оценка модели; дальше фактическая скорость (с первого отчёта о
+    прогрессе, поэтому продолжение задания и попадания в кеш не
+    искажают её) получает всё больший вес.
+    """
+
+    def __init__(self, estimate: dict, chunks: int):
+        self.predicted = estimate["seconds"]
+        self.chunks = max(chunks, 1)
+        self._start: tuple[float, float] | None = None
+
+    def remaining(self, fraction: float) -> float:
+        now = time.monotonic()
+        if self._start is None:
+            self._start = (now, fraction)
+        started_at, started_fraction = self._start
+        done = fraction - started_fraction
+        rate = self.predicted
+        if done > 0:
+            weight = done * self.chunks / (done * self.chunks + _LIVE_PRIOR_CHUNKS)
+            rate = weight * (now - started_at) / done + (1 - weight) * self.predicted
+        return rate * max(1.0 - fraction, 0.0)
+
+    def wrap(self, on_progress):
+        """on_progress(fraction, desc) с оставшимся временем в описании."""
+        def with_eta(fraction: float, desc: str):
+            left = self.remaining(fraction)
+            if fraction < 1.0:
+                desc = f"{desc.rstrip('. ')}, осталось ~{format_duration(left)}"
+            on_progress(fraction, desc)
+        return with_eta
+
+
+throughput = ThroughputModel()
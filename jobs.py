@@ -0,0 +1,291 @@
+"""
+Возобновляемые задания синтеза: манифест фрагментов и временный WAV на диске
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from pathlib import Path
+
+from config import JOBS_DIR, SAMPLE_RATE
+from audio_processing import PcmWavWriter
+
+_active_jobs: set[str] = set()
+_active_lock = threading.Lock()
+_controls: dict[str, "JobControl"] = {}
+
+
+class JobInterrupted(Exception):
+    """Задание остановлено пользователем; status — "cancelled" или "paused"."""
+
+    status = "interrupted"
+
+
+class JobCancelled(JobInterrupted):
+    """Отмена: временные файлы задания удаляются."""
+
+    status = "cancelled"
+
+
+class JobPaused(JobInterrupted):
+    """Пауза: манифест и записанная часть остаются для продолжения."""
+
+    status = "paused"
+
+
+class JobControl:
+    """
+    Управление запущенным синтезом. Конвейер вызывает check() между
+    фрагментами: после pause() или cancel() он бросает JobPaused или
+    JobCancelled, оставшиеся фрагменты снимаются с очереди модели.
+    resume_args — именованные аргументы запуска, чтобы продолжить после паузы.
+    """
+
+    RUNNING, PAUSED, CANCELLED = "running", "paused", "cancelled"
+
+    def __init__(self):
+        self.state = self.RUNNING
+        self.resume_args: dict | None = None
+
+    def pause(self):
+        if self.state == self.RUNNING:
+            self.state = self.PAUSED
+
+    def cancel(self):
+        self.state = self.CANCELLED
+
+    def check(self):
+        if self.state == self.CANCELLED:
+            raise JobCancelled("[INFO]Задание отменено.")
+        if self.state == self.PAUSED:
+            raise JobPaused("[INFO]Задание приостановлено.")
+
+
+def register_control(key: str | None) -> JobControl:
+    """Новое управление для сессии key (вкладки интерфейса); заменяет прежнее."""
+    control = JobControl()
+    if key:
+        with _active_lock:
+            _controls[key] = control
+    return control
+
+
+def get_control(key: str | None) -> JobControl | None:
+    with _active_lock:
+        return _controls.get(key) if key else None
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:16]
+
+
+def source_fingerprint(path) -> str:
+    """Отпечаток исходного файла для потоковых заданий: путь, размер и mtime."""
+    path = Path(path).resolve()
+    st = path.stat()
+    return f"{path}:{st.st_size}:{st.st_mtime_ns}"
+
+
+def make_job_id(text: str, params: dict) -> str:
+    """Одинаковый текст и параметры звучания дают одинаковый id задания."""
+    payload = json.dumps(
+        {"text": text, "sample_rate": SAMPLE_RATE, **params},
+        ensure_ascii=False,
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+class SynthesisJob:
+    """
+    Каталог задания: text.txt (исходный текст), manifest.jsonl
+    (заголовок + строка на каждый записанный фрагмент) и audio.wav.
+    Строка манифеста пишется только после fsync аудио, поэтому
+    смещение в ней всегда указывает на целые данные.
+    Книга по главам — родительское задание без аудио: в заголовке
+    "parts" (id заданий глав), в манифесте — строка на готовую главу;
+    у заданий глав в заголовке "parent" и "chapter".
+    """
+
+    def __init__(self, job_id: str):
+        self.job_id = job_id
+        self.dir = JOBS_DIR / job_id
+        self.manifest_path = self.dir / "manifest.jsonl"
+        self.text_path = self.dir / "text.txt"
+        self.wav_path = self.dir / "audio.wav"
+        self.header: dict = {}
+        self.entries: list[dict] = []
+        self._manifest = None
+
+    def exists(self) -> bool:
+        return self.manifest_path.exists()
+
+    def load(self):
+        """Читает манифест; обрезанную последнюю строку игнорирует."""
+        self.header, self.entries = {}, []
+        with open(self.manifest_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    break
+                if "job" in record:
+                    self.header = record
+                else:
+                    self.entries.append(record)
+
+    def create(self, text: str | None, header: dict):
+        """Без text (потоковый источник) задание продолжается только повторным запуском с тем же файлом."""
+        self.dir.mkdir(parents=True, exist_ok=True)
+        if text is not None:
+            self.text_path.write_text(text, encoding="utf-8")
+        self.header = {"job": self.job_id, "created": time.time(), **header}
+        self.entries = []
+        with open(self.manifest_path, "w", encoding="utf-8") as f:
+            f.write(json.dumps(self.header, ensure_ascii=False) + "\n")
+
+    def committed_prefix(self, chunks: list[str]) -> list[dict]:
+        """Записи манифеста, совпадающие с началом списка фрагментов."""
+        valid = []
+        for entry in self.entries:
+            i = entry["i"]
+            if i != len(valid) or i >= len(chunks) or entry["hash"] != text_hash(chunks[i]):
+                break
+            valid.append(entry)
+        return valid
+
+    def open(self, chunks: list[str], with_audio: bool = True) -> tuple[PcmWavWriter | None, list[dict]]:
+        """
+        Открывает WAV для записи с первого отсутствующего фрагмента.
+        Возвращает писатель и список уже подтверждённых записей.
+        Без with_audio (потоковый экспорт) временного WAV нет и задание
+        начинается заново — готовые фрагменты берутся из кеша.
+        """
+        if not with_audio:
+            self.wav_path.unlink(missing_ok=True)
+            self._rewrite_manifest([])
+            self._manifest = open(self.manifest_path, "a", encoding="utf-8")
+            return None, []
+
+        done = self.committed_prefix(chunks)
+        offset = done[-1]["offset"] if done else None
+        if offset is not None and (not self.wav_path.exists() or self.wav_path.stat().st_size < offset):
+            done, offset = [], None
+        writer = PcmWavWriter(self.wav_path, offset)
+        self._rewrite_manifest(done)
+        self._manifest = open(self.manifest_path, "a", encoding="utf-8")
+        return writer, done
+
+    def _rewrite_manifest(self, entries: list[dict]):
+        tmp_path = self.manifest_path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(json.dumps(self.header, ensure_ascii=False) + "\n")
+            for entry in entries:
+                f.write(json.dumps(entry) + "\n")
+        os.replace(tmp_path, self.manifest_path)
+        self.entries = list(entries)
+
+    def commit(self, index: int, chunk: str, offset: int, failed: bool = False):
+        entry = {"i": index, "hash": text_hash(chunk), "offset": offset}
+        if failed:
+            entry["failed"] = True
+        self._manifest.write(json.dumps(entry) + "\n")
+        self._manifest.flush()
+        self.entries.append(entry)
+
+    def record_part(self, index: int, chunks: int, **extra):
+        """Строка манифеста родительского задания: глава index готова."""
+        if self._manifest is None:
+            self._manifest = open(self.manifest_path, "a", encoding="utf-8")
+        entry = {"part": index, "chunks": chunks, **extra}
+        self._manifest.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        self._manifest.flush()
+        self.entries.append(entry)
+
+    def parts_done(self) -> dict[int, dict]:
+        """Готовые главы родительского задания (последняя запись по каждой)."""
+        return {e["part"]: e for e in self.entries if "part" in e}
+
+    def close(self):
+        if self._manifest is not None:
+            self._manifest.close()
+            self._manifest = None
+
+    def remove(self):
+        self.close()
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def read_text(self) -> str:
+        return self.text_path.read_text(encoding="utf-8")
+
+
+def acquire_job(job_id: str) -> bool:
+    """Помечает задание как выполняемое; False — уже выполняется."""
+    with _active_lock:
+        if job_id in _active_jobs:
+            return False
+        _active_jobs.add(job_id)
+        return True
+
+
+def release_job(job_id: str):
+    with _active_lock:
+        _active_jobs.discard(job_id)
+
+
+def is_job_active(job_id: str) -> bool:
+    with _active_lock:
+        return job_id in _active_jobs
+
+
+def list_interrupted_jobs() -> list[dict]:
+    """
+    Задания с манифестом на диске, которые сейчас не выполняются.
+    Задания глав не показываются — продолжается книга целиком.
+    """
+    jobs = []
+    if not JOBS_DIR.exists():
+        return jobs
+    for manifest_path in JOBS_DIR.glob("*/manifest.jsonl"):
+        job = SynthesisJob(manifest_path.parent.name)
+        with _active_lock:
+            if job.job_id in _active_jobs:
+                continue
+        try:
+            job.load()
+        except OSError:
+            continue
+        # Потоковые задания без text.txt продолжаются повторным запуском CLI
+        if not job.header or not job.text_path.exists() or "parent" in job.header:
+            continue
+        done = len(job.entries)
+        if "parts" in job.header:
+            done = _book_progress(job)
+        jobs.append({
+            "job_id": job.job_id,
+            "title": job.header.get("title") or "audiobook",
+            "done": done,
+            "total": job.header.get("total", 0),
+            "updated": manifest_path.stat().st_mtime,
+        })
+    jobs.sort(key=lambda j: j["updated"], reverse=True)
+    return jobs
+
+
+def _book_progress(book: SynthesisJob) -> int:
+    """Фрагментов готово у книги по главам: готовые главы и начатые задания глав."""
+    finished = book.parts_done()
+    done = sum(e["chunks"] for e in finished.values())
+    for i, part_id in enumerate(book.header["parts"]):
+        part = SynthesisJob(part_id)
+        if i in finished or not part.exists():
+            continue
+        try:
+            part.load()
+        except OSError:
+            continue
+        done += len(part.entries)
+    return done
@@ -0,0 +1,160 @@
+"""
+Прогрессивное прослушивание: готовое аудио публикуется короткими
+сегментами, пока книга ещё синтезируется
+"""
+
+import io
+import queue
+import shutil
+import time
+import wave
+
+import numpy as np
+
+from config import LIVE_DIR, LIVE_PLAYER_MAX_SEC, LIVE_SEGMENT_SEC, SAMPLE_RATE
+from encoder import FfmpegEncoder
+
+# HLS-сегменты: AAC в MPEG-TS понимают hls.js, Safari и любые HLS-плееры
+_HLS_FORMAT = {"format": "hls", "ext": ".m3u8", "params": {"codec": "aac", "bitrate": "96k"}}
+# Каталоги прошлых трансляций удаляются через сутки
+_LIVE_KEEP_SECONDS = 24 * 3600
+
+
+def _wav_bytes(pcm: np.ndarray) -> bytes:
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav_file:
+        wav_file.setnchannels(1)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(SAMPLE_RATE)
+        wav_file.writeframes(pcm.astype("<i2", copy=False).tobytes())
+    return buffer.getvalue()
+
+
+def cleanup_live(max_age: float = _LIVE_KEEP_SECONDS):
+    """Удаляет каталоги трансляций старше max_age секунд."""
+    if not LIVE_DIR.exists():
+        return
+    cutoff = time.time() - max_age
+    for path in LIVE_DIR.iterdir():
+        try:
+            if path.is_dir() and path.stat().st_mtime < cutoff:
+                shutil.rmtree(path, ignore_errors=True)
+        except OSError:
+            continue
+
+
+class LiveStream:
+    """
+    Принимает итоговый PCM int16 (после изменения скорости) по мере
+    синтеза и публикует его двумя путями:
+    • WAV-сегменты по segment_sec в очередь segments — их забирает
+      потоковый плеер Gradio (не больше player_max_sec секунд: Gradio
+      держит сегменты в памяти сессии); None в очереди — конец;
+    • HLS-плейлист LIVE_DIR/<id>/index.m3u8 с AAC-сегментами, который
+      ffmpeg пишет непрерывно — доступен любому HTTP-клиенту через
+      /live/<id>/index.m3u8 на порту метрик.
+    Первый сегмент уходит сразу с первым фрагментом, не дожидаясь полной
+    длины; время до него (от started_at) — time-to-first-audio.
+    """
+
+    def __init__(
+        self,
+        stream_id: str,
+        started_at: float | None = None,
+        segment_sec: float = LIVE_SEGMENT_SEC,
+        player_max_sec: int = LIVE_PLAYER_MAX_SEC,
+        on_first_audio=None,
+    ):
+        self.stream_id = stream_id
+        self.started_at = started_at or time.time()
+        self.first_audio_s: float | None = None
+        self.segments: queue.Queue = queue.Queue()
+        self.frames = 0
+        self._segment_frames = max(1, int(segment_sec * SAMPLE_RATE))
+        self._player_frames_left = player_max_sec * SAMPLE_RATE if player_max_sec > 0 else None
+        self.on_first_audio = on_first_audio
+        self._pending: list[np.ndarray] = []
+        self._pending_frames = 0
+        self._closed = False
+
+        cleanup_live()
+        self.directory = LIVE_DIR / stream_id
+        self.directory.mkdir(parents=True, exist_ok=True)
+        try:
+            self._hls = FfmpegEncoder(
+                self.directory / "index.m3u8", _HLS_FORMAT,
+                output_args=[
+                    "-hls_time", f"{segment_sec:g}",
+                    "-hls_playlist_type", "event",
+                    "-hls_segment_filename", str(self.directory / "seg_%05d.ts"),
+                ],
+            )
+        except OSError as e:
+            # Без ffmpeg остаётся только плеер интерфейса
+            print(f"[WARN] HLS-трансляция недоступна: {e}")
+            self._hls = None
+
+    @property
+    def playlist(self) -> str | None:
+        """Путь плейлиста для HTTP-клиентов (относительно порта метрик)."""
+        return f"/live/{self.stream_id}/index.m3u8" if self._hls else None
+
+    def write(self, audio_int16: np.ndarray):
+        if self._closed or not len(audio_int16):
+            return
+        self.frames += len(audio_int16)
+        if self._hls:
+            try:
+                self._hls.write(audio_int16)
+            except OSError as e:
+                print(f"[WARN] HLS-трансляция прервана: {e}")
+                self._hls.abort()
+                self._hls = None
+        self._pending.append(audio_int16)
+        self._pending_frames += len(audio_int16)
+        if self.first_audio_s is None:
+            self._publish()
+        while self._pending_frames >= self._segment_frames:
+            self._publish()
+
+    def _publish(self):
+        pcm = np.concatenate(self._pending) if len(self._pending) > 1 else self._pending[0]
+        if self.first_audio_s is None:
+            segment, rest = pcm, pcm[:0]
+            self.first_audio_s = time.time() - self.started_at
+            if self.on_first_audio:
+                self.on_first_audio(self.first_audio_s)
+        else:
+            segment, rest = pcm[:self._segment_frames], pcm[self._segment_frames:]
+        self._pending = [rest] if len(rest) else []
+        self._pending_frames = len(rest)
+
+        if self._player_frames_left is None:
+            self.segments.put(_wav_bytes(segment))
+        elif self._player_frames_left > 0:
+            segment = segment[:self._player_frames_left]
+            self._player_frames_left -= len(segment)
+            self.segments.put(_wav_bytes(segment))
+
+    def close(self):
+        """Публикует остаток и завершает плейлист (#EXT-X-ENDLIST)."""
+        if self._closed:
+            return
+        if self._pending_frames:
+            self._publish()
+        self._closed = True
+        self.segments.put(None)
+        if self._hls:
+            try:
+                self._hls.close()
+            except RuntimeError as e:
+                print(f"[WARN] HLS-трансляция: {e}")
+
+    def abort(self):
+        """Прерывает трансляцию и удаляет её сегменты."""
+        self._closed = True
+        self.segments.put(None)
+        if self._hls:
+            self._hls.abort()
+            self._hls = None
+        shutil.rmtree(self.directory, ignore_errors=True)
@@ -0,0 +1,16 @@
+"""
+Предзагрузка модели в процессе forkserver
+
+Модуль импортирует forkserver (см. workers.get_executor): модель
+загружается в нём один раз без прогрева, а воркеры, порождённые
+через fork, наследуют страницы с весами copy-on-write. Веса при
+синтезе только читаются, поэтому N воркеров занимают примерно одну
+копию модели плюс собственные активации.
+
+Прогрев здесь не выполняется намеренно: forkserver не должен запускать
+пул потоков OpenMP до fork — в дочерних процессах он был бы неработоспособен.
+"""
+
+import tts_model
+
+tts_model.start_loading(num_threads=1, warmup=False, background=False)
@@ -0,0 +1,877 @@
+"""
+Конвейер синтеза без зависимости от Gradio: текст → фрагменты → аудиофайл
+"""
+
+import time
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from itertools import chain, islice
+from pathlib import Path
+
+import numpy as np
+
+from config import (
+    SAMPLE_RATE, OUTPUT_DIR, FORMATS, STREAM_EXPORT, CHAPTER_WORKERS, CHAPTER_RETRIES,
+    AUDIO_POSTPROCESS, LOUDNESS_TARGET_LUFS, EDGE_SILENCE_MS,
+)
+from workers import APPLY_TTS_FLAGS, format_memory_report, render_chunks
+from chunk_cache import ChunkMemo, model_fingerprint, new_chunk_memo
+from jobs import (
+    JobCancelled, JobControl, JobInterrupted, SynthesisJob, make_job_id, acquire_job, release_job,
+    is_job_active,
+)
+from text_processing import split_into_chunks, iter_chunks, detect_chapters
+from audio_processing import iter_wav_blocks, make_post_processor, make_speed_processor
+from encoder import open_encoder, mux_chapters
+from telemetry import JobRecord
+from eta import LiveEta, format_range, hardware_key, throughput
+from live import LiveStream
+from storage import touch
+
+
+def create_archive_with_files(files: list, log_file: str, archive_path: Path | None = None) -> str:
+    """
+    Создает ZIP-архив со всеми файлами и логом.
+    Возвращает путь к архиву.
+    """
+    if archive_path is None:
+        timestamp = time.strftime("%Y%m%d_%H%M%S")
+        archive_path = OUTPUT_DIR / f"audiobook_bundle_{timestamp}.zip"
+
+    with zipfile.ZipFile(archive_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
+        for file_path in files:
+            zipf.write(file_path, Path(file_path).name)
+        if log_file and Path(log_file).exists():
+            zipf.write(log_file, Path(log_file).name)
+
+    return str(archive_path)
+
+
+class SynthesisError(Exception):
+    """Фатальная ошибка задания; текст сообщения показывается в логе."""
+
+
+def render_text(
+    text: str,
+    speaker: str,
+    pause_between_sentences: float,
+    speed: float,
+    preserve_pitch: bool,
+    fmt: dict,
+    output_path: Path,
+    tags: dict,
+    job_header: dict,
+    log_lines: list[str],
+    on_progress=None,
+    record: JobRecord | None = None,
+    part: int | None = None,
+    live: LiveStream | None = None,
+    memo: ChunkMemo | None = None,
+    tts_flags: dict = APPLY_TTS_FLAGS,
+    control: JobControl | None = None,
+    stream_export: bool = STREAM_EXPORT,
+) -> dict:
+    """
+    Синтезирует текст в итоговый файл output_path с потоковой записью на диск.
+    Не зависит от Gradio: прогресс сообщается через on_progress(done, total),
+    предупреждения дописываются в log_lines, тайминги фрагментов — в record
+    (part — номер главы). Готовое аудио по ходу синтеза уходит в live,
+    повторы фрагментов берутся из memo (общей для всех глав книги).
+    tts_flags — разметка apply_tts (ANNOTATED_TTS_FLAGS для текста с
+    ударениями из accents). control проверяется между фрагментами:
+    пауза или отмена бросают JobPaused / JobCancelled. stream_export=False —
+    запись через временный WAV задания даже при STREAM_EXPORT, чтобы
+    после паузы продолжить с места остановки.
+    Возвращает статистику задания; при фатальной ошибке бросает SynthesisError.
+    """
+    all_chunks = split_into_chunks(text, pause_between_sentences)
+    if not all_chunks:
+        raise SynthesisError("[ERROR]Текст не содержит предложений.")
+    log_lines.insert(0, f"[INFO]Найдено фрагментов: {len(all_chunks)}")
+
+    # Id зависит только от того, что влияет на звук
+    job_id = make_job_id(text, _sound_params(speaker, pause_between_sentences, tts_flags))
+    return _render_job(
+        job_id, text, all_chunks, len(all_chunks), speaker, pause_between_sentences,
+        speed, preserve_pitch, fmt, output_path, tags, job_header, log_lines,
+        on_progress, record, part, live, memo, tts_flags, control, stream_export,
+    )
+
+
+def render_stream(
+    paragraphs,
+    source_id: str,
+    speaker: str,
+    pause_between_sentences: float,
+    speed: float,
+    preserve_pitch: bool,
+    fmt: dict,
+    output_path: Path,
+    tags: dict,
+    job_header: dict,
+    log_lines: list[str],
+    on_progress=None,
+    record: JobRecord | None = None,
+    memo: ChunkMemo | None = None,
+    tts_flags: dict = APPLY_TTS_FLAGS,
+) -> dict:
+    """
+    Как render_text, но текст приходит потоком абзацев (см.
+    converters.open_paragraph_stream): синтез начинается с первых абзацев,
+    пока остальной документ ещё разбирается, и текст книги целиком
+    в памяти не держится. Число фрагментов заранее неизвестно —
+    on_progress(done, None). Id задания строится по source_id (например,
+    отпечатку исходного файла), поэтому повторный запуск продолжает
+    прерванное задание.
+    """
+    job_id = stream_job_id(source_id, speaker, pause_between_sentences, tts_flags)
+    chars = [0]
+
+    def counted():
+        for paragraph in paragraphs:
+            chars[0] += len(paragraph)
+            yield paragraph
+
+    stats = _render_job(
+        job_id, None, iter_chunks(counted(), pause_between_sentences), None, speaker,
+        pause_between_sentences, speed, preserve_pitch, fmt, output_path, tags,
+        {**job_header, "source": source_id}, log_lines, on_progress, record, None, None, memo,
+        tts_flags, None, STREAM_EXPORT,
+    )
+    log_lines.insert(0, f"[INFO]Потоковое чтение: {stats['chunks']} фрагментов")
+    stats["chars"] = chars[0]
+    return stats
+
+
+def book_job_ids(
+    text: str, speaker: str, pause_between_sentences: float, fmt: dict, per_chapter: bool,
+    tts_flags: dict = APPLY_TTS_FLAGS,
+) -> list[str]:
+    """
+    Id заданий (каталогов _jobs), которые создаст render_book: книга
+    по главам и по одному на главу или одно на книгу. Нужны до старта, чтобы резерв места
+    (storage) защитил от вытеснения прерванное задание, которое
+    сейчас продолжится.
+    """
+    chapters = detect_chapters(text) if per_chapter or fmt.get("chapters") else []
+    params = _sound_params(speaker, pause_between_sentences, tts_flags)
+    if len(chapters) > 1:
+        return [_book_job_id(text, params)] + [
+            make_job_id(c["text"], params) for c in chapters
+        ]
+    return [make_job_id(text, params)]
+
+
+def _book_job_id(text: str, params: dict) -> str:
+    # Отдельный id: та же книга одним файлом — другое задание
+    return make_job_id(text, {**params, "chapters": True})
+
+
+def _open_book_job(
+    text: str, chapters: list[dict], speaker: str, pause_between_sentences: float,
+    tts_flags: dict, job_header: dict,
+) -> SynthesisJob:
+    """
+    Родительское задание книги по главам: хранит текст книги целиком и
+    id заданий глав, чтобы прерванная книга продолжалась как одно целое.
+    Возвращается занятым (acquire_job); освобождает вызывающий.
+    """
+    params = _sound_params(speaker, pause_between_sentences, tts_flags)
+    book = SynthesisJob(_book_job_id(text, params))
+    if not acquire_job(book.job_id):
+        raise SynthesisError("[ERROR]Это задание уже выполняется.")
+    try:
+        if book.exists():
+            book.load()
+            touch(book.dir)
+        else:
+            book.create(text, {
+                **job_header,
+                "parts": [make_job_id(c["text"], params) for c in chapters],
+                "total": sum(len(split_into_chunks(c["text"], pause_between_sentences)) for c in chapters),
+            })
+    except BaseException:
+        release_job(book.job_id)
+        raise
+    return book
+
+
+def stream_job_id(
+    source_id: str, speaker: str, pause_between_sentences: float, tts_flags: dict = APPLY_TTS_FLAGS,
+) -> str:
+    """Id задания render_stream / render_book_stream для источника source_id."""
+    return make_job_id(source_id, _sound_params(speaker, pause_between_sentences, tts_flags))
+
+
+def _sound_params(speaker: str, pause_between_sentences: float, tts_flags: dict) -> dict:
+    params = {
+        "speaker": speaker,
+        "pause": pause_between_sentences,
+        "flags": tts_flags,
+        "model": model_fingerprint(),
+    }
+    # Постобработка меняет уже записанную часть — задание с другими
+    # настройками не должно продолжать прежний файл
+    if AUDIO_POSTPROCESS:
+        params["post"] = {"lufs": LOUDNESS_TARGET_LUFS, "edge_ms": EDGE_SILENCE_MS}
+    return params
+
+
+def _render_job(
+    job_id: str,
+    text: str | None,
+    chunks,
+    total: int | None,
+    speaker: str,
+    pause_between_sentences: float,
+    speed: float,
+    preserve_pitch: bool,
+    fmt: dict,
+    output_path: Path,
+    tags: dict,
+    job_header: dict,
+    log_lines: list[str],
+    on_progress,
+    record: JobRecord | None,
+    part: int | None,
+    live: LiveStream | None,
+    memo: ChunkMemo | None,
+    tts_flags: dict,
+    control: JobControl | None,
+    stream_export: bool,
+) -> dict:
+    """
+    Общая часть render_text и render_stream: задание с манифестом
+    (после перезапуска продолжаем с первого отсутствующего фрагмента),
+    синтез пулом воркеров, постобработка и экспорт. chunks — список
+    или итератор. При паузе манифест и временный WAV остаются, при
+    отмене удаляются.
+    """
+    # Подготавливаем паузу как int16 (один раз)
+    pause_samples = int(SAMPLE_RATE * pause_between_sentences)
+    pause_int16 = np.zeros(pause_samples, dtype=np.int16)
+
+    if not acquire_job(job_id):
+        raise SynthesisError("[ERROR]Это задание уже выполняется.")
+
+    try:
+        job = SynthesisJob(job_id)
+        if job.exists():
+            job.load()
+            # Продолжаемое задание — свежий артефакт для квоты хранилища
+            touch(job.dir)
+        else:
+            job.create(text, {**job_header, "total": total})
+        # Для сверки с манифестом нужны только уже записанные фрагменты:
+        # у потока читаем ровно столько, сколько в манифесте
+        chunks = iter(chunks)
+        prefix = list(islice(chunks, len(job.entries)))
+        wav_writer, done = job.open(prefix, with_audio=not stream_export)
+        all_chunks = chain(prefix, chunks)
+        if stream_export:
+            # PCM сразу уходит в ffmpeg: кодирование идёт параллельно с синтезом
+            sink = _StreamSink(
+                output_path, fmt, tags, make_speed_processor(speed, preserve_pitch), live,
+            )
+            log_lines.insert(0, "[INFO]Потоковый экспорт: кодирование во время синтеза")
+        else:
+            # Скорость при экспорте меняется позже — для трансляции отдельно
+            sink = _SpoolSink(
+                wav_writer, live, make_speed_processor(speed, preserve_pitch) if live else None,
+            )
+        # Кеш и повторы хранят звук модели как есть: постобработка — после них
+        post = make_post_processor(AUDIO_POSTPROCESS, LOUDNESS_TARGET_LUFS, EDGE_SILENCE_MS)
+        start = len(done)
+        failed_chunks = sum(1 for e in done if e.get("failed"))
+        if start:
+            log_lines.insert(0, f"[INFO]Продолжение задания {job_id}: готово {start}/{total or '?'}")
+
+        # Фрагменты синтезируются пулом воркеров, но приходят строго по порядку.
+        # Каждый записанный фрагмент подтверждается строкой в манифесте.
+        render_stats = {}
+        aborted = False
+        seen = start
+        if control:
+            control.check()
+        rendered = render_chunks(
+            all_chunks, speaker, stats=render_stats, start=start, memo=memo, flags=tts_flags,
+            owner=record.record_id if record is not None else None,
+        )
+        try:
+            for i, chunk, audio_int16, error, timing in rendered:
+                # Готовый фрагмент уже в кеше, так что при паузе он не потеряется
+                if control:
+                    control.check()
+                seen = i + 1
+                if on_progress:
+                    on_progress(i + 1, total)
+
+                write_started = time.perf_counter()
+                if error is None and post:
+                    audio_int16 = post.process(audio_int16)
+                if error is None:
+                    sink.write(audio_int16)
+                    sink.write(pause_int16)
+                    job.commit(i, chunk, sink.commit())
+                else:
+                    job.commit(i, chunk, sink.commit(), failed=True)
+                if record is not None:
+                    record.add_chunk(
+                        i, len(chunk),
+                        len(audio_int16) / SAMPLE_RATE if error is None else 0.0,
+                        timing["inference_s"], time.perf_counter() - write_started,
+                        timing["started_at"], timing["cached"],
+                        error=None if error is None else str(error), part=part,
+                    )
+
+                if error is not None:
+                    failed_chunks += 1
+                    log_lines.append(f"[WARN]Ошибка в фрагменте {i+1}/{total or '?'}: {str(error)[:100]}")
+                    log_lines.append(f"   Текст: {chunk[:80]}...")
+
+                    # У потока общее число неизвестно — считаем от прочитанного
+                    if failed_chunks > (total or max(seen, 10)) * 0.3:
+                        aborted = True
+                        break
+        except JobCancelled:
+            sink.abort()
+            job.remove()
+            raise
+        except BaseException:
+            sink.abort()
+            raise
+        finally:
+            # Закрытие генератора снимает с очереди модели ещё не начатые фрагменты
+            rendered.close()
+            job.close()
+
+        if aborted or sink.frames == 0:
+            sink.abort()
+            job.remove()
+            if aborted:
+                raise SynthesisError(
+                    f"[ERROR]Критическая ошибка: слишком много неудачных фрагментов ({failed_chunks}/{total or seen})\n"
+                    f"Возможные причины:\n"
+                    f"• Текст содержит некорректные символы\n"
+                    f"• Недостаточно памяти\n\n"
+                    f"Попробуйте:\n"
+                    f"• Разделить текст на части\n"
+                    f"• Проверить кодировку файла"
+                )
+            raise SynthesisError("[ERROR]Не удалось синтезировать ни одного фрагмента.")
+
+        encode_started = time.perf_counter()
+        duration_sec = sink.finish(output_path, fmt, speed, preserve_pitch, tags)
+        if record is not None:
+            record.add_encode(time.perf_counter() - encode_started)
+
+        # Удаляем временный WAV и манифест
+        job.remove()
+    finally:
+        release_job(job_id)
+
+    stats = {
+        "duration": duration_sec,
+        "chunks": seen,
+        "failed": failed_chunks,
+        **render_stats,
+    }
+    if post:
+        stats["loudness_lufs"] = post.output_lufs
+        stats["trimmed_silence"] = post.trimmed_frames / SAMPLE_RATE
+        loudness = "—" if post.output_lufs is None else f"{post.output_lufs:.1f}"
+        log_lines.append(
+            f"[INFO]Постобработка: громкость {loudness} LUFS (цель {LOUDNESS_TARGET_LUFS:g}), "
+            f"убрано тишины {stats['trimmed_silence']:.1f} сек"
+        )
+    return stats
+
+
+def render_chapters(
+    chapters: list[dict],
+    speaker: str,
+    speed: float,
+    pause_between_sentences: float,
+    fmt: dict,
+    preserve_pitch: bool,
+    per_chapter: bool,
+    output_path: Path,
+    title: str,
+    artist: str,
+    job_header: dict,
+    log_lines: list[str],
+    on_progress=None,
+    record: JobRecord | None = None,
+    live: LiveStream | None = None,
+    memo: ChunkMemo | None = None,
+    tts_flags: dict = APPLY_TTS_FLAGS,
+    control: JobControl | None = None,
+    book: SynthesisJob | None = None,
+) -> dict:
+    """
+    Рендерит главы параллельно (CHAPTER_WORKERS глав одновременно, общий
+    пул воркеров), каждую — отдельным возобновляемым заданием с повтором
+    при ошибке. Затем либо собирает output_path с метками глав, либо
+    пакует файлы по главам в ZIP рядом с output_path.
+    book — родительское задание (_open_book_job): в нём отмечаются
+    готовые главы, задания глав ссылаются на него. При паузе или ошибке
+    файлы готовых глав переносятся в каталог book и при продолжении
+    берутся оттуда без синтеза; удаляются только при отмене. Главы
+    пишутся через временный WAV своего задания (без STREAM_EXPORT),
+    поэтому начатая глава продолжается с места остановки.
+    on_progress(fraction, desc) вызывается из текущего потока.
+    В live первая глава идёт по мере синтеза, следующие — целиком по
+    порядку, когда готовы (только для одного файла: главы во WAV).
+    """
+    n = len(chapters)
+    single_file = not per_chapter
+    # Для одного M4B главы сначала пишутся в WAV, затем сводятся в один файл
+    chapter_fmt = FORMATS["WAV (без сжатия)"] if single_file else fmt
+    weights = [max(len(ch["text"]), 1) for ch in chapters]
+    done_parts = [0.0] * n
+    chapter_logs = [[] for _ in range(n)]
+    log_lines.append(f"[INFO]Глав: {n}")
+
+    def chapter_path(i: int) -> Path:
+        if single_file:
+            return output_path.with_name(f"_chapter_{output_path.stem}_{i + 1:03d}.wav")
+        return output_path.with_name(f"{output_path.stem}_{i + 1:02d}{fmt['ext']}")
+
+    def part_header(i: int) -> dict:
+        return {"parent": book.job_id, "chapter": i} if book is not None else {}
+
+    def render_chapter(i: int) -> dict:
+        chapter = chapters[i]
+        chapter_title = f"{i + 1:02d}. {chapter['title']}"
+        tags = build_tags(title, artist)
+        if not single_file:
+            tags.update({"title": chapter_title, "track": f"{i + 1}/{n}"})
+
+        def chapter_progress(done, total):
+            done_parts[i] = done / total
+
+        last_error = None
+        for _ in range(CHAPTER_RETRIES + 1):
+            try:
+                return render_text(
+                    chapter["text"], speaker, pause_between_sentences,
+                    speed, preserve_pitch, chapter_fmt, chapter_path(i), tags,
+                    {**job_header, "title": f"{title or 'audiobook'} — {chapter_title}", **part_header(i)},
+                    chapter_logs[i], chapter_progress, record, i,
+                    live if i == 0 else None, memo, tts_flags, control, stream_export=False,
+                )
+            except JobInterrupted:
+                raise
+            except Exception as e:
+                last_error = e
+                done_parts[i] = 0.0
+        raise last_error
+
+    results: dict[int, dict] = {}
+    errors: dict[int, Exception] = {}
+    restored = _restore_parts(book, chapter_path, n) if book is not None else {}
+    results.update(restored)
+    for i in restored:
+        done_parts[i] = 1.0
+    next_live = (0 if 0 in results else 1) if live and single_file else n
+    with ThreadPoolExecutor(max_workers=CHAPTER_WORKERS, thread_name_prefix="chapter") as pool:
+        futures = {pool.submit(render_chapter, i): i for i in range(n) if i not in results}
+        pending = set(futures)
+        while pending:
+            finished, pending = wait(pending, timeout=1.0, return_when=FIRST_COMPLETED)
+            for future in finished:
+                i = futures[future]
+                try:
+                    results[i] = future.result()
+                    if book is not None:
+                        book.record_part(i, results[i]["chunks"])
+                except Exception as e:
+                    errors[i] = e
+            # Трансляция непрерывна: глава уходит, только когда готовы все предыдущие
+            while next_live < n and 0 in results and next_live in results:
+                for block in iter_wav_blocks(chapter_path(next_live)):
+                    live.write(block)
+                next_live += 1
+            if on_progress:
+                ready = sum(w * d for w, d in zip(weights, done_parts)) / sum(weights)
+                on_progress(ready, f"Главы: готово {len(results)}/{n}...")
+
+    for i in range(n):
+        log_lines.append(f"[INFO]Глава {i + 1}: {chapters[i]['title'][:60]}")
+        if i in restored:
+            log_lines.append("   [INFO]Готова с прошлого запуска")
+        log_lines.extend(f"   {line}" for line in chapter_logs[i] if line.startswith("[WARN]"))
+        if i in errors:
+            log_lines.append(f"   {str(errors[i])[:300]}")
+
+    # Пауза или ошибка: готовые главы остаются в задании книги,
+    # начатые — в своих заданиях; отмена удаляет всё
+    interrupted = next((e for e in errors.values() if isinstance(e, JobInterrupted)), None)
+    if interrupted is not None:
+        if isinstance(interrupted, JobCancelled):
+            for i in results:
+                chapter_path(i).unlink(missing_ok=True)
+            if book is not None:
+                _remove_book(book)
+        else:
+            _park_parts(book, results, chapter_path)
+        raise interrupted
+
+    if errors and single_file:
+        _park_parts(book, results, chapter_path)
+        raise SynthesisError(
+            f"[ERROR]Не удалось синтезировать глав: {len(errors)}/{n}. "
+            f"Повторный запуск возьмёт готовые главы из задания."
+        )
+    if not results:
+        raise SynthesisError("[ERROR]Не удалось синтезировать ни одной главы.")
+
+    if single_file:
+        if on_progress:
+            on_progress(1.0, "Сборка файла с главами...")
+        parts = [(chapters[i]["title"] or f"Глава {i + 1}", chapter_path(i)) for i in range(n)]
+        encode_started = time.perf_counter()
+        try:
+            duration_sec = mux_chapters(parts, output_path, fmt, build_tags(title, artist))
+            if record is not None:
+                record.add_encode(time.perf_counter() - encode_started)
+        finally:
+            for _, path in parts:
+                path.unlink(missing_ok=True)
+        audio_path = download_path = str(output_path)
+    else:
+        files = [str(chapter_path(i)) for i in sorted(results)]
+        duration_sec = sum(r["duration"] for r in results.values())
+        download_path = create_archive_with_files(files, None, output_path.with_suffix(".zip"))
+        audio_path = files[0]
+        if errors:
+            log_lines.append(f"[WARN]Пропущено глав: {len(errors)}/{n}")
+    if book is not None:
+        book.remove()
+
+    return {
+        "audio_path": audio_path,
+        "download_path": download_path,
+        "duration": duration_sec,
+        "chunks": sum(r["chunks"] for r in results.values()),
+        "failed": sum(r["failed"] for r in results.values()),
+        "cache_hits": sum(r["cache_hits"] for r in results.values()),
+        "cache_misses": sum(r["cache_misses"] for r in results.values()),
+        "dedup_hits": sum(r["dedup_hits"] for r in results.values()),
+        "chapters": n,
+        "failed_chapters": len(errors),
+    }
+
+
+# Статистика главы, нужная итогу книги, когда глава берётся из задания
+_PART_STATS = ("duration", "chunks", "failed", "cache_hits", "cache_misses", "dedup_hits")
+
+
+def _park_parts(book: SynthesisJob | None, results: dict[int, dict], chapter_path):
+    """Переносит файлы готовых глав в каталог задания книги (без книги — удаляет)."""
+    for i, stats in results.items():
+        path = chapter_path(i)
+        if book is None or not path.exists():
+            path.unlink(missing_ok=True)
+            continue
+        name = f"part_{i:03d}{path.suffix}"
+        path.replace(book.dir / name)
+        book.record_part(i, stats["chunks"], file=name, stats={k: stats[k] for k in _PART_STATS})
+
+
+def _restore_parts(book: SynthesisJob, chapter_path, n: int) -> dict[int, dict]:
+    """Главы, сохранённые _park_parts: файлы возвращаются на места глав."""
+    restored = {}
+    for i, entry in book.parts_done().items():
+        parked = book.dir / entry.get("file", "")
+        if i >= n or "file" not in entry or not parked.is_file():
+            continue
+        parked.replace(chapter_path(i))
+        restored[i] = entry["stats"]
+    return restored
+
+
+def _remove_book(book: SynthesisJob):
+    """Отмена книги: задание книги и ещё не завершённые задания глав."""
+    for part_id in book.header.get("parts", []):
+        if not is_job_active(part_id):
+            SynthesisJob(part_id).remove()
+    book.remove()
+
+
+def render_book(
+    text: str,
+    speaker: str,
+    speed: float,
+    pause_between_sentences: float,
+    fmt: dict,
+    preserve_pitch: bool,
+    per_chapter: bool,
+    output_path: Path,
+    title: str,
+    artist: str,
+    job_header: dict,
+    log_lines: list[str],
+    on_progress=None,
+    live: LiveStream | None = None,
+    tts_flags: dict = APPLY_TTS_FLAGS,
+    control: JobControl | None = None,
+    submitted: float | None = None,
+) -> dict:
+    """
+    Точка входа конвейера для UI и CLI: книга целиком или по главам
+    (для M4B и per_chapter). on_progress(fraction, desc).
+    submitted — время постановки в очередь (до допуска), от него
+    считается ожидание в очереди записи задания.
+    live — трансляция для прослушивания во время синтеза; время до
+    первого звука попадает в запись задания. Текст с ударениями из
+    accents передаётся с tts_flags=ANNOTATED_TTS_FLAGS. control —
+    пауза и отмена между фрагментами (JobPaused / JobCancelled).
+    Возвращает статистику с audio_path/download_path и путём к JSON-записи
+    задания (record_path); бросает SynthesisError.
+    """
+    record = JobRecord(speaker, title, {
+        "speed": speed, "pause": pause_between_sentences, "format": fmt["format"],
+        "preserve_pitch": preserve_pitch, "per_chapter": per_chapter, "chars": len(text),
+        "annotated": tts_flags != APPLY_TTS_FLAGS, "hardware": hardware_key(),
+    }, submitted)
+    if live is not None:
+        live.started_at = record.created
+        live.on_first_audio = record.mark_first_audio
+    memo = new_chunk_memo()
+    # Оставшееся время в прогрессе: модель скорости, уточняемая по ходу задания
+    chunk_chars = [len(chunk) for chunk in split_into_chunks(text, pause_between_sentences)]
+    estimate = throughput.estimate(chunk_chars, speaker)
+    log_lines.append(f"[INFO]Оценка времени синтеза: {format_range(estimate)}")
+    if on_progress:
+        on_progress = LiveEta(estimate, len(chunk_chars)).wrap(on_progress)
+
+    def render() -> dict:
+        chapters = detect_chapters(text) if per_chapter or fmt.get("chapters") else []
+        if len(chapters) > 1:
+            book = _open_book_job(text, chapters, speaker, pause_between_sentences, tts_flags, job_header)
+            try:
+                return render_chapters(
+                    chapters, speaker, speed, pause_between_sentences, fmt, preserve_pitch,
+                    per_chapter, output_path, title, artist, job_header, log_lines, on_progress,
+                    record, live, memo, tts_flags, control, book,
+                )
+            finally:
+                book.close()
+                release_job(book.job_id)
+
+        def chunk_progress(done, total):
+            if on_progress:
+                on_progress(done / total, f"Озвучивание {done}/{total}...")
+
+        stats = render_text(
+            text, speaker, pause_between_sentences, speed, preserve_pitch,
+            fmt, output_path, build_tags(title, artist), job_header, log_lines,
+            chunk_progress, record, None, live, memo, tts_flags, control,
+        )
+        stats.update({"audio_path": str(output_path), "download_path": str(output_path)})
+        return stats
+
+    return _run_recorded(record, render, log_lines, memo)
+
+
+def render_book_stream(
+    paragraphs,
+    source_id: str,
+    read_progress: dict,
+    speaker: str,
+    speed: float,
+    pause_between_sentences: float,
+    fmt: dict,
+    preserve_pitch: bool,
+    output_path: Path,
+    title: str,
+    artist: str,
+    job_header: dict,
+    log_lines: list[str],
+    on_progress=None,
+) -> dict:
+    """
+    render_book для потока абзацев из converters.open_paragraph_stream:
+    один итоговый файл, синтез идёт параллельно с разбором документа.
+    Главы (M4B, per_chapter) требуют весь текст — для них нужен render_book.
+    Прогресс — доля прочитанного источника из read_progress["fraction"].
+    """
+    record = JobRecord(speaker, title, {
+        "speed": speed, "pause": pause_between_sentences, "format": fmt["format"],
+        "preserve_pitch": preserve_pitch, "per_chapter": False, "source": source_id,
+        "hardware": hardware_key(),
+    })
+    memo = new_chunk_memo()
+
+    def chunk_progress(done, total):
+        if on_progress:
+            on_progress(read_progress.get("fraction", 0.0), f"Озвучивание {done}...")
+
+    def render() -> dict:
+        stats = render_stream(
+            paragraphs, source_id, speaker, pause_between_sentences, speed, preserve_pitch,
+            fmt, output_path, build_tags(title, artist), job_header, log_lines,
+            chunk_progress, record, memo,
+        )
+        stats.update({"audio_path": str(output_path), "download_path": str(output_path)})
+        # Кодировка TXT определяется по ходу чтения — итог только теперь
+        if read_progress.get("replaced"):
+            log_lines.append(
+                f"[WARN]Недекодируемых символов заменено: {read_progress['replaced']} "
+                f"(кодировка {read_progress.get('encoding')})"
+            )
+        return stats
+
+    return _run_recorded(record, render, log_lines, memo)
+
+
+def _run_recorded(record: JobRecord, render, log_lines: list[str], memo: ChunkMemo | None = None) -> dict:
+    """
+    Выполняет render() и закрывает запись задания при любом исходе;
+    освобождает память повторов и пишет в лог её долю попаданий.
+    Тайминги фрагментов уточняют модель скорости (eta).
+    """
+    try:
+        stats = render()
+    except JobInterrupted as e:
+        record.finish(e.status)
+        record.save()
+        throughput.observe(record.to_dict())
+        raise
+    except BaseException as e:
+        record.finish("failed", error=str(e))
+        record.save()
+        throughput.observe(record.to_dict())
+        raise
+    finally:
+        if memo is not None:
+            memo.close()
+
+    if memo is not None:
+        log_lines.append(
+            f"[INFO]Повторы фрагментов: {memo.hits} из {memo.lookups} "
+            f"({memo.hit_rate * 100:.1f}%) без вызова модели"
+        )
+
+    # Пока воркеры живы — снимок памяти для подбора лимитов контейнера
+    record.finish("ok", {k: v for k, v in stats.items() if k not in ("audio_path", "download_path")})
+    stats["memory"] = record.memory
+    stats["record_path"] = record.save()
+    throughput.observe(record.to_dict())
+    log_lines.extend(format_memory_report(stats["memory"]))
+    return stats
+
+
+def build_tags(title: str, artist: str) -> dict:
+    """Теги итогового файла (ID3 для MP3, комментарии для OGG)."""
+    tags = {}
+    if title:
+        tags["title"] = title
+        tags["album"] = title
+    if artist:
+        tags["artist"] = artist
+    return tags
+
+
+def _export_audio(
+    wav_path: Path,
+    output_path: Path,
+    fmt: dict,
+    speed: float,
+    preserve_pitch: bool,
+    tags: dict,
+) -> float:
+    """
+    Потоково конвертирует временный WAV в итоговый формат: блоки читаются
+    с диска, проходят изменение скорости и сразу уходят в кодировщик.
+    Память постоянна независимо от длины книги.
+    Возвращает длительность в секундах.
+    """
+    processor = make_speed_processor(speed, preserve_pitch)
+    encoder = open_encoder(output_path, fmt, tags)
+    try:
+        for block in iter_wav_blocks(wav_path):
+            encoder.write(processor.process(block) if processor else block)
+        if processor:
+            encoder.write(processor.flush())
+        encoder.close()
+    except BaseException:
+        encoder.abort()
+        raise
+    return encoder.frames / SAMPLE_RATE
+
+
+class _SpoolSink:
+    """
+    Пишет PCM во временный WAV задания; экспорт — после синтеза.
+    Копия для трансляции проходит изменение скорости сразу (processor).
+    """
+
+    def __init__(self, writer, live=None, processor=None):
+        self._writer = writer
+        self._live = live
+        self._processor = processor
+
+    @property
+    def frames(self) -> int:
+        return self._writer.frames
+
+    def write(self, audio_int16: np.ndarray):
+        self._writer.write(audio_int16.tobytes())
+        if self._live:
+            self._live.write(self._processor.process(audio_int16) if self._processor else audio_int16)
+
+    def commit(self) -> int:
+        return self._writer.commit()
+
+    def abort(self):
+        self._writer.close()
+
+    def finish(self, output_path, fmt, speed, preserve_pitch, tags) -> float:
+        self._writer.close()
+        if self._live and self._processor:
+            self._live.write(self._processor.flush())
+        return _export_audio(self._writer.path, output_path, fmt, speed, preserve_pitch, tags)
+
+
+class _StreamSink:
+    """
+    Передаёт PCM кодировщику по мере синтеза. ffmpeg работает в
+    отдельном процессе, поэтому кодирование перекрывается с синтезом,
+    а временный WAV не нужен. Смещение в манифесте — число байт PCM.
+    """
+
+    def __init__(self, output_path, fmt, tags, processor, live=None):
+        self._encoder = open_encoder(output_path, fmt, tags)
+        self._processor = processor
+        self._live = live
+        self.frames = 0
+
+    def write(self, audio_int16: np.ndarray):
+        self.frames += len(audio_int16)
+        if self._processor:
+            audio_int16 = self._processor.process(audio_int16)
+        self._encoder.write(audio_int16)
+        if self._live:
+            self._live.write(audio_int16)
+
+    def commit(self) -> int:
+        return self.frames * 2
+
+    def abort(self):
+        self._encoder.abort()
+
+    def finish(self, output_path, fmt, speed, preserve_pitch, tags) -> float:
+        try:
+            if self._processor:
+                tail = self._processor.flush()
+                self._encoder.write(tail)
+                if self._live:
+                    self._live.write(tail)
+            # Теги записываются муксером ffmpeg при финализации файла
+            self._encoder.close()
+        except BaseException:
+            self._encoder.abort()
+            raise
+        return self._encoder.frames / SAMPLE_RATE
@@ -0,0 +1,130 @@
+"""
+Кеш превью голосов: готовые WAV, которые отдаются без вызова модели
+"""
+
+import hashlib
+import json
+import os
+import threading
+from pathlib import Path
+
+from config import CACHE_DIR, PREVIEW_CACHE_MAX, SAMPLE_RATE, SPEAKERS
+from chunk_cache import model_fingerprint
+from audio_processing import PcmWavWriter
+
+# Длиннее превью не нужно — это не синтез книги
+MAX_PREVIEW_CHARS = 300
+
+
+def default_preview_text(speaker_name: str) -> str:
+    # Извлекаем имя из строки вида "Ксения (женский)"
+    name = speaker_name.split('(')[0].strip()
+    return f"Привет! Я {name}."
+
+
+class PreviewCache:
+    """
+    WAV-файлы превью по ключу (текст, голос, модель, флаги). Стандартные
+    фразы всех голосов закреплены; пользовательские фразы вытесняются
+    по давности использования (mtime), их не больше max_files.
+    Ключ включает отпечаток файла модели, поэтому после её замены
+    превью перерендериваются, а старые файлы уходят при вытеснении.
+    """
+
+    def __init__(self, root: Path, max_files: int):
+        self.root = Path(root)
+        self.max_files = max_files
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._render_lock = threading.Lock()
+
+    def _key(self, text: str, speaker: str) -> str:
+        from workers import APPLY_TTS_FLAGS
+
+        payload = json.dumps(
+            {
+                "text": text,
+                "speaker": speaker,
+                "sample_rate": SAMPLE_RATE,
+                "model": model_fingerprint(),
+                "flags": APPLY_TTS_FLAGS,
+            },
+            ensure_ascii=False,
+            sort_keys=True,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _pinned(self) -> set[str]:
+        return {
+            self._key(default_preview_text(name), speaker)
+            for name, speaker in SPEAKERS.items()
+        }
+
+    def get(self, text: str, speaker: str) -> Path | None:
+        path = self.root / f"{self._key(text, speaker)}.wav"
+        try:
+            os.utime(path)
+        except OSError:
+            return None
+        return path
+
+    def render(self, text: str, speaker: str) -> Path:
+        """Синтезирует превью и кладёт в кеш (повторный запрос ждёт первый)."""
+        from workers import render_chunk, scheduler
+
+        with self._render_lock:
+            cached = self.get(text, speaker)
+            if cached is not None:
+                return cached
+            path = self.root / f"{self._key(text, speaker)}.wav"
+            # Вне очереди книг, но через тот же исполнитель — без лишних потоков torch
+            audio_int16 = scheduler.submit("preview", render_chunk, text, speaker, urgent=True).result()
+            tmp_path = path.with_suffix(f".tmp{os.getpid()}")
+            writer = PcmWavWriter(tmp_path)
+            writer.write(audio_int16.astype("<i2", copy=False).tobytes())
+            writer.close()
+            os.replace(tmp_path, path)
+            self._evict()
+            return path
+
+    def _evict(self):
+        pinned = self._pinned()
+        custom = []
+        for path in self.root.glob("*.wav"):
+            if path.stem in pinned:
+                continue
+            try:
+                custom.append((path.stat().st_mtime, path))
+            except OSError:
+                continue
+        custom.sort()
+        for _, path in custom[:max(0, len(custom) - self.max_files)]:
+            path.unlink(missing_ok=True)
+
+
+preview_cache = PreviewCache(CACHE_DIR / "previews", PREVIEW_CACHE_MAX)
+
+
+def warm_previews():
+    """Рендерит стандартные превью всех голосов, которых ещё нет в кеше."""
+    from tts_model import wait_ready
+
+    try:
+        wait_ready()
+    except Exception as e:
+        print(f"[WARN] Превью голосов не подготовлены: {e}")
+        return
+    rendered = 0
+    for name, speaker in SPEAKERS.items():
+        text = default_preview_text(name)
+        if preview_cache.get(text, speaker) is None:
+            try:
+                preview_cache.render(text, speaker)
+                rendered += 1
+            except Exception as e:
+                print(f"[WARN] Превью {speaker}: {e}")
+    print(f"[INFO] Превью голосов готовы (новых: {rendered})")
+
+
+def start_preview_warmup():
+    """Готовит превью в фоне, как только загрузится модель."""
+    threading.Thread(target=warm_previews, name="preview-warmup", daemon=True).start()
@@ -0,0 +1,235 @@
+"""
+Планировщик синтеза: общая очередь к модели для всех пользователей
+
+Фрагменты всех заданий и превью проходят через один планировщик. В
+исполнителе (пул воркеров или поток с моделью) одновременно не больше
+capacity фрагментов, поэтому параллельные пользователи не делят ядра
+сверх TTS_WORKERS процессов. Свободное место отдаётся заданиям по кругу
+(по фрагменту), так что короткая книга не ждёт окончания длинной, а
+срочные задачи (превью голоса) идут вне очереди. Число одновременно
+выполняемых заданий ограничено; ожидающие видят место в очереди и
+ориентировочное время старта (по модели скорости eta).
+"""
+
+import itertools
+import threading
+from collections import deque
+from concurrent.futures import Future
+
+from eta import throughput
+from telemetry import metrics
+
+
+class ChunkScheduler:
+    """
+    Очереди фрагментов по владельцам (заданиям) и круговая раздача
+    свободных мест исполнителя. executor_factory() вызывается при
+    каждой отправке: после сбоя пула подхватывается новый исполнитель.
+    """
+
+    def __init__(self, executor_factory, capacity: int):
+        self._executor_factory = executor_factory
+        self.capacity = max(1, capacity)
+        self._lock = threading.Lock()
+        self._queues: dict[object, deque] = {}
+        self._turns: deque = deque()
+        self._urgent: deque = deque()
+        self._in_flight = 0
+
+    def submit(self, owner, fn, *args, urgent: bool = False) -> Future:
+        """
+        Ставит fn(*args) в очередь владельца owner и возвращает Future.
+        Пока задача не отправлена в исполнитель, её можно отменить.
+        urgent — вне очереди (превью).
+        """
+        future = Future()
+        task = (future, fn, args)
+        with self._lock:
+            if urgent:
+                self._urgent.append(task)
+            else:
+                queue = self._queues.get(owner)
+                if queue is None:
+                    queue = self._queues[owner] = deque()
+                    self._turns.append(owner)
+                queue.append(task)
+        self._pump()
+        return future
+
+    def queued(self) -> int:
+        with self._lock:
+            return len(self._urgent) + sum(len(q) for q in self._queues.values())
+
+    def _next_task(self):
+        # Вызывается под блокировкой: сначала срочные, затем по кругу
+        if self._urgent:
+            return self._urgent.popleft()
+        while self._turns:
+            owner = self._turns.popleft()
+            queue = self._queues[owner]
+            task = queue.popleft()
+            if queue:
+                self._turns.append(owner)
+            else:
+                del self._queues[owner]
+            return task
+        return None
+
+    def _pump(self):
+        while True:
+            with self._lock:
+                if self._in_flight >= self.capacity:
+                    return
+                task = self._next_task()
+                if task is None:
+                    return
+                future, fn, args = task
+                # Отменённые до отправки просто пропускаются
+                if not future.set_running_or_notify_cancel():
+                    continue
+                self._in_flight += 1
+            try:
+                inner = self._executor_factory().submit(fn, *args)
+            except Exception as e:
+                with self._lock:
+                    self._in_flight -= 1
+                future.set_exception(e)
+                continue
+            inner.add_done_callback(
+                lambda inner, future=future: self._finished(inner, future)
+            )
+
+    def _finished(self, inner: Future, future: Future):
+        with self._lock:
+            self._in_flight -= 1
+        try:
+            result = inner.result()
+        except BaseException as e:
+            future.set_exception(e)
+        else:
+            future.set_result(result)
+        self._pump()
+
+
+class JobTicket:
+    """
+    Место задания в очереди допуска. wait() ждёт разрешения на запуск;
+    position и eta_seconds — для интерфейса, пока задание ждёт.
+    seconds — время синтеза задания в одиночку по модели скорости (eta).
+    progress(fraction) уточняет оценку для тех, кто стоит следом.
+    """
+
+    def __init__(self, admission: "JobAdmission", label: str, seconds: float):
+        self._admission = admission
+        self.label = label
+        self.seconds = seconds
+        self.fraction = 0.0
+        self.admitted = threading.Event()
+
+    def wait(self, timeout: float | None = None) -> bool:
+        return self.admitted.wait(timeout)
+
+    def progress(self, fraction: float):
+        self.fraction = min(max(fraction, 0.0), 1.0)
+
+    @property
+    def position(self) -> int:
+        """Номер в очереди ожидания (с 1); 0 — задание выполняется."""
+        return self._admission.position(self)
+
+    @property
+    def eta_seconds(self) -> float:
+        return self._admission.estimate_start(self)
+
+    def release(self):
+        self._admission.release(self)
+
+
+class JobAdmission:
+    """
+    Допуск заданий: не больше max_jobs выполняются одновременно,
+    остальные ждут в порядке поступления.
+    """
+
+    def __init__(self, max_jobs: int):
+        self.max_jobs = max(1, max_jobs)
+        self._lock = threading.Lock()
+        self._running: list[JobTicket] = []
+        self._waiting: list[JobTicket] = []
+
+    def admit(self, label: str, chunk_chars: list[int], speaker: str | None = None) -> JobTicket:
+        """Ставит задание из фрагментов длиной chunk_chars в очередь допуска."""
+        seconds = throughput.estimate(chunk_chars, speaker)["seconds"]
+        ticket = JobTicket(self, label, seconds)
+        with self._lock:
+            self._waiting.append(ticket)
+            self._promote()
+        return ticket
+
+    def _promote(self):
+        while self._waiting and len(self._running) < self.max_jobs:
+            ticket = self._waiting.pop(0)
+            self._running.append(ticket)
+            ticket.admitted.set()
+
+    def release(self, ticket: JobTicket):
+        with self._lock:
+            if ticket in self._running:
+                self._running.remove(ticket)
+            elif ticket in self._waiting:
+                self._waiting.remove(ticket)
+            self._promote()
+
+    def position(self, ticket: JobTicket) -> int:
+        with self._lock:
+            return self._waiting.index(ticket) + 1 if ticket in self._waiting else 0
+
+    def counts(self) -> tuple[int, int]:
+        with self._lock:
+            return len(self._running), len(self._waiting)
+
+    def estimate_start(self, ticket: JobTicket) -> float:
+        """
+        Секунды до старта: выполняющиеся задания делят исполнитель
+        поровну (как при круговой раздаче фрагментов); каждое
+        завершившееся освобождает место следующему в очереди.
+        """
+        with self._lock:
+            if ticket not in self._waiting:
+                return 0.0
+            ahead = self._waiting[:self._waiting.index(ticket)]
+            running = [t.seconds * (1 - t.fraction) for t in self._running]
+        # Работа — время задания в одиночку: n заданий идут в n раз медленнее
+        remaining = sorted(running)
+        queue = [t.seconds for t in ahead]
+        elapsed = 0.0
+        while True:
+            while queue and len(remaining) < self.max_jobs:
+                remaining = sorted(remaining + [queue.pop(0)])
+            if len(remaining) < self.max_jobs:
+                return elapsed
+            step = remaining[0]
+            elapsed += step * len(remaining)
+            remaining = [r - step for r in remaining[1:]]
+
+
+_ids = itertools.count(1)
+
+
+def new_owner(prefix: str = "job") -> str:
+    """Уникальный владелец очереди для разового набора фрагментов."""
+    return f"{prefix}-{next(_ids)}"
+
+
+def _scheduler_gauges():
+    from workers import admission, scheduler
+
+    running, waiting = admission.counts()
+    return [
+        ("audiobook_scheduler_queued_chunks", "Фрагменты, ждущие места в исполнителе",
+         [({}, scheduler.queued())]),
+        ("audiobook_jobs_waiting", "Задания в очереди допуска", [({}, waiting)]),
+    ]
+
+
+metrics.gauge_callback(_scheduler_gauges)
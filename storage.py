@@ -0,0 +1,340 @@
+"""
+Место на диске для результатов: квота OUTPUT_DIR с вытеснением LRU
+
+Артефакты каталога результатов — готовые книги, ZIP по главам, логи,
+записи заданий, каталоги прерванных заданий (_jobs) и трансляций (_live).
+Время последнего обращения хранится в mtime (touch при выдаче результата
+в интерфейсе и по HTTP, при продолжении задания), как в кеше фрагментов.
+Перед стартом задание резервирует оценку своего объёма: если квота
+OUTPUT_QUOTA_MB или свободное место на диске (с запасом
+OUTPUT_MIN_FREE_MB) не позволяют, вытесняются давно не использованные
+артефакты. Не вытесняются файлы и каталоги _jobs заданий с резервом
+(в том числе продолжаемого), закреплённые результаты (keep — книги
+текущего запуска CLI) и всё, что менялось последние минуты. При старте
+удаляются хвосты упавших процессов.
+"""
+
+import os
+import re
+import shutil
+import threading
+import time
+from pathlib import Path
+
+from config import (
+    CACHE_DIR, JOBS_DIR, LIVE_DIR, OUTPUT_DIR, OUTPUT_MIN_FREE_MB, OUTPUT_QUOTA_MB,
+    SAMPLE_RATE, STREAM_EXPORT,
+)
+from jobs import is_job_active
+from live import cleanup_live
+from telemetry import metrics
+
+# Изменённое недавно может ещё записываться (CLI, трансляция) — не трогаем
+_RECENT_SECONDS = 600
+# Секунд аудио на символ текста при скорости 1.0 и запас оценки объёма
+_AUDIO_SECONDS_PER_CHAR = 0.075
+_SIZE_MARGIN = 1.2
+# Битрейт кодеков без явного параметра
+_DEFAULT_BITRATES = {"ogg": 160_000}
+# Хвосты упавших процессов: каталоги памяти повторов и временные файлы кеша
+_MEMO_DIR_RE = re.compile(r"memo_(\d+)_")
+_TMP_SUFFIX_RE = re.compile(r"\.tmp(\d+)$")
+
+metrics.counter("audiobook_storage_evicted_bytes_total", "Байт результатов, вытесненных по квоте")
+
+
+class StorageFull(Exception):
+    """Для задания не удалось освободить место; текст показывается в логе."""
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True
+    return True
+
+
+def _tree_stat(path: Path) -> tuple[int, float]:
+    """Размер и последнее изменение файла или каталога целиком."""
+    if not path.is_dir():
+        st = path.stat()
+        return st.st_size, st.st_mtime
+    size, mtime = 0, path.stat().st_mtime
+    for item in path.rglob("*"):
+        try:
+            st = item.stat()
+        except OSError:
+            continue
+        if item.is_file():
+            size += st.st_size
+        mtime = max(mtime, st.st_mtime)
+    return size, mtime
+
+
+def _remove(path: Path):
+    if path.is_dir():
+        shutil.rmtree(path, ignore_errors=True)
+    else:
+        path.unlink(missing_ok=True)
+
+
+def touch(path) -> None:
+    """Отмечает обращение к артефакту: он вытесняется последним."""
+    try:
+        os.utime(path)
+    except (OSError, TypeError):
+        pass
+
+
+def estimate_job_bytes(chars: int, fmt: dict, speed: float, per_chapter: bool) -> int:
+    """
+    Оценка места под задание: итоговый файл и временные — WAV задания
+    (без потокового экспорта), WAV глав для M4B, файлы глав рядом с ZIP.
+    """
+    audio_seconds = chars * _AUDIO_SECONDS_PER_CHAR / max(speed, 0.1)
+    wav_bytes = audio_seconds * SAMPLE_RATE * 2
+    bitrate = fmt["params"].get("bitrate")
+    if fmt["format"] == "wav":
+        final = wav_bytes
+    elif bitrate:
+        final = audio_seconds * int(bitrate.rstrip("k")) * 1000 / 8
+    else:
+        final = audio_seconds * _DEFAULT_BITRATES.get(fmt["format"], 192_000) / 8
+    temporary = 0 if STREAM_EXPORT else wav_bytes
+    if per_chapter:
+        total = 2 * final + temporary
+    elif fmt.get("chapters"):
+        total = final + wav_bytes + temporary
+    else:
+        total = final + temporary
+    return int(total * _SIZE_MARGIN)
+
+
+class Reservation:
+    """
+    Место, занятое под выполняющееся задание. Файлы задания (по имени
+    итогового файла) и его каталоги в _jobs (job_ids) учтены в резерве
+    и не вытесняются до release().
+    """
+
+    def __init__(self, manager: "StorageManager", size: int, output_path: Path | None,
+                 job_ids=()):
+        self._manager = manager
+        self.size = size
+        self.output_path = Path(output_path) if output_path else None
+        self.job_ids = set(job_ids)
+
+    def owns(self, path: Path) -> bool:
+        if path.parent == JOBS_DIR:
+            return path.name in self.job_ids
+        if self.output_path is None or path.parent != self.output_path.parent:
+            return False
+        stem = self.output_path.stem
+        return path.name.startswith(stem) or path.name.startswith(f"_chapter_{stem}_")
+
+    def release(self):
+        self._manager.release(self)
+
+
+class StorageManager:
+    """
+    Учёт артефактов OUTPUT_DIR, резервы выполняющихся заданий и
+    вытеснение давно не использованного. quota_bytes = 0 — без квоты
+    (свободное место на диске проверяется всё равно).
+    """
+
+    def __init__(self, root: Path, quota_bytes: int, min_free_bytes: int):
+        self.root = Path(root)
+        self.quota_bytes = quota_bytes
+        self.min_free_bytes = min_free_bytes
+        self._lock = threading.Lock()
+        self._reservations: list[Reservation] = []
+        self._kept: set[Path] = set()
+        self.used_bytes = 0
+
+    @property
+    def reserved_bytes(self) -> int:
+        return sum(r.size for r in self._reservations)
+
+    def artifacts(self) -> list[tuple[Path, int, float, bool]]:
+        """
+        (путь, размер, последнее обращение, можно_вытеснить) для каждого
+        артефакта. Файлы заданий с резервом и выполняющиеся задания не
+        возвращаются — их место уже учтено резервом.
+        """
+        if not self.root.exists():
+            return []
+        paths = []
+        for path in self.root.iterdir():
+            if path in (JOBS_DIR, LIVE_DIR) or (path.is_dir() and path.name.startswith("_")):
+                paths.extend(path.iterdir())
+            else:
+                paths.append(path)
+
+        recent = time.time() - _RECENT_SECONDS
+        found = []
+        for path in paths:
+            if path.parent == JOBS_DIR and is_job_active(path.name):
+                continue
+            if any(r.owns(path) for r in self._reservations):
+                continue
+            try:
+                size, last_access = _tree_stat(path)
+            except OSError:
+                continue
+            evictable = last_access < recent and path not in self._kept
+            found.append((path, size, last_access, evictable))
+        return found
+
+    def keep(self, path):
+        """
+        Закрепляет результат до конца процесса: он учитывается в квоте,
+        но не вытесняется (книги текущего запуска CLI).
+        """
+        with self._lock:
+            self._kept.add(Path(path))
+
+    def reserve(self, size: int, output_path: Path | None = None, label: str = "",
+                job_ids=()) -> Reservation:
+        """
+        Резервирует size байт под задание, при необходимости вытесняя
+        давно не использованные артефакты; бросает StorageFull. job_ids —
+        каталоги _jobs задания: продолжаемое задание не вытесняет само себя.
+        """
+        with self._lock:
+            # Резерв учитывается сразу: его файлы не попадают в кандидаты
+            reservation = Reservation(self, size, output_path, job_ids)
+            self._reservations.append(reservation)
+            try:
+                self._make_room(0, label)
+            except StorageFull:
+                self._reservations.remove(reservation)
+                raise
+            return reservation
+
+    def release(self, reservation: Reservation):
+        with self._lock:
+            if reservation in self._reservations:
+                self._reservations.remove(reservation)
+            # Задание могло записать больше резерва
+            self._make_room(0, strict=False)
+
+    def enforce(self):
+        """Приводит каталог к квоте (при старте и после заданий)."""
+        with self._lock:
+            self._make_room(0, strict=False)
+
+    def _make_room(self, size: int, label: str = "", strict: bool = True):
+        # Вызывается под блокировкой. Без strict вытесняет сколько может
+        artifacts = self.artifacts()
+        self.used_bytes = sum(a[1] for a in artifacts)
+        reserved = self.reserved_bytes
+        to_free = 0
+        if self.quota_bytes:
+            to_free = self.used_bytes + reserved + size - self.quota_bytes
+        self.root.mkdir(parents=True, exist_ok=True)
+        free = shutil.disk_usage(self.root).free
+        to_free = max(to_free, self.min_free_bytes + reserved + size - free)
+        if to_free <= 0:
+            return
+
+        candidates = sorted((a for a in artifacts if a[3]), key=lambda a: a[2])
+        if strict and sum(a[1] for a in candidates) < to_free:
+            # Вытеснение не поможет — ничего не удаляем
+            raise StorageFull(
+                f"[ERROR]Недостаточно места для результатов{f' ({label})' if label else ''}: "
+                f"нужно ещё {to_free / 1024 / 1024:.0f} MB. Удалите старые книги или "
+                f"увеличьте OUTPUT_QUOTA_MB."
+            )
+        freed = 0
+        for path, item_size, _, _ in candidates:
+            if freed >= to_free:
+                break
+            _remove(path)
+            freed += item_size
+            print(f"[INFO] Хранилище: вытеснен {path.name} ({item_size / 1024 / 1024:.1f} MB)")
+        self.used_bytes -= freed
+        metrics.inc("audiobook_storage_evicted_bytes_total", freed)
+
+    def reclaim_orphans(self) -> int:
+        """
+        Удаляет хвосты упавших процессов: каталоги заданий без манифеста,
+        WAV глав незавершённой сборки, каталоги памяти повторов и
+        временные файлы кеша мёртвых процессов, старые трансляции.
+        Возвращает освобождённые байты.
+        """
+        # (путь, проверять ли возраст): без pid владельца в имени живость
+        # процесса не проверить — удаляем только давно не менявшееся
+        orphans = []
+        if JOBS_DIR.exists():
+            for path in JOBS_DIR.iterdir():
+                if is_job_active(path.name) or not path.is_dir():
+                    continue
+                if (path / "manifest.jsonl").exists():
+                    orphans.extend((tmp, True) for tmp in path.glob("*.tmp"))
+                else:
+                    orphans.append((path, True))
+        if self.root.exists():
+            # _temp_*.wav — временные WAV прежних версий
+            for pattern in ("_chapter_*.wav", "_temp_*.wav"):
+                orphans.extend((path, True) for path in self.root.glob(pattern))
+            orphans.extend((path, True) for path in self.root.glob(".*.part*"))
+        dedup_dir = CACHE_DIR / "dedup"
+        if dedup_dir.exists():
+            for path in dedup_dir.iterdir():
+                match = _MEMO_DIR_RE.match(path.name)
+                if match is None:
+                    orphans.append((path, True))
+                elif not _pid_alive(int(match.group(1))):
+                    orphans.append((path, False))
+        if CACHE_DIR.exists():
+            for path in CACHE_DIR.rglob("*.tmp*"):
+                match = _TMP_SUFFIX_RE.search(path.name)
+                if match is None:
+                    orphans.append((path, True))
+                elif not _pid_alive(int(match.group(1))):
+                    orphans.append((path, False))
+
+        recent = time.time() - _RECENT_SECONDS
+        freed = 0
+        for path, by_age in orphans:
+            try:
+                size, mtime = _tree_stat(path)
+            except OSError:
+                continue
+            if by_age and mtime >= recent:
+                continue
+            _remove(path)
+            freed += size
+        cleanup_live()
+        return freed
+
+
+storage = StorageManager(
+    OUTPUT_DIR, OUTPUT_QUOTA_MB * 1024 * 1024, OUTPUT_MIN_FREE_MB * 1024 * 1024,
+)
+
+
+def prepare_storage():
+    """Уборка при старте приложения или CLI: хвосты упавших процессов и квота."""
+    freed = storage.reclaim_orphans()
+    if freed:
+        print(f"[INFO] Хранилище: удалены остатки прерванных процессов ({freed / 1024 / 1024:.1f} MB)")
+    storage.enforce()
+
+
+def _storage_gauges():
+    return [
+        ("audiobook_storage_used_bytes", "Занято артефактами каталога результатов",
+         [({}, storage.used_bytes)]),
+        ("audiobook_storage_reserved_bytes", "Зарезервировано под выполняющиеся задания",
+         [({}, storage.reserved_bytes)]),
+        ("audiobook_storage_quota_bytes", "Квота каталога результатов (0 — без квоты)",
+         [({}, storage.quota_bytes)]),
+    ]
+
+
+metrics.gauge_callback(_storage_gauges)
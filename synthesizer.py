@@ -2,20 +2,39 @@
 Ядро синтеза речи: генерация аудио, экспорт, логирование
 """
 
+import contextvars
 import os
+import queue
 import re
+import threading
 import time
-import wave
-import zipfile
-import numpy as np
 import gradio as gr
 from pathlib import Path
-from pydub import AudioSegment
 
-from config import SAMPLE_RATE, OUTPUT_DIR, SPEAKERS, FORMATS
-from tts_model import model
-from text_processing import preprocess_text, split_into_sentences, split_long_sentence
+from config import (
+    OUTPUT_DIR, SPEAKERS, FORMATS, TTS_WORKERS, LIVE_STREAM, METRICS_PORT, ACCENT_ANNOTATION,
+)
+from tts_model import is_ready, model_status, start_loading
+from previews import MAX_PREVIEW_CHARS, default_preview_text, preview_cache
+from jobs import JobCancelled, JobControl, JobPaused, SynthesisJob
 from converters import convert_to_text
+from text_processing import split_into_chunks
+from pipeline import SynthesisError, book_job_ids, render_book, create_archive_with_files  # noqa: F401
+from live import LiveStream
+from workers import ANNOTATED_TTS_FLAGS, APPLY_TTS_FLAGS, admission
+from storage import StorageFull, estimate_job_bytes, storage, touch
+from accents import AccentorUnavailable, annotate_text, count_accents, load_annotation, save_annotation
+
+# Как часто обновлять место в очереди, пока задание ждёт запуска
+_QUEUE_POLL_SECONDS = 2.0
+
+
+def _format_wait(seconds: float) -> str:
+    if seconds < 60:
+        return "меньше минуты"
+    if seconds < 3600:
+        return f"{seconds / 60:.0f} мин"
+    return f"{seconds / 3600:.1f} ч"
 
 
 def create_detailed_log(
@@ -40,7 +59,9 @@ def create_detailed_log(
     # Вычисление общего размера
     total_size_mb = 0.0
     for f in files:
-        if f["Размер"] != "-":
+        if "size_bytes" in f:
+            total_size_mb += f["size_bytes"] / (1024 * 1024)
+        elif f["Размер"] != "-":
             try:
                 size_str = f["Размер"].replace(" MB", "")
                 total_size_mb += float(size_str)
@@ -99,54 +120,59 @@ def create_detailed_log(
     return str(log_path)
 
 
-def create_archive_with_files(files: list, log_file: str) -> str:
+def preview_voice(speaker_name: str, phrase: str = "") -> tuple[str, str]:
     """
-    Создает ZIP-архив со всеми файлами и логом.
-    Возвращает путь к архиву.
+    Превью выбранного голоса. Готовые превью отдаются из кеша без модели;
+    стандартные фразы рендерятся заранее при старте приложения.
     """
-    timestamp = time.strftime("%Y%m%d_%H%M%S")
-    archive_name = f"audiobook_bundle_{timestamp}.zip"
-    archive_path = OUTPUT_DIR / archive_name
+    speaker = SPEAKERS.get(speaker_name, "xenia")
+    text = (phrase or "").strip()[:MAX_PREVIEW_CHARS] or default_preview_text(speaker_name)
 
-    with zipfile.ZipFile(archive_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-        for file_path in files:
-            zipf.write(file_path, Path(file_path).name)
-        if log_file and Path(log_file).exists():
-            zipf.write(log_file, Path(log_file).name)
+    cached = preview_cache.get(text, speaker)
+    if cached is not None:
+        return str(cached), f"[OK]{speaker_name}"
 
-    return str(archive_path)
+    if not is_ready():
+        # Не блокируем интерфейс, пока модель грузится в фоне
+        start_loading()
+        return None, f"[INFO]{model_status()}"
+    try:
+        return str(preview_cache.render(text, speaker)), f"[OK]{speaker_name}"
+    except Exception as e:
+        return None, f"[ERROR]Ошибка: {str(e)}"
 
 
-def preview_voice(speaker_name: str) -> tuple[str, str]:
-    """Создает предпрослушивание выбранного голоса."""
+def prepare_accents(text: str, progress=None) -> tuple[str, str]:
+    """
+    Этап «Анализ текста»: разметка ударений для книги. Возвращает
+    (размеченный текст или "", строку отчёта). Повторный анализ той же
+    книги берёт сохранённую (в том числе исправленную) разметку.
+    """
+    if not ACCENT_ANNOTATION:
+        return "", ""
     try:
-        speaker = SPEAKERS.get(speaker_name, "xenia")
-        # Извлекаем имя из строки вида "Ксения (женский)"
-        name = speaker_name.split('(')[0].strip()
-        text = f"Привет! Я {name}."
-
-        audio = model.apply_tts(
-            text=text,
-            speaker=speaker,
-            sample_rate=SAMPLE_RATE,
-            put_accent=True,
-            put_yo=True,
+        annotated, cached = annotate_text(
+            text, lambda fraction: progress(fraction, desc="Разметка ударений...") if progress else None,
         )
+    except AccentorUnavailable as e:
+        return "", f"🔤 Ударения: расставит модель при синтезе — {e}"
+    source = "сохранённая разметка" if cached else "разметка выполнена"
+    return annotated, (
+        f"🔤 Ударения: {source}, отмечено {count_accents(text, annotated)}. "
+        f"Проверить и исправить можно в блоке «Ударения»"
+    )
 
-        # Сохраняем во временный файл
-        preview_path = OUTPUT_DIR / f"preview_{speaker}.wav"
-        audio_int16 = (audio.numpy() * 32767).astype(np.int16)
-        segment = AudioSegment(
-            audio_int16.tobytes(),
-            frame_rate=SAMPLE_RATE,
-            sample_width=2,
-            channels=1,
-        )
-        segment.export(str(preview_path), format="wav")
 
-        return str(preview_path), f"[OK]{speaker_name}"
-    except Exception as e:
-        return None, f"[ERROR]Ошибка: {str(e)}"
+def accept_accents(text: str, annotated: str) -> bool:
+    """
+    Принимает разметку перед синтезом: правки пользователя сохраняются
+    для следующих голосов и перерендеров. True — синтез по разметке.
+    """
+    if not annotated or not annotated.strip():
+        return False
+    if load_annotation(text) != annotated:
+        save_annotation(text, annotated)
+    return True
 
 
 def synthesize_text(
@@ -157,155 +183,216 @@ def synthesize_text(
     output_format: str,
     mp3_tags_title: str,
     mp3_tags_artist: str,
+    preserve_pitch: bool = True,
+    per_chapter: bool = False,
     progress=gr.Progress(track_tqdm=False),
+    annotated: bool = False,
+    control: JobControl | None = None,
 ):
     """
     Синтезирует речь из текста с потоковой записью на диск.
     Не накапливает аудио в RAM — подходит для больших текстов.
-    Возвращает (audio_path, download_path, log).
+    annotated — текст с ударениями этапа accents: модель не расставляет
+    их заново.
+    control — пауза и отмена из интерфейса; закрытие генератора
+    (клиент ушёл) отменяет задание.
+    Возвращает (live_segment, audio_path, download_path, log): пока идёт
+    синтез, live_segment — очередной WAV-сегмент для потокового плеера
+    (остальные поля не меняются), в конце — None и итоговый файл.
     """
 
     if not text or not text.strip():
-        yield None, None, "[ERROR]Введите текст для озвучивания."
+        yield None, None, None, "[ERROR]Введите текст для озвучивания."
         return
 
     speaker = SPEAKERS.get(speaker_name, "xenia")
     fmt = FORMATS.get(output_format, FORMATS["MP3 (192 kbps)"])
 
-    # Предобрабатываем текст
-    text = preprocess_text(text)
-    sentences = split_into_sentences(text)
-
-    if not sentences:
-        yield None, None, "[ERROR]Текст не содержит предложений."
-        return
-
-    # Разбиваем длинные предложения
-    all_chunks = []
-    for s in sentences:
-        all_chunks.extend(split_long_sentence(s))
-
-    total = len(all_chunks)
     log_lines = [
-        f"[INFO]Найдено фрагментов: {total}",
         f"[INFO]Голос: {speaker_name} ({speaker})",
-        f"[INFO]Скорость: {speed}x",
+        f"[INFO]Скорость: {speed}x" + (" (без сдвига тона)" if preserve_pitch and speed != 1.0 else ""),
         f"[INFO]Формат: {output_format}",
+        f"[INFO]Процессов синтеза: {TTS_WORKERS}",
+        "[INFO]Ударения: " + ("разметка книги" if annotated else "автоматически"),
         "",
     ]
 
-    # Подготавливаем паузу как int16 (один раз)
-    pause_samples = int(SAMPLE_RATE * pause_between_sentences)
-    pause_int16 = np.zeros(pause_samples, dtype=np.int16)
-
-    # Временный WAV-файл для потоковой записи
     timestamp = int(time.time())
     safe_title = re.sub(r'[^\w\s-]', '', mp3_tags_title or "audiobook").strip()[:50]
     safe_title = re.sub(r'\s+', '_', safe_title) if safe_title else "audiobook"
-    temp_wav_path = OUTPUT_DIR / f"_temp_{safe_title}_{timestamp}.wav"
-
-    start_time = time.time()
-    failed_chunks = 0
-    written_frames = 0
-
-    # Потоковая запись: каждый фрагмент сразу пишется на диск
-    wav_file = wave.open(str(temp_wav_path), 'wb')
-    wav_file.setnchannels(1)
-    wav_file.setsampwidth(2)  # int16
-    wav_file.setframerate(SAMPLE_RATE)
+    job_header = {
+        "title": mp3_tags_title,
+        "artist": mp3_tags_artist,
+        "speaker_name": speaker_name,
+        "speed": speed,
+        "preserve_pitch": preserve_pitch,
+        "pause": pause_between_sentences,
+        "output_format": output_format,
+        "per_chapter": per_chapter,
+        "annotated": annotated,
+    }
+
+    # Формируем итоговый файл. Главы (M4B или файл на главу) рендерятся
+    # как независимые задания внутри render_book
+    filename = f"{safe_title}_{speaker}_{timestamp}{fmt['ext']}"
+    output_path = OUTPUT_DIR / filename
 
+    # Не больше MAX_ACTIVE_JOBS заданий одновременно: ожидающий видит место
+    # в очереди и оценку старта (модель скорости eta по фрагментам задания).
+    # Фрагменты запущенных заданий чередуются
+    control = control or JobControl()
+    # Ожидание в очереди (telemetry) считается с этого момента, включая допуск
+    submitted = time.time()
+    ticket = admission.admit(
+        safe_title, [len(chunk) for chunk in split_into_chunks(text, pause_between_sentences)], speaker,
+    )
+    worker = None
+    reservation = None
     try:
-        for i, chunk in enumerate(all_chunks):
-            progress((i + 1) / total, desc=f"Озвучивание {i+1}/{total}...")
-
+        while not ticket.wait(_QUEUE_POLL_SECONDS):
+            if control.state != JobControl.RUNNING:
+                yield None, None, None, "\n".join(log_lines + ["[INFO]Задание снято с очереди."])
+                return
+            yield None, gr.update(), gr.update(), "\n".join(log_lines + [
+                f"[INFO]В очереди: позиция {ticket.position}, "
+                f"старт примерно через {_format_wait(ticket.eta_seconds)}",
+            ])
+
+        # Место под результат и временные файлы — до старта, вытесняя старые книги
+        # Каталоги _jobs этого задания (при продолжении) защищены резервом
+        try:
+            reservation = storage.reserve(
+                estimate_job_bytes(len(text), fmt, speed, per_chapter), output_path, safe_title,
+                book_job_ids(
+                    text, speaker, pause_between_sentences, fmt, per_chapter,
+                    ANNOTATED_TTS_FLAGS if annotated else APPLY_TTS_FLAGS,
+                ),
+            )
+        except StorageFull as e:
+            yield None, None, None, "\n".join(log_lines) + f"\n\n{e}"
+            return
+
+        start_time = time.time()
+        live = LiveStream(f"{safe_title}_{speaker}_{timestamp}") if LIVE_STREAM else None
+        if live and live.playlist:
+            log_lines.append(f"[INFO]Трансляция (HLS): порт {METRICS_PORT}, {live.playlist}")
+        outcome = {}
+
+        def on_progress(fraction: float, desc: str):
+            ticket.progress(fraction)
+            progress(fraction, desc=desc)
+
+        def render():
             try:
-                audio = model.apply_tts(
-                    text=chunk,
-                    speaker=speaker,
-                    sample_rate=SAMPLE_RATE,
-                    put_accent=True,
-                    put_yo=True,
-                    put_stress_homo=True,
-                    put_yo_homo=True,
+                outcome["stats"] = render_book(
+                    text, speaker, speed, pause_between_sentences, fmt, preserve_pitch,
+                    per_chapter, output_path, mp3_tags_title, mp3_tags_artist,
+                    job_header, log_lines,
+                    on_progress=on_progress,
+                    live=live,
+                    tts_flags=ANNOTATED_TTS_FLAGS if annotated else APPLY_TTS_FLAGS,
+                    control=control,
+                    submitted=submitted,
                 )
-                # Конвертируем и записываем сразу на диск
-                audio_int16 = (audio.numpy() * 32767).astype(np.int16)
-                wav_file.writeframes(audio_int16.tobytes())
-                wav_file.writeframes(pause_int16.tobytes())
-                written_frames += len(audio_int16) + pause_samples
-            except Exception as e:
-                failed_chunks += 1
-                log_lines.append(f"[WARN]Ошибка в фрагменте {i+1}/{total}: {str(e)[:100]}")
-                log_lines.append(f"   Текст: {chunk[:80]}...")
-
-                if failed_chunks > total * 0.3:
-                    wav_file.close()
-                    temp_wav_path.unlink(missing_ok=True)
-                    error_msg = (
-                        f"\n\n[ERROR]Критическая ошибка: слишком много неудачных фрагментов ({failed_chunks}/{total})\n"
-                        f"Возможные причины:\n"
-                        f"• Текст содержит некорректные символы\n"
-                        f"• Недостаточно памяти\n\n"
-                        f"Попробуйте:\n"
-                        f"• Разделить текст на части\n"
-                        f"• Проверить кодировку файла"
-                    )
-                    yield None, None, "\n".join(log_lines) + error_msg
-                    return
-                continue
-    finally:
-        wav_file.close()
-
-    if written_frames == 0:
-        temp_wav_path.unlink(missing_ok=True)
-        yield None, None, "\n".join(log_lines) + "\n\n[ERROR]Не удалось синтезировать ни одного фрагмента."
-        return
-
-    # Формируем итоговый файл
-    filename = f"{safe_title}_{speaker}_{timestamp}{fmt['ext']}"
-    output_path = OUTPUT_DIR / filename
-
-    # Конвертация: изменение скорости и/или формата
-    # pydub загружает с диска, не из RAM целиком
-    segment = AudioSegment.from_wav(str(temp_wav_path))
-
-    if speed != 1.0:
-        new_frame_rate = int(SAMPLE_RATE * speed)
-        segment = segment._spawn(
-            segment.raw_data,
-            overrides={"frame_rate": new_frame_rate},
+                if live:
+                    live.close()
+            except BaseException as e:
+                outcome["error"] = e
+                if live:
+                    live.abort()
+
+        # Синтез всегда в отдельном потоке: генератор регулярно отдаёт
+        # управление, поэтому Gradio может закрыть его при уходе клиента,
+        # и задание отменяется (finally). Контекст копируется — в нём
+        # живёт прогресс Gradio.
+        worker = threading.Thread(
+            target=contextvars.copy_context().run, args=(render,), name="synthesis", daemon=True,
         )
-        segment = segment.set_frame_rate(SAMPLE_RATE)
-
-    # Экспорт с тегами
-    export_params = dict(fmt["params"])
-    tags = {}
-    if mp3_tags_title:
-        tags["title"] = mp3_tags_title
-        tags["album"] = mp3_tags_title
-    if mp3_tags_artist:
-        tags["artist"] = mp3_tags_artist
-    if tags:
-        export_params["tags"] = tags
-
-    segment.export(str(output_path), format=fmt["format"], **export_params)
-
-    # Удаляем временный WAV
-    duration_sec = len(segment) / 1000
-    del segment
-    temp_wav_path.unlink(missing_ok=True)
-
-    elapsed = time.time() - start_time
-    file_size_mb = output_path.stat().st_size / (1024 * 1024)
+        worker.start()
+        reported_first = False
+        while True:
+            segment = gr.update()
+            if live:
+                try:
+                    segment = live.segments.get(timeout=_QUEUE_POLL_SECONDS)
+                except queue.Empty:
+                    pass
+                if segment is None:
+                    break
+            else:
+                worker.join(_QUEUE_POLL_SECONDS)
+                if not worker.is_alive():
+                    break
+            if not reported_first and live and live.first_audio_s is not None:
+                reported_first = True
+                log_lines.append(f"[INFO]Первый звук через {live.first_audio_s:.1f} сек")
+            yield segment, gr.update(), gr.update(), "\n".join(log_lines)
+        worker.join()
+
+        error = outcome.get("error")
+        if isinstance(error, JobPaused):
+            yield None, None, None, "\n".join(log_lines) + (
+                f"\n\n{error}\nГотовые фрагменты сохранены — «▶️ Продолжить» "
+                f"возобновит синтез с места остановки."
+            )
+            return
+        if isinstance(error, (SynthesisError, JobCancelled)):
+            yield None, None, None, "\n".join(log_lines) + f"\n\n{error}"
+            return
+        if error is not None:
+            raise error
+        stats = outcome["stats"]
+
+        elapsed = time.time() - start_time
+        duration_sec = stats["duration"]
+        download_path = stats["download_path"]
+        file_size_mb = Path(download_path).stat().st_size / (1024 * 1024)
+
+        log_lines.extend([
+            f"[OK]Готово за {elapsed:.1f} сек",
+            f"[INFO]Длительность: {duration_sec:.1f} сек ({duration_sec/60:.1f} мин)",
+            f"[INFO]Размер: {file_size_mb:.1f} MB",
+            f"[INFO]Кеш фрагментов: попаданий {stats['cache_hits']}, "
+            f"промахов {stats['cache_misses']}",
+            f"[INFO]Файл: {Path(download_path).name}",
+            f"[INFO]Запись задания: {stats['record_path']}",
+        ])
+
+        # Выданный результат вытесняется последним
+        touch(stats["audio_path"])
+        touch(download_path)
+        yield None, stats["audio_path"], download_path, "\n".join(log_lines)
 
-    log_lines.extend([
-        f"[OK]Готово за {elapsed:.1f} сек",
-        f"[INFO]Длительность: {duration_sec:.1f} сек ({duration_sec/60:.1f} мин)",
-        f"[INFO]Размер: {file_size_mb:.1f} MB",
-        f"[INFO]Файл: {filename}",
-    ])
-
-    yield str(output_path), str(output_path), "\n".join(log_lines)
+    finally:
+        # Генератор закрыт (вкладка закрыта, событие отменено) посреди синтеза
+        if worker is not None and worker.is_alive():
+            control.cancel()
+        ticket.release()
+        if reservation is not None:
+            reservation.release()
+
+
+def resume_job(job_id: str, progress=gr.Progress(track_tqdm=False), control: JobControl | None = None):
+    """Продолжает прерванное задание с параметрами из его манифеста."""
+    job = SynthesisJob(job_id)
+    if not job.exists():
+        yield None, None, None, f"[ERROR]Задание {job_id} не найдено."
+        return
+    job.load()
+    if "parent" in job.header:
+        # Глава продолжается в составе своей книги
+        job = SynthesisJob(job.header["parent"])
+        if not job.exists():
+            yield None, None, None, f"[ERROR]Задание {job.job_id} не найдено."
+            return
+        job.load()
+    h = job.header
+    yield from synthesize_text(
+        job.read_text(), h.get("speaker_name", ""), h.get("speed", 1.0),
+        h.get("pause", 0.5), h.get("output_format", ""),
+        h.get("title", ""), h.get("artist", ""), h.get("preserve_pitch", True),
+        h.get("per_chapter", False), progress, h.get("annotated", False), control,
+    )
 
 
 def synthesize_file(
@@ -316,11 +403,13 @@ def synthesize_file(
     output_format: str,
     mp3_tags_title: str,
     mp3_tags_artist: str,
+    preserve_pitch: bool = True,
+    per_chapter: bool = False,
     progress=gr.Progress(track_tqdm=False),
 ):
     """Синтезирует речь из загруженного файла."""
     if file is None:
-        yield None, None, "[ERROR]Загрузите текстовый файл."
+        yield None, None, None, "[ERROR]Загрузите текстовый файл."
         return
 
     file_path = file if isinstance(file, str) else file.name
@@ -330,11 +419,11 @@ def synthesize_file(
 
     if text is None:
         error_msg = f"[ERROR]Не удалось извлечь текст из файла.\n\n[DEBUG]Диагностика:\n{debug_info}"
-        yield None, None, error_msg
+        yield None, None, None, error_msg
         return
 
     if not text.strip():
-        yield None, None, "[ERROR]Файл пуст."
+        yield None, None, None, "[ERROR]Файл пуст."
         return
 
     # Если заголовок не задан — берём имя файла
@@ -343,5 +432,6 @@ def synthesize_file(
 
     yield from synthesize_text(
         text, speaker_name, speed, pause_between_sentences,
-        output_format, mp3_tags_title, mp3_tags_artist, progress,
+        output_format, mp3_tags_title, mp3_tags_artist, preserve_pitch, per_chapter,
+        progress,
     )
@@ -0,0 +1,383 @@
+"""
+Телеметрия синтеза: записи заданий в JSON и метрики в формате Prometheus
+"""
+
+import json
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from config import LIVE_DIR, METRICS_PORT, RECORDS_DIR
+
+# Границы корзин гистограмм
+_SECONDS_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+_RTF_BUCKETS = (0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1, 1.5, 2, 5)
+_CHARS_BUCKETS = (25, 50, 100, 200, 400, 600, 800, 1000)
+
+
+def _label_key(labels: dict) -> tuple:
+    return tuple(sorted(labels.items()))
+
+
+def _escape_label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(key: tuple, extra: dict | None = None) -> str:
+    items = list(key) + sorted((extra or {}).items())
+    if not items:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape_label(value)}"' for name, value in items) + "}"
+
+
+class MetricsRegistry:
+    """
+    Минимальный реестр счётчиков и гистограмм с метками.
+    Значения живут в памяти процесса; render() отдаёт текстовый
+    формат экспозиции Prometheus.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._meta: dict[str, tuple[str, str, tuple | None]] = {}
+        self._counters: dict[str, dict[tuple, float]] = {}
+        self._histograms: dict[str, dict[tuple, list]] = {}
+        self._gauge_callbacks = []
+
+    def counter(self, name: str, help_text: str):
+        self._meta[name] = ("counter", help_text, None)
+        self._counters[name] = {}
+
+    def histogram(self, name: str, help_text: str, buckets: tuple):
+        self._meta[name] = ("histogram", help_text, buckets)
+        self._histograms[name] = {}
+
+    def gauge_callback(self, fn):
+        """fn() -> [(name, help, [(labels, value), ...])], вызывается при каждом опросе."""
+        self._gauge_callbacks.append(fn)
+
+    def inc(self, name: str, value: float = 1.0, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._counters[name]
+            series[key] = series.get(key, 0.0) + value
+
+    def observe(self, name: str, value: float, **labels):
+        buckets = self._meta[name][2]
+        key = _label_key(labels)
+        with self._lock:
+            # [счётчики по корзинам..., сумма, количество]
+            state = self._histograms[name].setdefault(key, [0] * len(buckets) + [0.0, 0])
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    state[i] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            for name, (kind, help_text, buckets) in self._meta.items():
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                if kind == "counter":
+                    for key, value in self._counters[name].items():
+                        lines.append(f"{name}{_format_labels(key)} {value:.15g}")
+                    continue
+                for key, state in self._histograms[name].items():
+                    for bound, count in zip(buckets, state):
+                        lines.append(f"{name}_bucket{_format_labels(key, {'le': f'{bound:g}'})} {count}")
+                    lines.append(f"{name}_bucket{_format_labels(key, {'le': '+Inf'})} {state[-1]}")
+                    lines.append(f"{name}_sum{_format_labels(key)} {state[-2]:.15g}")
+                    lines.append(f"{name}_count{_format_labels(key)} {state[-1]}")
+        for fn in self._gauge_callbacks:
+            try:
+                gauges = fn()
+            except Exception:
+                continue
+            for name, help_text, samples in gauges:
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} gauge")
+                for labels, value in samples:
+                    lines.append(f"{name}{_format_labels(_label_key(labels))} {value:.15g}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+metrics.counter("audiobook_chunks_total", "Фрагменты по голосу и результату (ok, failed, cached)")
+metrics.counter("audiobook_chunk_chars_total", "Символов текста в обработанных фрагментах")
+metrics.counter("audiobook_audio_seconds_total", "Секунд синтезированного аудио")
+metrics.histogram("audiobook_chunk_inference_seconds", "Время apply_tts на фрагмент", _SECONDS_BUCKETS)
+metrics.histogram("audiobook_chunk_rtf", "Real-time factor фрагмента (время синтеза / длительность)", _RTF_BUCKETS)
+metrics.histogram("audiobook_chunk_chars", "Длина фрагмента в символах", _CHARS_BUCKETS)
+metrics.histogram("audiobook_chunk_write_seconds", "Запись фрагмента на диск или в кодировщик", _SECONDS_BUCKETS)
+metrics.counter("audiobook_jobs_total", "Задания по результату (ok, failed, paused, cancelled)")
+metrics.histogram("audiobook_job_queue_wait_seconds", "Ожидание до начала синтеза первого фрагмента", _SECONDS_BUCKETS)
+metrics.histogram("audiobook_job_encode_seconds", "Экспорт и кодирование задания", _SECONDS_BUCKETS)
+metrics.histogram("audiobook_job_seconds", "Полное время задания", _SECONDS_BUCKETS)
+metrics.histogram(
+    "audiobook_time_to_first_audio_seconds",
+    "От запуска задания до первого опубликованного сегмента аудио", _SECONDS_BUCKETS,
+)
+
+_active_jobs = 0
+_active_lock = threading.Lock()
+
+
+def _process_gauges():
+    from workers import memory_report
+
+    report = memory_report()
+
+    def samples(field: str):
+        return [({"role": p["role"], "pid": p["pid"]}, p[field] * 1024 * 1024) for p in report]
+
+    with _active_lock:
+        active = _active_jobs
+    return [
+        ("audiobook_jobs_active", "Выполняющиеся задания", [({}, active)]),
+        ("audiobook_process_rss_bytes", "RSS процессов синтеза", samples("rss_mb")),
+        ("audiobook_process_pss_bytes", "PSS процессов синтеза", samples("pss_mb")),
+        ("audiobook_process_peak_rss_bytes", "Пиковый RSS процессов синтеза", samples("peak_rss_mb")),
+    ]
+
+
+metrics.gauge_callback(_process_gauges)
+
+
+class JobRecord:
+    """
+    Структурированная запись задания: тайминги каждого фрагмента,
+    ожидание в очереди, кодирование и память. Одновременно обновляет
+    метрики; save() пишет JSON в RECORDS_DIR.
+    Главы рендерятся в параллельных потоках, поэтому методы под блокировкой.
+    submitted — момент постановки задания в очередь (до допуска
+    scheduler.JobAdmission): ожидание в очереди считается от него.
+    """
+
+    def __init__(self, speaker: str, title: str = "", params: dict | None = None,
+                 submitted: float | None = None):
+        self.record_id = time.strftime("%Y%m%d_%H%M%S_") + uuid.uuid4().hex[:6]
+        self.speaker = speaker
+        self.title = title
+        self.params = params or {}
+        self.created = time.time()
+        self.submitted = submitted if submitted is not None else self.created
+        self.finished: float | None = None
+        self.first_chunk_at: float | None = None
+        self.first_audio_s: float | None = None
+        self.encode_seconds = 0.0
+        self.chunks: list[dict] = []
+        self.status = "running"
+        self.error: str | None = None
+        self.result: dict = {}
+        self.memory: list[dict] = []
+        self._lock = threading.Lock()
+        global _active_jobs
+        with _active_lock:
+            _active_jobs += 1
+        # Сколько заданий шло одновременно — для оценки скорости (eta)
+        self.max_active_jobs = _active_jobs
+
+    def add_chunk(
+        self,
+        index: int,
+        chars: int,
+        audio_seconds: float,
+        inference_seconds: float | None,
+        write_seconds: float,
+        started_at: float | None,
+        cached: bool = False,
+        error: str | None = None,
+        part: int | None = None,
+    ):
+        rtf = inference_seconds / audio_seconds if inference_seconds and audio_seconds else None
+        entry = {
+            "i": index,
+            "chars": chars,
+            "audio_s": round(audio_seconds, 3),
+            "inference_s": round(inference_seconds, 4) if inference_seconds is not None else None,
+            "rtf": round(rtf, 4) if rtf is not None else None,
+            "write_s": round(write_seconds, 4),
+            "cached": cached,
+        }
+        if part is not None:
+            entry["part"] = part
+        if error:
+            entry["error"] = error[:300]
+        with self._lock:
+            self.chunks.append(entry)
+            if started_at is not None and (self.first_chunk_at is None or started_at < self.first_chunk_at):
+                self.first_chunk_at = started_at
+            self.max_active_jobs = max(self.max_active_jobs, _active_jobs)
+
+        status = "failed" if error else ("cached" if cached else "ok")
+        metrics.inc("audiobook_chunks_total", speaker=self.speaker, status=status)
+        metrics.inc("audiobook_chunk_chars_total", chars, speaker=self.speaker)
+        metrics.observe("audiobook_chunk_chars", chars)
+        metrics.observe("audiobook_chunk_write_seconds", write_seconds)
+        if not error:
+            metrics.inc("audiobook_audio_seconds_total", audio_seconds, speaker=self.speaker)
+        if inference_seconds is not None and not cached and not error:
+            metrics.observe("audiobook_chunk_inference_seconds", inference_seconds, speaker=self.speaker)
+            if rtf is not None:
+                metrics.observe("audiobook_chunk_rtf", rtf, speaker=self.speaker)
+
+    def mark_first_audio(self, seconds: float):
+        """Время до первого звука, доступного слушателю (см. live.LiveStream)."""
+        self.first_audio_s = seconds
+        metrics.observe("audiobook_time_to_first_audio_seconds", seconds)
+
+    def add_encode(self, seconds: float):
+        with self._lock:
+            self.encode_seconds += seconds
+
+    @property
+    def queue_wait(self) -> float | None:
+        return self.first_chunk_at - self.submitted if self.first_chunk_at else None
+
+    def finish(self, status: str, result: dict | None = None, error: str | None = None):
+        """Закрывает запись: итоговые метрики задания и снимок памяти."""
+        from workers import memory_report
+
+        global _active_jobs
+        with _active_lock:
+            _active_jobs -= 1
+        self.status = status
+        self.error = error
+        self.result = result or {}
+        self.memory = memory_report()
+        self.finished = time.time()
+        metrics.inc("audiobook_jobs_total", status=status)
+        metrics.observe("audiobook_job_seconds", self.finished - self.created)
+        metrics.observe("audiobook_job_encode_seconds", self.encode_seconds)
+        if self.queue_wait is not None:
+            metrics.observe("audiobook_job_queue_wait_seconds", self.queue_wait)
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            chunks = sorted(self.chunks, key=lambda c: (c.get("part", 0), c["i"]))
+        synthesized = [c for c in chunks if c["inference_s"] is not None and not c["cached"]]
+        inference = sum(c["inference_s"] for c in synthesized)
+        audio = sum(c["audio_s"] for c in synthesized)
+        return {
+            "record_id": self.record_id,
+            "title": self.title,
+            "speaker": self.speaker,
+            "params": self.params,
+            "status": self.status,
+            "error": self.error,
+            "submitted": self.submitted,
+            "created": self.created,
+            "finished": self.finished,
+            "queue_wait_s": round(self.queue_wait, 3) if self.queue_wait is not None else None,
+            "first_audio_s": round(self.first_audio_s, 3) if self.first_audio_s is not None else None,
+            "encode_s": round(self.encode_seconds, 3),
+            "max_active_jobs": self.max_active_jobs,
+            "peak_memory_mb": round(sum(p["peak_rss_mb"] for p in self.memory), 1),
+            "memory": self.memory,
+            "summary": {
+                "chunks": len(chunks),
+                "failed": sum(1 for c in chunks if "error" in c),
+                "cached": sum(1 for c in chunks if c["cached"]),
+                "chars": sum(c["chars"] for c in chunks),
+                "inference_s": round(inference, 3),
+                "write_s": round(sum(c["write_s"] for c in chunks), 3),
+                "rtf": round(inference / audio, 4) if audio else None,
+            },
+            "result": self.result,
+            "chunk_timings": chunks,
+        }
+
+    def save(self) -> str:
+        RECORDS_DIR.mkdir(parents=True, exist_ok=True)
+        path = RECORDS_DIR / f"{self.record_id}.json"
+        path.write_text(json.dumps(self.to_dict(), ensure_ascii=False, indent=1), encoding="utf-8")
+        return str(path)
+
+
+def _touch(path):
+    """Обращение через HTTP продлевает жизнь артефакта (см. storage)."""
+    from storage import touch as touch_artifact
+
+    touch_artifact(path)
+
+
+# Файлы HLS-трансляций: плейлист перечитывается клиентом, сегменты неизменны
+_LIVE_TYPES = {
+    ".m3u8": ("application/vnd.apple.mpegurl", "no-cache"),
+    ".ts": ("video/mp2t", "max-age=3600"),
+}
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.startswith("/live/"):
+            self._send_live(self.path.split("?")[0][len("/live/"):])
+            return
+        if self.path.split("?")[0] == "/metrics":
+            body = metrics.render().encode("utf-8")
+            content_type = "text/plain; version=0.0.4; charset=utf-8"
+        elif self.path.startswith("/records/"):
+            record_id = self.path[len("/records/"):].removesuffix(".json")
+            path = RECORDS_DIR / f"{record_id}.json"
+            if "/" in record_id or not path.is_file():
+                self.send_error(404)
+                return
+            body = path.read_bytes()
+            content_type = "application/json; charset=utf-8"
+            _touch(path)
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_live(self, relative: str):
+        parts = relative.split("/")
+        if len(parts) != 2 or any(p in ("", ".", "..") for p in parts):
+            self.send_error(404)
+            return
+        path = LIVE_DIR / parts[0] / parts[1]
+        kind = _LIVE_TYPES.get(path.suffix)
+        try:
+            body = path.read_bytes() if kind else None
+        except OSError:
+            body = None
+        if body is None:
+            self.send_error(404)
+            return
+        # Слушаемая трансляция не вытесняется по квоте
+        _touch(path.parent)
+        self.send_response(200)
+        self.send_header("Content-Type", kind[0])
+        self.send_header("Cache-Control", kind[1])
+        # Плейлист открывается веб-плеерами с других адресов
+        self.send_header("Access-Control-Allow-Origin", "*")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(port: int = METRICS_PORT):
+    """
+    Поднимает /metrics, /records/<id>.json и /live/<id>/index.m3u8
+    в фоновом потоке (port 0 — выключено).
+    """
+    if port <= 0:
+        return None
+    try:
+        server = ThreadingHTTPServer(("0.0.0.0", port), _MetricsHandler)
+    except OSError as e:
+        print(f"[WARN] Метрики недоступны: порт {port}: {e}")
+        return None
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    print(f"[INFO] Метрики: http://0.0.0.0:{port}/metrics")
+    return server
@@ -0,0 +1,41 @@
+"""
+Общая настройка тестов
+
+config читает переменные окружения и создаёт каталоги при импорте,
+поэтому окружение задаётся здесь, до импорта модулей приложения:
+результаты и кеш — во временном каталоге, синтез в одном потоке
+основного процесса (модель — заглушка из benchmark), без кеша фрагментов,
+трансляции и квоты.
+"""
+
+import atexit
+import os
+import shutil
+import sys
+import tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+_workdir = tempfile.mkdtemp(prefix="audiobook_tests_")
+atexit.register(shutil.rmtree, _workdir, ignore_errors=True)
+os.chdir(_workdir)
+os.environ.update({
+    "CACHE_DIR": os.path.join(_workdir, "cache"),
+    "TTS_WORKERS": "1",
+    "TTS_WARMUP": "0",
+    "CHUNK_CACHE_MAX_MB": "0",
+    "CHUNK_TARGET_CHARS": "800",
+    "FIRST_CHUNK_CHARS": "200",
+    "DEDUP_MEMO_MB": "64",
+    "DEDUP_SPILL_MB": "256",
+    "DEDUP_SENTENCE_CHARS": "80",
+    "LIVE_STREAM": "0",
+    "STREAM_EXPORT": "0",
+    "AUDIO_POSTPROCESS": "0",
+    "OUTPUT_QUOTA_MB": "0",
+    "OUTPUT_MIN_FREE_MB": "0",
+    "PREVIEW_WARMUP": "0",
+    "ACCENT_ANNOTATION": "0",
+})
+sys.path.insert(0, str(ROOT))
@@ -0,0 +1,105 @@
+"""Память повторов задания: попадания, выгрузка на диск и повторы в упаковке фрагментов."""
+
+import random
+from concurrent.futures import Future
+
+import numpy as np
+import pytest
+
+import tts_model
+from benchmark import StubTTSModel
+from chunk_cache import ChunkMemo, normalize_chunk
+from config import FORMATS, SAMPLE_RATE
+from pipeline import render_book
+from text_processing import iter_packed, split_into_chunks
+from workers import APPLY_TTS_FLAGS
+
+
+def pcm(value: int, samples: int) -> np.ndarray:
+    return np.full(samples, value, dtype=np.int16)
+
+
+@pytest.fixture
+def memo(tmp_path):
+    memo = ChunkMemo(max_bytes=1000, spill_bytes=3000, spill_root=tmp_path / "dedup")
+    yield memo
+    memo.close()
+
+
+def test_key_ignores_whitespace_and_dialogue_dash():
+    assert ChunkMemo.key("— Да.", "xenia", APPLY_TTS_FLAGS) == ChunkMemo.key("Да.", "xenia", APPLY_TTS_FLAGS)
+    assert ChunkMemo.key("Да.", "xenia", APPLY_TTS_FLAGS) != ChunkMemo.key("Да.", "aidar", APPLY_TTS_FLAGS)
+
+
+def test_hit_after_put_and_inflight_future(memo):
+    assert memo.lookup("a") is None
+    future = Future()
+    memo.reserve("a", future)
+    assert memo.lookup("a") is future
+    memo.put("a", pcm(1, 10))
+    assert np.array_equal(memo.lookup("a"), pcm(1, 10))
+    assert (memo.hits, memo.lookups) == (2, 3)
+
+
+def test_discard_forgets_failed_synthesis(memo):
+    memo.reserve("a", Future())
+    memo.discard("a")
+    assert memo.lookup("a") is None
+
+
+def test_lru_spills_to_disk_and_reads_back(memo):
+    # 100 сэмплов = 200 байт: в RAM (до 1000 байт) помещаются пять
+    for i in range(6):
+        memo.put(str(i), pcm(i, 100))
+    assert "0" not in memo._ram and "0" in memo._disk
+    assert memo._ram_total <= memo.max_bytes
+    assert np.array_equal(memo.lookup("0"), pcm(0, 100))
+
+
+def test_large_entry_goes_to_disk_and_disk_is_bounded(memo):
+    # Больше восьмой части бюджета — сразу на диск; диск не больше 3000 байт
+    for i in range(5):
+        memo.put(f"big{i}", pcm(i, 600))
+    assert memo._ram_total == 0
+    assert memo._disk_total <= memo.spill_bytes
+    assert memo.lookup("big0") is None
+    assert np.array_equal(memo.lookup("big4"), pcm(4, 600))
+    spill_dir = memo._spill_dir
+    memo.close()
+    assert not spill_dir.exists()
+
+
+def test_repeats_are_isolated_when_whole_text_is_known():
+    sentences = ["Он вошёл в комнату.", "— Да.", "Она посмотрела в окно.", "— Да.", "Тишина."]
+    chunks = split_into_chunks(" ".join(sentences), target_chars=800)
+    assert chunks == ["Он вошёл в комнату.", "— Да.", "Она посмотрела в окно.", "— Да.", "Тишина."]
+
+
+def test_streaming_isolates_repeats_from_second_occurrence():
+    sentences = ["— Да.", "Он вошёл в комнату.", "— Да.", "Тишина."]
+    chunks = list(iter_packed(sentences, target_chars=800, first_chars=0))
+    assert chunks == ["— Да. Он вошёл в комнату.", "— Да.", "Тишина."]
+
+
+def test_long_repeats_are_packed():
+    long = "Очень длинное повторяющееся предложение. " * 3
+    chunks = list(iter_packed([long, "Да.", long], target_chars=800, first_chars=0, repeat_chars=80))
+    assert len(chunks) == 1
+
+
+def test_dedup_hits_with_default_packing(tmp_path):
+    tts_model.use_model(StubTTSModel(SAMPLE_RATE))
+    rng = random.Random(1)
+    lines = [
+        rng.choice(["— Да.", "— Нет.", "— Не знаю.", f"Он подумал о событии {i} того долгого дня."])
+        for i in range(200)
+    ]
+    text = "\n".join(lines)
+    stats = render_book(
+        text, "xenia", 1.0, 0.3, FORMATS["WAV (без сжатия)"], True, False,
+        tmp_path / "book.wav", "T", "", {}, [],
+    )
+    chunks = split_into_chunks(text, 0.3)
+    unique = {normalize_chunk(c) for c in chunks}
+    assert stats["dedup_hits"] == len(chunks) - len(unique)
+    assert stats["dedup_hits"] > len(chunks) / 2
@@ -0,0 +1,54 @@
+"""Пакетная конвертация: пути результатов для одноимённых книг."""
+
+import json
+import wave
+
+import pytest
+
+import cli
+import tts_model
+from benchmark import StubTTSModel
+from config import SAMPLE_RATE
+
+
+@pytest.fixture(autouse=True)
+def stub_model():
+    tts_model.use_model(StubTTSModel(SAMPLE_RATE))
+
+
+def _book(path, text):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text, encoding="utf-8")
+    return path
+
+
+def _duration(path) -> float:
+    with wave.open(str(path)) as f:
+        return f.getnframes() / f.getframerate()
+
+
+def test_same_stem_books_in_subdirectories_keep_separate_outputs(tmp_path):
+    books = tmp_path / "books"
+    _book(books / "a" / "book.txt", "Короткая книга.")
+    _book(books / "b" / "book.txt", "Совсем другая книга, заметно длиннее первой. " * 5)
+    out = tmp_path / "out"
+    summary = tmp_path / "summary.json"
+
+    code = cli.main([str(books), "-o", str(out), "-f", "wav", "--jobs", "2", "--summary", str(summary)])
+    assert code == 0
+    results = json.loads(summary.read_text(encoding="utf-8"))["books"]
+    assert sorted(r["output"] for r in results) == [str(out / "a" / "book.wav"), str(out / "b" / "book.wav")]
+    assert _duration(out / "a" / "book.wav") < _duration(out / "b" / "book.wav")
+    assert not list(out.rglob(".*.part*"))
+
+
+def test_books_with_the_same_output_are_rejected(tmp_path):
+    _book(tmp_path / "books" / "book.txt", "Первая книга.")
+    _book(tmp_path / "books" / "book.fb2", "<FictionBook/>")
+    _book(tmp_path / "other" / "book.txt", "Третья книга.")
+    out = tmp_path / "out"
+
+    assert cli.main([str(tmp_path / "books"), "-o", str(out), "-f", "wav"]) == 2
+    assert cli.main([str(tmp_path / "books" / "book.txt"), str(tmp_path / "other" / "book.txt"),
+                     "-o", str(out), "-f", "wav"]) == 2
+    assert not out.exists() or not list(out.iterdir())
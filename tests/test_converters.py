@@ -0,0 +1,160 @@
+"""Потоковые конвертеры на небольших файлах-фикстурах."""
+
+from pathlib import Path
+
+import pytest
+
+from converters import (
+    convert_to_text, detect_encoding, iter_docx_paragraphs, iter_epub_paragraphs, iter_fb2_paragraphs,
+    iter_txt_paragraphs, open_paragraph_stream,
+)
+from text_processing import detect_chapters
+
+FIXTURES = Path(__file__).resolve().parent / "fixtures"
+
+DOCX_PARAGRAPHS = [
+    "# Глава 1",
+    "Первый абзац первой главы.",
+    "Текст с уровнем структуры 9.",
+    "Разбитый на части абзац.",
+    "# Глава 2",
+    "Абзац второй главы.",
+]
+
+
+def test_docx_paragraphs_and_headings():
+    # Заголовки — по стилю Heading1 и уровню структуры 0; уровень 9 — основной текст
+    assert list(iter_docx_paragraphs(str(FIXTURES / "book.docx"))) == DOCX_PARAGRAPHS
+
+
+def test_docx_progress_reaches_end():
+    progress = {}
+    list(iter_docx_paragraphs(str(FIXTURES / "book.docx"), progress))
+    assert progress["fraction"] == 1.0
+
+
+def test_docx_convert_to_text_and_chapters():
+    text, debug = convert_to_text(str(FIXTURES / "book.docx"))
+    assert text == "\n".join(DOCX_PARAGRAPHS)
+    assert "[OK]" in debug
+    assert [c["title"] for c in detect_chapters(text)] == ["Глава 1", "Глава 2"]
+
+
+def test_docx_stream_matches_full_text():
+    stream = open_paragraph_stream(str(FIXTURES / "book.docx"))
+    assert list(stream) == DOCX_PARAGRAPHS
+
+
+def test_broken_docx_reports_error(tmp_path):
+    path = tmp_path / "broken.docx"
+    path.write_bytes(b"not a zip")
+    text, debug = convert_to_text(str(path))
+    assert text is None
+    assert "[ERROR]" in debug
+
+
+TXT_PARAGRAPHS = [
+    "Глава 1",
+    "Жили-были дед и баба, и была у них курочка ряба.\nСнесла курочка яичко, не простое, а золотое.",
+    "Глава 2",
+    "Дед бил, бил — не разбил. Баба била, била — не разбила.",
+]
+
+
+def test_txt_cp1251_paragraphs_and_encoding():
+    progress = {}
+    paragraphs = list(iter_txt_paragraphs(str(FIXTURES / "book_cp1251.txt"), progress))
+    assert paragraphs == TXT_PARAGRAPHS
+    assert progress == {"encoding": "cp1251", "fraction": 1.0, "replaced": 0}
+
+
+def test_txt_convert_normalizes_line_endings():
+    text, debug = convert_to_text(str(FIXTURES / "book_cp1251.txt"))
+    assert "\r" not in text
+    assert text.split("\n\n") == TXT_PARAGRAPHS[:-1] + [TXT_PARAGRAPHS[-1] + "\n"]
+    assert "[OK]Кодировка: cp1251" in debug
+
+
+def test_txt_cp1251_after_long_latin_preamble(tmp_path):
+    # Лицензия на английском длиннее выборки кодировки, затем русский текст
+    preamble = "This e-book is distributed under a free license.\r\n" * 8000
+    russian = "Глава 1\r\n\r\nЖили-были дед и баба, и была у них курочка ряба."
+    path = tmp_path / "book.txt"
+    path.write_bytes((preamble + "\r\n" + russian).encode("cp1251"))
+
+    progress = {}
+    paragraphs = list(iter_txt_paragraphs(str(path), progress))
+    assert paragraphs[-2:] == ["Глава 1", "Жили-были дед и баба, и была у них курочка ряба."]
+    assert progress["encoding"] == "cp1251" and progress["replaced"] == 0
+    # Порции до русского текста прочитаны как UTF-8 и не перечитываются
+    assert 0 < progress["redetected_at"] < len(preamble)
+
+    text, debug = convert_to_text(str(path))
+    assert "\ufffd" not in text and "\r" not in text
+    assert text.endswith(russian.replace("\r\n", "\n"))
+    assert "[OK]Кодировка: cp1251" in debug
+
+
+def test_txt_broken_utf8_after_latin_preamble_is_reported(tmp_path):
+    path = tmp_path / "book.txt"
+    path.write_bytes(b"Preamble line.\n" * 6000 + "Текст с битым байтом".encode("utf-8") + b"\xff\n")
+    text, debug = convert_to_text(str(path))
+    assert text.endswith("Текст с битым байтом\ufffd\n")
+    assert "[WARN]Недекодируемых символов заменено: 1" in debug
+
+
+@pytest.mark.parametrize("encoding", ["utf-8", "utf-16", "cp1251", "cp866"])
+def test_detect_encoding_russian(encoding):
+    sample = "Жили-были дед и баба, и была у них курочка ряба. Снесла курочка яичко.".encode(encoding)
+    if encoding == "utf-16":
+        assert detect_encoding(sample).startswith("utf-16")
+    else:
+        assert detect_encoding(sample) == encoding
+
+
+def test_detect_encoding_utf8_cut_mid_character():
+    sample = "Курочка ряба".encode("utf-8")[:-1]
+    assert detect_encoding(sample, final=False) == "utf-8"
+
+
+def test_detect_encoding_western_latin1():
+    assert detect_encoding("Café crème brûlée à la française.".encode("latin-1")) == "latin-1"
+
+
+def test_fb2_skips_metadata_notes_and_binaries():
+    progress = {}
+    paragraphs = list(iter_fb2_paragraphs(str(FIXTURES / "book.fb2"), progress))
+    assert paragraphs == [
+        "Сказка",
+        "# Глава 1. Курочка",
+        "Жили-были дед и баба.",
+        "Снесла курочка яичко.",
+        "# Глава 2",
+        "Яичко",
+        "Дед бил, бил — не разбил.",
+    ]
+    assert progress["fraction"] > 0.5
+
+
+def test_epub_follows_spine_and_toc():
+    progress = {}
+    paragraphs = list(iter_epub_paragraphs(str(FIXTURES / "book.epub"), progress))
+    # Название первой главы — из оглавления; сноски (linear="no", noteref) не читаются
+    assert paragraphs == [
+        "# Глава 1",
+        "Жили-были дед и баба.",
+        "Снесла курочка яичко.",
+        "# Глава 2",
+        "Дед бил, бил — не разбил.",
+    ]
+    assert progress["fraction"] == 1.0
+
+
+@pytest.mark.parametrize("name, titles", [
+    # Заголовок тела FB2 — название книги, а не глава
+    ("book.fb2", ["Начало", "Глава 1. Курочка", "Глава 2"]),
+    ("book.epub", ["Глава 1", "Глава 2"]),
+])
+def test_fb2_epub_chapters(name, titles):
+    text, _ = convert_to_text(str(FIXTURES / name))
+    assert [c["title"] for c in detect_chapters(text)] == titles
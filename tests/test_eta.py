@@ -0,0 +1,50 @@
+"""Модель скорости синтеза: регрессия время = a + b·символы."""
+
+import pytest
+
+from eta import _LineFit
+
+
+def _fit(points) -> _LineFit:
+    fit = _LineFit()
+    for x, y in points:
+        fit.add(x, y)
+    return fit
+
+
+def test_exact_line_is_recovered():
+    fit = _fit([(x, 0.5 + 0.01 * x) for x in (100, 200, 400, 800)])
+    result = fit.solve()
+    assert result["a"] == pytest.approx(0.5)
+    assert result["b"] == pytest.approx(0.01)
+    assert result["variance"] == pytest.approx(0.0, abs=1e-9)
+    seconds, variance = fit.predict(result, chunks=10, chars=3000)
+    assert seconds == pytest.approx(35.0)
+    assert variance == pytest.approx(0.0, abs=1e-6)
+
+
+def test_equal_lengths_fall_back_to_line_through_origin():
+    fit = _fit([(300, 3.0), (300, 3.2), (300, 2.8)])
+    result = fit.solve()
+    assert result["a"] == 0.0 and result["det"] is None
+    assert result["b"] == pytest.approx(0.01)
+
+
+def test_negative_intercept_falls_back_to_line_through_origin():
+    fit = _fit([(100, 0.5), (200, 1.6), (400, 3.8)])
+    result = fit.solve()
+    assert result["a"] == 0.0
+    assert result["b"] > 0
+
+
+def test_too_few_points_give_no_fit():
+    assert _fit([(100, 1.0), (200, 2.0)]).solve() is None
+    assert _LineFit().solve() is None
+
+
+def test_decay_keeps_fit_but_lowers_weight():
+    fit = _fit([(x, 0.5 + 0.01 * x) for x in (100, 200, 400, 800)])
+    fit.decay(0.5)
+    assert fit.n == 2.0
+    # После затухания точек меньше трёх — оценки нет
+    assert fit.solve() is None
@@ -0,0 +1,188 @@
+"""Продолжение задания по манифесту: результат совпадает с непрерывным рендером."""
+
+import wave
+
+import pytest
+
+import pipeline
+import tts_model
+from benchmark import StubTTSModel
+from config import FORMATS, JOBS_DIR, SAMPLE_RATE
+from jobs import JobCancelled, JobControl, JobPaused, SynthesisJob, list_interrupted_jobs
+from pipeline import render_book, render_text
+from text_processing import detect_chapters, split_into_chunks
+
+TEXT = " ".join(f"Предложение номер {i} для проверки продолжения." for i in range(60))
+BOOK = "\n\n".join(
+    f"Глава {n}\n" + " ".join(f"Предложение {i} главы {n} для проверки." for i in range(30))
+    for n in (1, 2, 3)
+)
+WAV = FORMATS["WAV (без сжатия)"]
+
+
+@pytest.fixture(autouse=True)
+def stub_model():
+    tts_model.use_model(StubTTSModel(SAMPLE_RATE))
+
+
+def _render(output_path, on_progress=None, control=None):
+    return render_text(
+        TEXT, "xenia", 0.2, 1.0, True, WAV, output_path, {}, {}, [],
+        on_progress=on_progress, control=control,
+    )
+
+
+def _frames(path) -> bytes:
+    with wave.open(str(path)) as f:
+        return f.readframes(f.getnframes())
+
+
+def _job_dirs() -> list:
+    return sorted(JOBS_DIR.iterdir()) if JOBS_DIR.exists() else []
+
+
+def test_resume_after_pause_is_byte_identical(tmp_path):
+    reference = tmp_path / "reference.wav"
+    stats = _render(reference)
+    assert stats["chunks"] > 3
+    assert _job_dirs() == []
+
+    control = JobControl()
+
+    def pause_after_two(done, total):
+        if done == 2:
+            control.pause()
+
+    with pytest.raises(JobPaused):
+        _render(tmp_path / "resumed.wav", pause_after_two, control)
+    (job_dir,) = _job_dirs()
+    job = SynthesisJob(job_dir.name)
+    job.load()
+    assert len(job.entries) == 2
+
+    log_lines = []
+    render_text(TEXT, "xenia", 0.2, 1.0, True, WAV, tmp_path / "resumed.wav", {}, {}, log_lines)
+    assert any("Продолжение задания" in line for line in log_lines)
+    assert _frames(tmp_path / "resumed.wav") == _frames(reference)
+    assert _job_dirs() == []
+
+
+def test_truncated_manifest_line_is_ignored(tmp_path):
+    control = JobControl()
+
+    def pause_after_three(done, total):
+        if done == 3:
+            control.pause()
+
+    with pytest.raises(JobPaused):
+        _render(tmp_path / "out.wav", pause_after_three, control)
+    (job_dir,) = _job_dirs()
+    # Процесс упал посреди записи строки манифеста
+    with open(job_dir / "manifest.jsonl", "a", encoding="utf-8") as f:
+        f.write('{"i": 3, "hash": "ab')
+    job = SynthesisJob(job_dir.name)
+    job.load()
+    assert [e["i"] for e in job.entries] == [0, 1, 2]
+
+    _render(tmp_path / "out.wav")
+    _render(tmp_path / "reference.wav")
+    assert _frames(tmp_path / "out.wav") == _frames(tmp_path / "reference.wav")
+
+
+def test_cancel_removes_job(tmp_path):
+    control = JobControl()
+
+    def cancel_after_one(done, total):
+        control.cancel()
+
+    with pytest.raises(JobCancelled):
+        _render(tmp_path / "out.wav", cancel_after_one, control)
+    assert _job_dirs() == []
+
+
+def _render_book(output_path, control=None, on_progress=None):
+    return render_book(
+        BOOK, "xenia", 1.0, 0.2, WAV, True, True, output_path, "Книга", "",
+        {"title": "Книга", "per_chapter": True}, [], on_progress, control=control,
+    )
+
+
+def test_chapter_jobs_resume_as_one_book(tmp_path):
+    control = JobControl()
+    control.pause()
+    with pytest.raises(JobPaused):
+        _render_book(tmp_path / "book.wav", control)
+    # Задания глав не показываются: продолжается книга целиком
+    (listed,) = list_interrupted_jobs()
+    book = SynthesisJob(listed["job_id"])
+    book.load()
+    assert listed["title"] == "Книга"
+    assert book.read_text() == BOOK
+    assert len(book.header["parts"]) == 3
+    for part_id in book.header["parts"]:
+        part = SynthesisJob(part_id)
+        if part.exists():
+            part.load()
+            assert part.header["parent"] == book.job_id
+
+    stats = _render_book(tmp_path / "book.wav")
+    assert stats["chapters"] == 3 and stats["failed_chapters"] == 0
+    assert _job_dirs() == []
+
+
+class CountingControl(JobControl):
+    """Считает проверки между фрагментами; пауза на проверке номер pause_at."""
+
+    def __init__(self, pause_at: int | None = None):
+        super().__init__()
+        self.calls = 0
+        self.pause_at = pause_at
+
+    def check(self):
+        self.calls += 1
+        if self.calls == self.pause_at:
+            self.pause()
+        super().check()
+
+
+def test_paused_book_keeps_finished_chapters(tmp_path, monkeypatch):
+    # Главы по одной: пауза детерминированно приходится на вторую главу
+    monkeypatch.setattr(pipeline, "CHAPTER_WORKERS", 1)
+    sizes = [len(split_into_chunks(c["text"], 0.2)) for c in detect_chapters(BOOK)]
+    _render_book(tmp_path / "reference.wav")
+
+    # Проверки: начало главы и каждый фрагмент; пауза после двух фрагментов главы 2
+    control = CountingControl(pause_at=(1 + sizes[0]) + 1 + 3)
+    with pytest.raises(JobPaused):
+        _render_book(tmp_path / "book.wav", control)
+    (listed,) = list_interrupted_jobs()
+    assert listed["done"] == sizes[0] + 2
+    book = SynthesisJob(listed["job_id"])
+    book.load()
+    assert (book.dir / book.parts_done()[0]["file"]).exists()
+    assert not list(tmp_path.glob("book_*.wav"))
+
+    # Готовая глава не синтезируется заново, начатая продолжается
+    control = CountingControl()
+    stats = _render_book(tmp_path / "book.wav", control)
+    assert control.calls == (1 + sizes[1] - 2) + (1 + sizes[2])
+    assert stats["chunks"] == sum(sizes)
+    for i in (1, 2, 3):
+        assert _frames(tmp_path / f"book_{i:02d}.wav") == _frames(tmp_path / f"reference_{i:02d}.wav")
+    assert _job_dirs() == []
+
+
+def test_cancelled_book_removes_parked_chapters(tmp_path, monkeypatch):
+    monkeypatch.setattr(pipeline, "CHAPTER_WORKERS", 1)
+    sizes = [len(split_into_chunks(c["text"], 0.2)) for c in detect_chapters(BOOK)]
+    with pytest.raises(JobPaused):
+        _render_book(tmp_path / "book.wav", CountingControl(pause_at=(1 + sizes[0]) + 1 + 3))
+    # Книга, начатая глава 2 и созданное задание главы 3
+    assert len(_job_dirs()) == 3
+
+    control = JobControl()
+    control.cancel()
+    with pytest.raises(JobCancelled):
+        _render_book(tmp_path / "book.wav", control)
+    assert _job_dirs() == []
+    assert not list(tmp_path.glob("book_*.wav"))
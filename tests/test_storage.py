@@ -0,0 +1,108 @@
+"""Квота каталога результатов: порядок вытеснения и защищённые артефакты."""
+
+import os
+import shutil
+import time
+
+import pytest
+
+from config import OUTPUT_DIR
+from storage import StorageFull, StorageManager, touch
+
+KB = 1024
+
+
+@pytest.fixture(autouse=True)
+def clean_output():
+    shutil.rmtree(OUTPUT_DIR, ignore_errors=True)
+    OUTPUT_DIR.mkdir()
+    yield
+    shutil.rmtree(OUTPUT_DIR, ignore_errors=True)
+
+
+def _artifact(name: str, size_kb: int, age_hours: float):
+    """Файл (или каталог задания в _jobs) заданного размера и возраста."""
+    mtime = time.time() - age_hours * 3600
+    if name.startswith("_jobs/"):
+        path = OUTPUT_DIR / name
+        path.mkdir(parents=True)
+        data = path / "chunk.pcm"
+    else:
+        path = data = OUTPUT_DIR / name
+    data.write_bytes(b"\0" * size_kb * KB)
+    os.utime(data, (mtime, mtime))
+    os.utime(path, (mtime, mtime))
+    return path
+
+
+def test_oldest_artifacts_are_evicted_first():
+    old = _artifact("old.mp3", 40, 30)
+    middle = _artifact("middle.mp3", 40, 20)
+    new = _artifact("new.mp3", 40, 10)
+    manager = StorageManager(OUTPUT_DIR, 110 * KB, 0)
+    manager.reserve(30 * KB, OUTPUT_DIR / "book.mp3")
+    # 120 + 30 > 110: хватает вытеснить один самый старый
+    assert not old.exists()
+    assert middle.exists() and new.exists()
+
+
+def test_touched_artifact_is_evicted_last():
+    first = _artifact("first.mp3", 40, 30)
+    second = _artifact("second.mp3", 40, 20)
+    touch(first)
+    manager = StorageManager(OUTPUT_DIR, 100 * KB, 0)
+    manager.reserve(30 * KB, OUTPUT_DIR / "book.mp3")
+    # Недавнее обращение защищает файл
+    assert first.exists() and not second.exists()
+
+
+def test_reserved_job_dir_is_not_evicted_by_its_own_reservation():
+    job_dir = _artifact("_jobs/resumed", 40, 30)
+    other = _artifact("other.mp3", 40, 20)
+    manager = StorageManager(OUTPUT_DIR, 60 * KB, 0)
+    # Каталог задания учтён резервом: 40 + 30 > 60 вытесняет только чужой файл
+    reservation = manager.reserve(30 * KB, OUTPUT_DIR / "book.mp3", job_ids=["resumed"])
+    assert job_dir.exists() and not other.exists()
+    reservation.release()
+
+
+def test_job_output_files_are_protected_by_reservation():
+    own = _artifact("book.mp3", 40, 30)
+    chapter = _artifact("_chapter_book_01.mp3", 40, 30)
+    other = _artifact("other.mp3", 40, 20)
+    manager = StorageManager(OUTPUT_DIR, 90 * KB, 0)
+    manager.reserve(60 * KB, OUTPUT_DIR / "book.mp3")
+    assert own.exists() and chapter.exists()
+    assert not other.exists()
+
+
+def test_kept_artifacts_are_not_evicted():
+    earlier = _artifact("earlier_book.mp3", 40, 30)
+    manager = StorageManager(OUTPUT_DIR, 60 * KB, 0)
+    manager.keep(earlier)
+    with pytest.raises(StorageFull):
+        manager.reserve(30 * KB, OUTPUT_DIR / "next_book.mp3")
+    assert earlier.exists()
+    assert manager.reserved_bytes == 0
+
+
+def test_storage_full_deletes_nothing():
+    old = _artifact("old.mp3", 40, 30)
+    recent = _artifact("recent.mp3", 40, 0)
+    manager = StorageManager(OUTPUT_DIR, 100 * KB, 0)
+    # Вытеснить можно только 40 KB из нужных 60 KB — ничего не удаляется
+    with pytest.raises(StorageFull):
+        manager.reserve(80 * KB, OUTPUT_DIR / "book.mp3")
+    assert old.exists() and recent.exists()
+    assert manager.reserved_bytes == 0
+
+
+def test_release_enforces_quota_without_raising():
+    manager = StorageManager(OUTPUT_DIR, 100 * KB, 0)
+    old = _artifact("old.mp3", 40, 30)
+    reservation = manager.reserve(10 * KB, OUTPUT_DIR / "book.mp3")
+    # Задание записало больше резерва, но результат свежий
+    _artifact("book.mp3", 90, 0)
+    reservation.release()
+    assert not old.exists()
+    assert (OUTPUT_DIR / "book.mp3").exists()
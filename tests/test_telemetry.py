@@ -0,0 +1,24 @@
+"""Запись задания: ожидание в очереди считается от постановки в очередь."""
+
+import time
+
+import pytest
+
+from telemetry import JobRecord
+
+
+def test_queue_wait_includes_admission_wait():
+    submitted = time.time() - 5.0
+    record = JobRecord("xenia", "Книга", submitted=submitted)
+    record.add_chunk(0, 100, 2.0, 0.5, 0.01, record.created + 1.0)
+    record.finish("ok")
+    data = record.to_dict()
+    assert data["submitted"] == submitted
+    assert data["queue_wait_s"] == pytest.approx(record.created + 1.0 - submitted, abs=1e-3)
+
+
+def test_queue_wait_without_submission_time_starts_at_creation():
+    record = JobRecord("xenia")
+    record.add_chunk(0, 100, 2.0, 0.5, 0.01, record.created + 1.0)
+    record.finish("ok")
+    assert record.queue_wait == pytest.approx(1.0)
@@ -0,0 +1,89 @@
+"""Сегментация текста: длинные предложения, упаковка во фрагменты и главы."""
+
+from accents import count_accents
+from text_processing import detect_chapters, iter_packed, split_into_chunks, split_long_sentence
+
+
+def test_short_sentence_is_not_split():
+    assert split_long_sentence("Короткое предложение.", max_chars=100) == ["Короткое предложение."]
+
+
+def test_long_sentence_splits_on_punctuation_within_limit():
+    sentence = ", ".join(f"часть номер {i}" for i in range(40)) + "."
+    parts = split_long_sentence(sentence, max_chars=100)
+    assert len(parts) > 1
+    assert all(len(p) <= 100 for p in parts)
+    assert " ".join(parts) == sentence
+
+
+def test_word_longer_parts_split_by_words():
+    sentence = " ".join(["слово"] * 100)
+    parts = split_long_sentence(sentence, max_chars=50)
+    assert all(len(p) <= 50 for p in parts)
+    assert " ".join(parts).split() == sentence.split()
+
+
+def test_packing_respects_target_and_first_chunk():
+    sentences = [f"Предложение номер {i} средней длины." for i in range(50)]
+    chunks = list(iter_packed(sentences, target_chars=200, first_chars=80, repeat_chars=0))
+    assert len(chunks[0]) <= 80
+    assert all(len(c) <= 200 for c in chunks)
+    assert " ".join(chunks) == " ".join(sentences)
+
+
+def test_packing_with_pause_uses_ssml_breaks():
+    chunks = list(iter_packed(["Да.", "Нет.", "A < B."], target_chars=200, pause=0.5,
+                              first_chars=0, repeat_chars=0))
+    assert chunks == ['<speak>Да. <break time="500ms"/> Нет. <break time="500ms"/> A &lt; B.</speak>']
+
+
+def test_single_sentence_stays_plain_text():
+    assert list(iter_packed(["Одно."], target_chars=200, pause=0.5, repeat_chars=0)) == ["Одно."]
+
+
+def test_oversized_sentence_gets_its_own_chunk():
+    long = "x" * 300
+    chunks = list(iter_packed(["Да.", long, "Нет."], target_chars=200, first_chars=0, repeat_chars=0))
+    assert chunks == ["Да.", long, "Нет."]
+
+
+def test_split_into_chunks_keeps_all_text():
+    text = "Первое предложение. Второе предложение!\n\nТретье? Четвёртое…"
+    chunks = split_into_chunks(text, target_chars=800)
+    assert chunks == ["Первое предложение. Второе предложение! Третье? Четвёртое…"]
+
+
+BOOK = "Глава 1\nПервая глава.\n\nГлава 2\nВторая глава.\n"
+# Разметка ударений (accents): знак + перед ударной гласной
+ANNOTATED = "Гл+ава 1\nП+ервая гл+ава.\n\nГл+ава 2\nВтор+ая гл+ава.\n"
+
+
+def test_detect_chapters_on_source_text():
+    assert [c["title"] for c in detect_chapters(BOOK)] == ["Глава 1", "Глава 2"]
+
+
+def test_detect_chapters_on_annotated_text():
+    chapters = detect_chapters(ANNOTATED)
+    assert [c["title"] for c in chapters] == ["Глава 1", "Глава 2"]
+    # Текст глав остаётся размеченным — его читает модель
+    assert chapters[1]["text"] == "Гл+ава 2\nВтор+ая гл+ава."
+
+
+def test_count_accents_ignores_user_plus_signs():
+    source = "Счёт 2+2 и C++.\nЗам+ок на двери."
+    annotated = "Сч+ёт 2+2 и C++.\nЗам+ок на дв+ери."
+    assert count_accents(source, annotated) == 2
+
+
+def test_chapter_body_starting_with_its_own_heading_is_not_doubled():
+    # DOCX-заголовок и та же строка в начале текста главы
+    text = "# Глава 1\nГлава 1\nПервая глава.\n\n# Глава 2\nГлава 2\nВторая глава.\n"
+    assert [c["title"] for c in detect_chapters(text)] == ["Глава 1", "Глава 2"]
+
+
+def test_chapter_marker_joins_only_its_subtitle():
+    text = (
+        "Часть 1\nГлава 1\n# Курочка\nПервая глава.\n\n"
+        "# Сказка\nГлава 2\nВторая глава.\n\nIII\nТретья глава.\n"
+    )
+    assert [c["title"] for c in detect_chapters(text)] == ["Глава 1 — Курочка", "Глава 2", "III"]
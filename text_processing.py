@@ -3,6 +3,28 @@
 """
 
 import re
+from collections import Counter
+from xml.sax.saxutils import escape
+
+from config import CHUNK_TARGET_CHARS, DEDUP_MEMO_MB, DEDUP_SENTENCE_CHARS, FIRST_CHUNK_CHARS
+from chunk_cache import normalize_chunk
+from eta import format_duration, format_range, throughput
+
+# Заголовки глав: markdown/DOCX-заголовки и метки глав
+_MARKDOWN_HEADING_RE = re.compile(r'^#{1,6}\s*\S')
+# Метки глав: «Глава N», «Часть II», «Пролог»…
+_MARKER_RE = re.compile(
+    r'^(?:(?:глава|часть|книга|chapter|part)\s+(?:\d+|[ivxlcdm]+|[а-яё]+)\b.*'
+    r'|пролог|эпилог|предисловие|послесловие|вступление|заключение)$',
+    re.IGNORECASE,
+)
+# Одиночные римские или арабские номера на отдельной строке: «IV», «12.»
+_NUMBER_HEADING_RE = re.compile(r'^(?:[IVXLCDM]+|\d{1,3})\.?$')
+# Знак ударения разметки (accents): «+» перед гласной — «Гл+ава»
+_ACCENT_MARK_RE = re.compile(r'\+(?=[аеёиоуыэюяaeiouy])', re.IGNORECASE)
+_MAX_HEADING_LEN = 80
+# Без памяти повторов выделять повторы в отдельные фрагменты незачем
+_REPEAT_MAX_CHARS = DEDUP_SENTENCE_CHARS if DEDUP_MEMO_MB > 0 else 0
 
 
 def split_into_sentences(text: str) -> list[str]:
@@ -14,9 +36,77 @@ def split_into_sentences(text: str) -> list[str]:
     return [s.strip() for s in sentences if len(s.strip()) > 1]
 
 
-def analyze_text_chapters(text: str) -> tuple[str, bool]:
+def strip_accent_marks(text: str) -> str:
+    """Убирает знаки ударения разметки: «Гл+ава 1» → «Глава 1»."""
+    return _ACCENT_MARK_RE.sub("", text)
+
+
+def count_accent_marks(text: str) -> int:
+    return len(_ACCENT_MARK_RE.findall(text))
+
+
+def is_chapter_heading(line: str) -> bool:
+    """Проверяет, похожа ли строка на заголовок главы (с ударениями или без)."""
+    line = strip_accent_marks(line).strip()
+    if not line or len(line) > _MAX_HEADING_LEN:
+        return False
+    return bool(_MARKDOWN_HEADING_RE.match(line) or _is_chapter_marker(line))
+
+
+def _is_chapter_marker(heading: str) -> bool:
+    """Метка главы («Глава 2», «IV», «Пролог») в отличие от названия («Курочка»)."""
+    return bool(_MARKER_RE.match(heading) or _NUMBER_HEADING_RE.match(heading))
+
+
+def detect_chapters(text: str) -> list[dict]:
+    """
+    Делит текст на главы по строкам-заголовкам.
+    Заголовок остаётся в тексте главы, чтобы его озвучить.
+    Заголовки без текста (например, «Часть 1» перед «Глава 1»)
+    присоединяются к следующей главе. Название — последний заголовок;
+    метка главы и идущее сразу за ней название объединяются
+    («Глава 2 — Курочка»), две метки — никогда.
+    В размеченном тексте (accents) заголовки ищутся без знаков
+    ударения, названия глав — без них, текст глав — с ними.
+    Возвращает список {"title": str, "text": str}.
+    """
+    chapters = []
+    carried = []
+    title = ""
+    lines = []
+
+    def close_chapter():
+        body = [l for l in lines if l.strip() and not is_chapter_heading(l)]
+        if not body:
+            return
+        chapters.append({"title": title, "text": "\n".join(lines).strip()})
+
+    for line in text.splitlines():
+        if is_chapter_heading(line):
+            if any(l.strip() and not is_chapter_heading(l) for l in lines):
+                close_chapter()
+                carried, lines = [], []
+            heading = strip_accent_marks(line).strip().lstrip('#').strip()
+            if carried and _is_chapter_marker(carried[-1]) and not _is_chapter_marker(heading):
+                title = f"{carried[-1]} — {heading}"
+            else:
+                title = heading
+            carried.append(heading)
+        lines.append(line)
+    close_chapter()
+
+    if len(chapters) <= 1:
+        return [{"title": "", "text": text.strip()}] if text.strip() else []
+    if not chapters[0]["title"]:
+        chapters[0]["title"] = "Начало"
+    return chapters
+
+
+def analyze_text_chapters(text: str, speaker: str | None = None, pause: float = 0.0) -> tuple[str, bool]:
     """
     Анализирует текст и возвращает отчет БЕЗ запуска синтеза.
+    Время синтеза оценивается моделью скорости (eta) по фрагментам
+    текста для голоса speaker на этой машине.
     Возвращает: (отчет_текст, можно_ли_запускать_синтез)
     """
     if not text or not text.strip():
@@ -24,16 +114,41 @@ def analyze_text_chapters(text: str) -> tuple[str, bool]:
 
     text_size_mb = len(text.encode('utf-8')) / (1024 * 1024)
     words = len(text.split())
-    estimated_minutes = words / 100
+    chunk_chars = [len(chunk) for chunk in split_into_chunks(text, pause)]
+    estimate = throughput.estimate(chunk_chars, speaker)
+    basis = {
+        "speaker": f"по {estimate['samples']} замерам голоса на этой машине",
+        "all": f"по {estimate['samples']} замерам всех голосов на этой машине",
+        "default": "замеров ещё нет, оценка уточнится после первого синтеза",
+    }[estimate["source"]]
 
     report_lines = [
         "📊 РЕЗУЛЬТАТЫ АНАЛИЗА",
         "",
-        f"📝 Объем текста: {text_size_mb:.2f} MB ({words} слов)",
-        f"⏱️ Примерное время синтеза: ~{estimated_minutes:.0f} мин",
+        f"📝 Объем текста: {text_size_mb:.2f} MB ({words} слов, {len(chunk_chars)} фрагментов)",
+        f"⏱️ Примерное время синтеза: {format_range(estimate)}",
+        f"   90% интервал, {basis}",
+    ]
+
+    chapters = detect_chapters(text)
+    if len(chapters) > 1:
+        report_lines.extend(["", f"📖 Найдено глав: {len(chapters)}"])
+        for i, chapter in enumerate(chapters[:50], 1):
+            ch_words = len(chapter["text"].split())
+            ch_kb = len(chapter["text"].encode('utf-8')) / 1024
+            ch_chars = [len(chunk) for chunk in split_into_chunks(chapter["text"], pause)]
+            ch_seconds = throughput.estimate(ch_chars, speaker)["seconds"]
+            report_lines.append(
+                f"  {i}. {chapter['title'][:50]} — {ch_kb:.1f} KB, "
+                f"{ch_words} слов, ~{format_duration(ch_seconds)}"
+            )
+        if len(chapters) > 50:
+            report_lines.append(f"  … и ещё {len(chapters) - 50}")
+
+    report_lines.extend([
         "",
         "✅ Готово к синтезу! Нажмите 'Запуск синтеза' для начала."
-    ]
+    ])
 
     return "\n".join(report_lines), True
 
@@ -41,39 +156,154 @@ def analyze_text_chapters(text: str) -> tuple[str, bool]:
 def split_long_sentence(sentence: str, max_chars: int = 900) -> list[str]:
     """
     Silero имеет ограничение ~1000 символов на один вызов.
-    Разбиваем длинные предложения по знакам пунктуации.
+    Разбиваем длинные предложения по знакам пунктуации, а слишком
+    длинные части — по словам. Части копятся в списке, а не склеиванием
+    строк, поэтому время линейно по длине предложения.
     """
     if len(sentence) <= max_chars:
         return [sentence]
 
     chunks = []
-    current = ""
-    parts = re.split(r'(?<=[,;:–—])\s+', sentence)
+    current: list[str] = []
+    size = 0
+
+    def add(piece: str):
+        nonlocal size
+        if current and size + 1 + len(piece) > max_chars:
+            chunks.append(" ".join(current))
+            current.clear()
+            size = 0
+        size += len(piece) + (1 if current else 0)
+        current.append(piece)
 
-    for part in parts:
-        if len(current) + len(part) + 1 <= max_chars:
-            current = f"{current} {part}".strip() if current else part
+    for part in re.split(r'(?<=[,;:–—])\s+', sentence):
+        if not part:
+            continue
+        if len(part) <= max_chars:
+            add(part)
         else:
-            if current:
-                chunks.append(current)
-            if len(part) > max_chars:
-                words = part.split()
-                current = ""
-                for w in words:
-                    if len(current) + len(w) + 1 <= max_chars:
-                        current = f"{current} {w}".strip() if current else w
-                    else:
-                        if current:
-                            chunks.append(current)
-                        current = w
-            else:
-                current = part
+            for word in part.split():
+                add(word)
 
     if current:
-        chunks.append(current)
+        chunks.append(" ".join(current))
     return chunks
 
 
+def _break_markup(pause: float) -> str:
+    return f' <break time="{int(round(pause * 1000))}ms"/> '
+
+
+def iter_packed(
+    sentences,
+    target_chars: int = CHUNK_TARGET_CHARS,
+    pause: float = 0.0,
+    first_chars: int = FIRST_CHUNK_CHARS,
+    repeats: set[str] | None = None,
+    repeat_chars: int = _REPEAT_MAX_CHARS,
+):
+    """
+    Упаковывает соседние предложения во фрагменты длиной до target_chars,
+    чтобы короткие реплики («Да.») не шли отдельными вызовами apply_tts.
+    Исключение — короткие (до repeat_chars) повторяющиеся предложения:
+    они идут отдельным фрагментом, который целиком совпадает с прошлым
+    и берётся из памяти повторов задания без вызова модели. repeats —
+    заранее известные повторы (нормализованные, см. repeated_sentences);
+    без него повтором считается уже встреченное предложение.
+    Первый фрагмент ограничен first_chars (0 — без ограничения): он
+    синтезируется быстрее, и прослушивание начинается раньше.
+    Паузы между предложениями внутри фрагмента сохраняются SSML-разметкой
+    <break>, которую понимает Silero; такой фрагмент начинается с <speak>.
+    Одиночное предложение остаётся обычным текстом. Длина считается
+    с разметкой, один проход — линейное время. Принимает любой итератор
+    и отдаёт фрагменты по мере готовности.
+    """
+    separator = _break_markup(pause) if pause > 0 else " "
+    group: list[str] = []
+    size = 0
+
+    def pack() -> str:
+        if len(group) == 1:
+            return group[0]
+        if pause > 0:
+            return "<speak>" + separator.join(escape(s) for s in group) + "</speak>"
+        return separator.join(group)
+
+    # Запас на <speak></speak>
+    overhead = len("<speak></speak>") if pause > 0 else 0
+    budget = target_chars - overhead
+    limit = min(budget, first_chars - overhead) if first_chars > 0 else budget
+    seen: set[str] = set()
+    for sentence in sentences:
+        if len(sentence) <= repeat_chars:
+            key = normalize_chunk(sentence)
+            repeated = key in seen or (repeats is not None and key in repeats)
+            seen.add(key)
+            if repeated:
+                if group:
+                    yield pack()
+                    group.clear()
+                    size = 0
+                yield sentence
+                limit = budget
+                continue
+        cost = len(escape(sentence)) if pause > 0 else len(sentence)
+        if group and size + len(separator) + cost > limit:
+            yield pack()
+            group.clear()
+            size = 0
+            limit = budget
+        size += cost + (len(separator) if group else 0)
+        group.append(sentence)
+    if group:
+        yield pack()
+
+
+def pack_sentences(
+    sentences: list[str],
+    target_chars: int = CHUNK_TARGET_CHARS,
+    pause: float = 0.0,
+) -> list[str]:
+    """Список упакованных фрагментов, см. iter_packed."""
+    return list(iter_packed(sentences, target_chars, pause))
+
+
+def repeated_sentences(sentences: list[str], max_chars: int = _REPEAT_MAX_CHARS) -> set[str]:
+    """Нормализованные короткие предложения, которые встречаются больше одного раза."""
+    if max_chars <= 0:
+        return set()
+    counts = Counter(normalize_chunk(s) for s in sentences if len(s) <= max_chars)
+    return {s for s, n in counts.items() if n > 1}
+
+
+def _iter_sentences(paragraphs):
+    for paragraph in paragraphs:
+        for s in split_into_sentences(preprocess_text(paragraph)):
+            yield from split_long_sentence(s)
+
+
+def split_into_chunks(text: str, pause: float = 0.0, target_chars: int = CHUNK_TARGET_CHARS) -> list[str]:
+    """
+    Полный путь от сырого текста до фрагментов для apply_tts. Текст
+    известен целиком, поэтому отдельными фрагментами идут все вхождения
+    повторов, включая первое.
+    """
+    sentences = list(_iter_sentences([text]))
+    return list(iter_packed(
+        sentences, target_chars, pause, repeats=repeated_sentences(sentences),
+    ))
+
+
+def iter_chunks(paragraphs, pause: float = 0.0, target_chars: int = CHUNK_TARGET_CHARS):
+    """
+    Ленивый вариант split_into_chunks для потока абзацев: фрагменты
+    отдаются, пока источник ещё читается. Граница абзаца считается
+    границей предложения; фрагменты упаковываются через границы абзацев.
+    Повтор выделяется в отдельный фрагмент со второго вхождения.
+    """
+    return iter_packed(_iter_sentences(paragraphs), target_chars, pause)
+
+
 def preprocess_text(text: str) -> str:
     """Предобработка текста перед синтезом."""
     text = re.sub(r'\s+', ' ', text)
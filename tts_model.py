@@ -1,37 +1,307 @@
 """
 Загрузка и инициализация модели Silero TTS v5
+
+Модель загружается лениво: при первом get_model() или заранее в фоновом
+потоке через start_loading(). Импорт модуля не тянет torch, поэтому
+интерфейс и утилиты стартуют сразу, а состояние загрузки видно через
+model_status().
+
+Ускорение CPU-инференса включается настройками config: inference_mode,
+динамическая int8-квантизация и oneDNN. Синтез идёт через synthesize().
 """
 
-import os
-import torch
-from config import MODEL_DIR
+import threading
+import time
+
+from config import (
+    MODEL_PATH, SAMPLE_RATE, TTS_INFERENCE_MODE, TTS_INTEROP_THREADS, TTS_ONEDNN, TTS_QUANTIZE,
+    TTS_THREADS, TTS_WARMUP,
+)
+
+MODEL_URL = "https://models.silero.ai/models/tts/ru/v5_ru.pt"
+
+# Состояния загрузки
+IDLE, LOADING, WARMING, READY, FAILED = "idle", "loading", "warming", "ready", "failed"
+
+
+class ModelLoadError(RuntimeError):
+    """Модель не удалось скачать или загрузить."""
+
+
+_state = IDLE
+_model = None
+_error: str | None = None
+_lock = threading.Lock()
+_ready = threading.Event()
+# Выключается, если модель несовместима с torch.inference_mode; тогда
+# синтез идёт под torch.no_grad
+_inference_mode = TTS_INFERENCE_MODE
+_no_grad = False
+# Проверка модели в процессах пула (use_pool): в этом процессе веса не грузятся
+_pool_check = None
+
+
+def _set_state(state: str):
+    global _state
+    _state = state
+    print(f"[tts_model] {state}")
+
+
+def configure_torch(num_threads: int = TTS_THREADS):
+    """Потоки PyTorch и настройки oneDNN текущего процесса."""
+    import torch
+
+    torch.set_num_threads(num_threads)
+    if TTS_INTEROP_THREADS:
+        try:
+            torch.set_num_interop_threads(TTS_INTEROP_THREADS)
+        except RuntimeError:
+            # Задаётся один раз до первой параллельной работы процесса
+            pass
+    if TTS_ONEDNN:
+        torch.backends.mkldnn.enabled = True
+        if hasattr(torch.jit, "enable_onednn_fusion"):
+            torch.jit.enable_onednn_fusion(True)
 
-print("Загрузка модели Silero TTS v5...")
-device = torch.device("cpu")
-torch.set_num_threads(int(os.environ.get("TTS_THREADS", "4")))
 
-model_path = MODEL_DIR / "v5_ru.pt"
-if not model_path.exists():
-    print("Скачивание модели (~100 MB)...")
+def read_model():
+    """Загружает модель fp32 из MODEL_PATH (при отсутствии — скачивает)."""
+    import torch
+
+    if not MODEL_PATH.exists():
+        print("Скачивание модели (~100 MB)...")
+        try:
+            torch.hub.download_url_to_file(MODEL_URL, str(MODEL_PATH))
+        except Exception as e:
+            raise ModelLoadError(
+                f"Не удалось скачать модель: {e}. "
+                f"Скачайте вручную {MODEL_URL} в {MODEL_PATH}"
+            ) from e
+
     try:
-        torch.hub.download_url_to_file(
-            "https://models.silero.ai/models/tts/ru/v5_ru.pt",
-            str(model_path),
+        model = torch.package.PackageImporter(str(MODEL_PATH)).load_pickle(
+            "tts_models", "model"
         )
+        model.to(torch.device("cpu"))
     except Exception as e:
-        print(f"[ERROR] Не удалось скачать модель: {e}")
-        print("Проверьте подключение к интернету или скачайте модель вручную:")
-        print(f"  URL: https://models.silero.ai/models/tts/ru/v5_ru.pt")
-        print(f"  Путь: {model_path}")
-        raise SystemExit(1)
-
-try:
-    model = torch.package.PackageImporter(str(model_path)).load_pickle(
-        "tts_models", "model"
+        raise ModelLoadError(
+            f"Не удалось загрузить модель: {e}. "
+            f"Файл может быть повреждён — удалите {MODEL_PATH} и перезапустите."
+        ) from e
+    return model
+
+
+def quantize_model(model) -> int:
+    """
+    Динамическая int8-квантизация слоёв Linear/LSTM/GRU там, где она
+    возможна: в обычных (eager) модулях модели. Части TorchScript уже
+    скомпилированы и остаются fp32. Модель меняется на месте;
+    возвращает число квантованных слоёв.
+    """
+    import torch
+    from torch import nn
+
+    layers = {nn.Linear, nn.LSTM, nn.GRU}
+    if isinstance(model, nn.Module):
+        modules = [model]
+    else:
+        modules = [value for value in vars(model).values() if isinstance(value, nn.Module)]
+    quantized = 0
+    for module in modules:
+        if isinstance(module, torch.jit.ScriptModule):
+            continue
+        count = sum(1 for m in module.modules() if type(m) in layers)
+        if count:
+            module.eval()
+            torch.ao.quantization.quantize_dynamic(module, layers, dtype=torch.qint8, inplace=True)
+            quantized += count
+    return quantized
+
+
+def optimize_model(model, quantize: str = TTS_QUANTIZE):
+    """Применяет квантизацию из настроек; недоступная оставляет fp32."""
+    if quantize == "int8":
+        count = quantize_model(model)
+        if count:
+            print(f"[tts_model] int8: квантовано слоёв {count}")
+        else:
+            print("[WARN] int8-квантизация недоступна: у модели нет слоёв Linear/LSTM "
+                  "вне TorchScript — модель остаётся fp32")
+    elif quantize != "none":
+        print(f"[WARN] Неизвестное TTS_QUANTIZE={quantize} — модель остаётся fp32")
+    return model
+
+
+def run_tts(model, inference_mode: bool, no_grad: bool = False, **kwargs):
+    """
+    model.apply_tts; с inference_mode — без учёта autograd (torch.inference_mode),
+    с no_grad — под torch.no_grad. torch импортируется только при
+    включённых оптимизациях: заглушкам модели он не нужен.
+    """
+    if not (inference_mode or no_grad or TTS_ONEDNN):
+        return model.apply_tts(**kwargs)
+    import torch
+
+    if TTS_ONEDNN:
+        # Флаг процессора действует на текущий поток
+        torch.set_flush_denormal(True)
+    if inference_mode:
+        with torch.inference_mode():
+            return model.apply_tts(**kwargs)
+    if no_grad:
+        with torch.no_grad():
+            return model.apply_tts(**kwargs)
+    return model.apply_tts(**kwargs)
+
+
+def _apply(model, **kwargs):
+    global _inference_mode, _no_grad
+    try:
+        return run_tts(model, _inference_mode, _no_grad, **kwargs)
+    except RuntimeError as e:
+        if not _inference_mode or "nference tensor" not in str(e):
+            raise
+        _inference_mode, _no_grad = False, True
+        print(f"[WARN] Модель несовместима с inference_mode ({e}) — синтез под no_grad")
+        return run_tts(model, False, True, **kwargs)
+
+
+def synthesize(**kwargs):
+    """apply_tts загруженной модели с настройками инференса из config."""
+    return _apply(get_model(), **kwargs)
+
+
+def _load(num_threads: int, warmup: bool):
+    global _model, _error
+    try:
+        if _pool_check is not None:
+            _pool_check()
+            _set_state(READY)
+            return
+        configure_torch(num_threads)
+        model = optimize_model(read_model())
+
+        if warmup:
+            _warmup(model)
+
+        _model = model
+        _set_state(READY)
+    except Exception as e:
+        _error = str(e)
+        _set_state(FAILED)
+        print(f"[ERROR] {_error}")
+    finally:
+        _ready.set()
+
+
+def _warmup(model):
+    # Прогрев: JIT-оптимизации и аллокатор до первого реального запроса
+    _set_state(WARMING)
+    started = time.time()
+    _apply(
+        model,
+        text="Прогрев модели.",
+        speaker="xenia",
+        sample_rate=SAMPLE_RATE,
+        put_accent=True,
+        put_yo=True,
     )
-    model.to(device)
-    print("Модель загружена.")
-except Exception as e:
-    print(f"[ERROR] Не удалось загрузить модель: {e}")
-    print(f"Файл модели может быть повреждён. Удалите {model_path} и перезапустите.")
-    raise SystemExit(1)
+    print(f"[tts_model] прогрев {time.time() - started:.1f} сек")
+
+
+def start_loading(num_threads: int = TTS_THREADS, warmup: bool = TTS_WARMUP, background: bool = True):
+    """Запускает загрузку модели, если она ещё не начата."""
+    with _lock:
+        if _state != IDLE:
+            return
+        _set_state(LOADING)
+    if background:
+        threading.Thread(
+            target=_load, args=(num_threads, warmup), name="tts-model-loader", daemon=True,
+        ).start()
+    else:
+        _load(num_threads, warmup)
+
+
+def prepare_worker(num_threads: int, warmup: bool = TTS_WARMUP):
+    """
+    Готовит процесс-воркер. Если модель унаследована от forkserver,
+    веса не копируются: задаются только потоки PyTorch и прогрев
+    (он пишет лишь в память активаций). Иначе модель грузится здесь.
+    """
+    if _model is None:
+        _load(num_threads, warmup)
+        return
+    configure_torch(num_threads)
+    if warmup:
+        _warmup(_model)
+        _set_state(READY)
+
+
+def use_pool(check):
+    """
+    Модель живёт только в процессах пула (TTS_WORKERS > 1): основной
+    процесс весов не грузит. start_loading() вместо загрузки вызывает
+    check() — он дожидается модели в воркере и бросает исключение, если
+    она недоступна. Состояние и is_ready() отражают готовность пула.
+    """
+    global _pool_check
+    _pool_check = check
+
+
+def wait_ready(timeout: float | None = None):
+    """
+    Запускает загрузку (или проверку пула) и дожидается её.
+    Бросает ModelLoadError при ошибке или таймауте.
+    """
+    if _state == READY:
+        return
+    start_loading()
+    if not _ready.wait(timeout):
+        raise ModelLoadError("Модель ещё загружается")
+    if _state != READY:
+        raise ModelLoadError(_error or "Модель не загружена")
+
+
+def get_model(timeout: float | None = None):
+    """
+    Возвращает загруженную модель, при необходимости запуская загрузку
+    и дожидаясь её. Бросает ModelLoadError при ошибке или таймауте.
+    """
+    if _model is not None:
+        return _model
+    wait_ready(timeout)
+    if _model is None:
+        raise ModelLoadError(_error or "Модель загружена только в процессах пула")
+    return _model
+
+
+def use_model(model):
+    """Подставляет готовый объект с apply_tts вместо Silero (бенчмарк без модели)."""
+    global _model
+    with _lock:
+        _model = model
+        _set_state(READY)
+    _ready.set()
+
+
+def is_ready() -> bool:
+    return _model is not None or (_pool_check is not None and _state == READY)
+
+
+def model_status() -> str:
+    """Состояние модели для интерфейса."""
+    return {
+        IDLE: "⏸️ Модель не загружена",
+        LOADING: "⏳ Модель загружается...",
+        WARMING: "🔥 Прогрев модели...",
+        READY: "✅ Модель готова",
+        FAILED: f"❌ Ошибка загрузки модели: {_error}",
+    }[_state]
+
+
+def __getattr__(name: str):
+    # Совместимость со старым `from tts_model import model`
+    if name == "model":
+        return get_model()
+    raise AttributeError(name)
@@ -2,13 +2,16 @@
 Gradio-интерфейс Audiobook Maker
 """
 
+import time
 import gradio as gr
 from pathlib import Path
 
-from config import SPEAKERS, FORMATS
+from config import SPEAKERS, FORMATS, LIVE_STREAM
 from converters import convert_to_text
 from text_processing import analyze_text_chapters
-from synthesizer import preview_voice, synthesize_text
+from synthesizer import accept_accents, prepare_accents, preview_voice, synthesize_text, resume_job
+from jobs import JobControl, get_control, list_interrupted_jobs, register_control
+from tts_model import model_status, is_ready
 
 
 # ──────────────────────────────────────────────
@@ -147,13 +150,13 @@ label {
 # Wrapper-функции для двухэтапного UI
 # ──────────────────────────────────────────────
 
-def analyze_text_wrapper(text: str):
+def analyze_text_wrapper(text: str, speaker: str | None = None, pause: float = 0.0):
     """Wrapper для анализа текста через UI."""
-    report, can_start = analyze_text_chapters(text)
+    report, can_start = analyze_text_chapters(text, speaker, pause)
     return report, gr.update(interactive=can_start), text
 
 
-def analyze_file_wrapper(file):
+def analyze_file_wrapper(file, speaker: str | None = None, pause: float = 0.0):
     """Wrapper для анализа загруженного файла через UI."""
     if file is None:
         return "❌ Загрузите текстовый файл.", gr.update(interactive=False), None
@@ -171,7 +174,7 @@ def analyze_file_wrapper(file):
         return "❌ Файл пуст.", gr.update(interactive=False), None
 
     # Анализируем извлеченный текст
-    report, can_start = analyze_text_chapters(text)
+    report, can_start = analyze_text_chapters(text, speaker, pause)
 
     # Добавляем информацию о файле в отчет
     file_name = Path(file_path).name
@@ -180,38 +183,132 @@ def analyze_file_wrapper(file):
     return enhanced_report, gr.update(interactive=can_start), text
 
 
-def analyze_universal_wrapper(text_input: str, file_input):
-    """Универсальный wrapper для анализа из любого источника (текст или файл)."""
+def analyze_universal_wrapper(
+    text_input: str,
+    file_input,
+    speaker_name: str,
+    pause: float,
+    progress=gr.Progress(track_tqdm=False),
+):
+    """
+    Универсальный wrapper для анализа из любого источника (текст или файл).
+    Время синтеза оценивается для выбранного голоса и паузы.
+    Заодно размечает ударения: один раз на книгу для всех голосов.
+    """
+    speaker = SPEAKERS.get(speaker_name)
     if file_input is not None:
-        return analyze_file_wrapper(file_input)
+        report, start_update, text = analyze_file_wrapper(file_input, speaker, pause)
     elif text_input and text_input.strip():
-        return analyze_text_wrapper(text_input)
+        report, start_update, text = analyze_text_wrapper(text_input, speaker, pause)
     else:
-        return "❌ Введите текст или загрузите файл.", gr.update(interactive=False), None
+        return "❌ Введите текст или загрузите файл.", gr.update(interactive=False), None, ""
+
+    annotated = ""
+    if text:
+        annotated, accents_report = prepare_accents(text, progress)
+        if accents_report:
+            report = f"{report}\n\n{accents_report}"
+    return report, start_update, text, annotated
 
 
 def synthesize_with_progress(
     text: str,
+    accented_text: str,
     speaker_name: str,
     speed: float,
     pause: float,
     output_format: str,
     mp3_title: str,
     mp3_artist: str,
+    preserve_pitch: bool,
+    per_chapter: bool,
+    request: gr.Request = None,
     progress=gr.Progress(track_tqdm=False)
 ):
-    """Упрощенная обертка для синтеза с прогрессом."""
-    for audio_path, download_path, log_text in synthesize_text(
-        text, speaker_name, speed, pause, output_format,
-        mp3_title, mp3_artist, progress
+    """
+    Упрощенная обертка для синтеза с прогрессом; текст с ударениями — если есть.
+    Управление (пауза, отмена) привязано к сессии вкладки.
+    """
+    annotated = bool(text) and accept_accents(text, accented_text)
+    control = register_control(_session_key(request))
+    control.resume_args = {
+        "text": accented_text if annotated else text, "speaker_name": speaker_name,
+        "speed": speed, "pause_between_sentences": pause, "output_format": output_format,
+        "mp3_tags_title": mp3_title, "mp3_tags_artist": mp3_artist,
+        "preserve_pitch": preserve_pitch, "per_chapter": per_chapter, "annotated": annotated,
+    }
+    for live_segment, audio_path, download_path, log_text in synthesize_text(
+        **control.resume_args, progress=progress, control=control,
     ):
-        yield audio_path, download_path, log_text
+        yield live_segment, audio_path, download_path, log_text
+
+
+def _session_key(request: gr.Request | None) -> str | None:
+    return getattr(request, "session_hash", None)
+
+
+def pause_wrapper(request: gr.Request = None):
+    """Пауза текущего синтеза вкладки: остановка после ближайшего фрагмента."""
+    control = get_control(_session_key(request))
+    if control is None or control.state != JobControl.RUNNING:
+        gr.Info("Нет запущенного синтеза")
+        return
+    control.pause()
+    gr.Info("Пауза после текущего фрагмента")
+
+
+def cancel_wrapper(request: gr.Request = None):
+    """Отмена текущего синтеза вкладки с удалением временных файлов."""
+    control = get_control(_session_key(request))
+    if control is None or control.state == JobControl.CANCELLED:
+        gr.Info("Нет запущенного синтеза")
+        return
+    control.cancel()
+    gr.Info("Синтез отменяется")
+
+
+def continue_wrapper(request: gr.Request = None, progress=gr.Progress(track_tqdm=False)):
+    """Продолжает приостановленный синтез вкладки с теми же параметрами."""
+    paused = get_control(_session_key(request))
+    if paused is None or paused.state != JobControl.PAUSED or paused.resume_args is None:
+        yield None, None, None, "[ERROR]Нет приостановленного синтеза."
+        return
+    # Задание с тем же текстом и звучанием продолжается по манифесту
+    control = register_control(_session_key(request))
+    control.resume_args = paused.resume_args
+    yield from synthesize_text(**control.resume_args, progress=progress, control=control)
+
+
+def interrupted_jobs_update():
+    """Обновляет список прерванных заданий."""
+    choices = [
+        (
+            f"{j['title']} — {j['done']}/{j['total']} "
+            f"({time.strftime('%Y-%m-%d %H:%M', time.localtime(j['updated']))})",
+            j["job_id"],
+        )
+        for j in list_interrupted_jobs()
+    ]
+    return gr.update(choices=choices, value=choices[0][1] if choices else None)
+
+
+def resume_job_wrapper(job_id: str, request: gr.Request = None, progress=gr.Progress(track_tqdm=False)):
+    """Продолжает выбранное прерванное задание."""
+    if not job_id:
+        yield None, None, None, "[ERROR]Выберите задание для продолжения."
+        return
+    yield from resume_job(job_id, progress, register_control(_session_key(request)))
 
 
 # ──────────────────────────────────────────────
 # Построение интерфейса
 # ──────────────────────────────────────────────
 
+def model_status_update():
+    """Статус модели; после готовности опрос останавливается."""
+    return model_status(), gr.Timer(active=not is_ready())
+
+
 def create_app() -> gr.Blocks:
     """Создаёт и возвращает Gradio-приложение."""
 
@@ -227,6 +324,9 @@ def create_app() -> gr.Blocks:
         </div>
         """)
 
+        model_status_md = gr.Markdown(model_status())
+        model_timer = gr.Timer(2.0)
+
         # ── БЛОК: Настройки синтеза ──
         gr.Markdown("### ⚙️ Настройки синтеза")
         with gr.Row():
@@ -236,12 +336,22 @@ def create_app() -> gr.Blocks:
                     value="Ксения (женский)",
                     label="Голос диктора",
                 )
+                preview_phrase = gr.Textbox(
+                    label="",
+                    show_label=False,
+                    placeholder="Своя фраза для прослушивания (необязательно)",
+                    max_length=300,
+                )
                 preview_btn = gr.Button("🎧 Прослушать голос", size="sm")
             with gr.Column(scale=1):
                 speed = gr.Slider(
                     minimum=0.5, maximum=2.0, value=1.0, step=0.05,
                     label="Скорость речи",
                 )
+                preserve_pitch = gr.Checkbox(
+                    value=True,
+                    label="Сохранять высоту голоса",
+                )
             with gr.Column(scale=1):
                 pause = gr.Slider(
                     minimum=0.1, maximum=2.0, value=0.5, step=0.1,
@@ -270,6 +380,11 @@ def create_app() -> gr.Blocks:
                     label="Автор (ID3 Artist)",
                     placeholder="Автор произведения",
                 )
+            per_chapter = gr.Checkbox(
+                value=False,
+                label="Отдельный файл на каждую главу",
+                info="Главы синтезируются параллельно; результат — ZIP-архив",
+            )
 
         gr.Markdown("---")
 
@@ -292,11 +407,11 @@ def create_app() -> gr.Blocks:
             with gr.TabItem("📁 Загрузка файла"):
                 gr.Markdown("""
                 **Поддерживаемые форматы:**
-                `.txt` `.md` `.docx` `.pages` (старый формат)
+                `.txt` `.md` `.docx` `.fb2` `.epub` `.pages` (старый формат)
                 """)
                 file_input = gr.File(
                     label="",
-                    file_types=[".txt", ".md", ".docx", ".pages"],
+                    file_types=[".txt", ".md", ".docx", ".fb2", ".epub", ".pages"],
                     type="filepath",
                 )
 
@@ -312,6 +427,16 @@ def create_app() -> gr.Blocks:
             placeholder="Нажмите 'Анализ текста' чтобы увидеть информацию о тексте..."
         )
 
+        # Разметка считается при анализе и переиспользуется всеми голосами;
+        # правки сохраняются при запуске синтеза
+        with gr.Accordion("🔤 Ударения", open=False):
+            accented_text = gr.Textbox(
+                label="Текст с ударениями",
+                info="+ перед ударной гласной: з+амок / зам+ок. Пусто — ударения расставит модель",
+                lines=12,
+                max_lines=30,
+            )
+
         gr.Markdown("---")
 
         # ── БЛОК: ЭТАП 2 - СИНТЕЗ ──
@@ -322,12 +447,37 @@ def create_app() -> gr.Blocks:
             size="lg",
             interactive=False
         )
+        # Проверяются между фрагментами: пауза сохраняет готовую часть
+        with gr.Row():
+            pause_btn = gr.Button("⏸️ Пауза", size="sm")
+            continue_btn = gr.Button("▶️ Продолжить", size="sm")
+            cancel_btn = gr.Button("⏹️ Отменить", size="sm")
+
+        # Задания, прерванные перезапуском, продолжаются с места остановки
+        with gr.Accordion("⏯️ Прерванные задания", open=False):
+            with gr.Row():
+                interrupted_jobs = gr.Dropdown(
+                    choices=[],
+                    label="Задание",
+                    scale=3,
+                )
+                refresh_jobs_btn = gr.Button("🔄 Обновить", size="sm", scale=1)
+                resume_btn = gr.Button("▶️ Продолжить", size="sm", scale=1)
 
         gr.Markdown("---")
 
         # ── БЛОК: РЕЗУЛЬТАТЫ ──
         gr.Markdown("### 📁 Результаты")
 
+        # Готовые сегменты звучат, пока книга ещё синтезируется
+        live_audio = gr.Audio(
+            label="📡 Слушать во время синтеза",
+            streaming=True,
+            autoplay=False,
+            interactive=False,
+            visible=LIVE_STREAM,
+        )
+
         with gr.Row():
             with gr.Column():
                 player_audio = gr.Audio(
@@ -358,6 +508,10 @@ def create_app() -> gr.Blocks:
             **MP3-теги:**
             Раскройте «Параметры экспорта» для добавления метаданных (название, автор)
 
+            **Главы:**
+            Заголовки «Глава N», «Часть II», римские номера и стили заголовков DOCX
+            распознаются автоматически. Формат M4B сохраняет метки глав для перехода в плеере
+
             **Длинные тексты:**
             Автоматическая разбивка на фрагменты. Максимальный размер: 5 MB
 
@@ -369,24 +523,64 @@ def create_app() -> gr.Blocks:
         analyzed_text = gr.State(value=None)
 
         # ── Обработчики ──
-        common_inputs = [speaker, speed, pause, output_format, mp3_title, mp3_artist]
+        common_inputs = [
+            speaker, speed, pause, output_format, mp3_title, mp3_artist,
+            preserve_pitch, per_chapter,
+        ]
 
         preview_btn.click(
             fn=preview_voice,
-            inputs=[speaker],
+            inputs=[speaker, preview_phrase],
             outputs=[preview_audio, preview_status],
+            concurrency_limit=None,
         )
 
         analyze_btn.click(
             fn=analyze_universal_wrapper,
-            inputs=[text_input, file_input],
-            outputs=[analysis_output, start_btn, analyzed_text]
+            inputs=[text_input, file_input, speaker, pause],
+            outputs=[analysis_output, start_btn, analyzed_text, accented_text]
         )
 
         start_btn.click(
             fn=synthesize_with_progress,
-            inputs=[analyzed_text] + common_inputs,
-            outputs=[player_audio, download_output, log_output]
+            inputs=[analyzed_text, accented_text] + common_inputs,
+            outputs=[live_audio, player_audio, download_output, log_output],
+            # Очередь и допуск — в планировщике (workers.admission), не в Gradio
+            concurrency_limit=None,
+        )
+
+        pause_btn.click(fn=pause_wrapper, inputs=[], outputs=[], concurrency_limit=None)
+        cancel_btn.click(fn=cancel_wrapper, inputs=[], outputs=[], concurrency_limit=None)
+        continue_btn.click(
+            fn=continue_wrapper,
+            inputs=[],
+            outputs=[live_audio, player_audio, download_output, log_output],
+            concurrency_limit=None,
+        )
+
+        refresh_jobs_btn.click(
+            fn=interrupted_jobs_update,
+            inputs=[],
+            outputs=[interrupted_jobs],
+        )
+
+        resume_btn.click(
+            fn=resume_job_wrapper,
+            inputs=[interrupted_jobs],
+            outputs=[live_audio, player_audio, download_output, log_output],
+            concurrency_limit=None,
+        )
+
+        model_timer.tick(
+            fn=model_status_update,
+            inputs=[],
+            outputs=[model_status_md, model_timer],
+        )
+
+        app.load(
+            fn=interrupted_jobs_update,
+            inputs=[],
+            outputs=[interrupted_jobs],
         )
 
     return app
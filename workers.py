@@ -0,0 +1,297 @@
+"""
+Пул процессов для параллельного синтеза фрагментов
+"""
+
+import multiprocessing as mp
+import os
+import threading
+import time
+from collections import deque
+from collections.abc import Iterable
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from itertools import islice
+
+import numpy as np
+
+from config import MAX_ACTIVE_JOBS, SAMPLE_RATE, TTS_SHARE_MODEL, TTS_WORKERS, TTS_WORKER_THREADS
+from chunk_cache import ChunkMemo, get_chunk_cache
+from scheduler import ChunkScheduler, JobAdmission, new_owner
+
+# Флаги автоматической расстановки ударений и буквы ё
+APPLY_TTS_FLAGS = {
+    "put_accent": True,
+    "put_yo": True,
+    "put_stress_homo": True,
+    "put_yo_homo": True,
+}
+# Текст уже размечен этапом accents: модель только читает знаки ударения
+ANNOTATED_TTS_FLAGS = {flag: False for flag in APPLY_TTS_FLAGS}
+
+_executor: Executor | None = None
+_executor_lock = threading.Lock()
+
+
+def _init_worker(threads: int):
+    """Инициализатор процесса-воркера: модель (унаследованная или своя) и прогрев."""
+    import tts_model
+    tts_model.prepare_worker(threads)
+
+
+def render_chunk(text: str, speaker: str, flags: dict = APPLY_TTS_FLAGS) -> np.ndarray:
+    """Синтезирует один фрагмент и возвращает PCM int16."""
+    from tts_model import synthesize
+
+    # Упакованные фрагменты с паузами <break> передаются как SSML
+    text_arg = {"ssml_text": text} if text.startswith("<speak>") else {"text": text}
+    audio = synthesize(
+        **text_arg,
+        speaker=speaker,
+        sample_rate=SAMPLE_RATE,
+        **flags,
+    )
+    return (audio.numpy() * 32767).astype(np.int16)
+
+
+def _render_chunk_timed(text: str, speaker: str, flags: dict) -> tuple[np.ndarray, float, float]:
+    """render_chunk с временем начала (по часам системы) и длительностью синтеза."""
+    started = time.time()
+    audio = render_chunk(text, speaker, flags)
+    return audio, started, time.time() - started
+
+
+def _check_model() -> bool:
+    """Выполняется в воркере: модель загружена и готова к синтезу."""
+    import tts_model
+    tts_model.get_model()
+    return True
+
+
+def start_model():
+    """
+    Готовит модель для интерфейса. При TTS_WORKERS > 1 синтез идёт только
+    в пуле, поэтому основной процесс весов не грузит: запускаются
+    воркеры (с моделью из forkserver), а готовность и превью зависят от
+    них. Иначе модель грузится в этом процессе.
+    """
+    import tts_model
+
+    if TTS_WORKERS > 1:
+        tts_model.use_pool(
+            lambda: scheduler.submit("model", _check_model, urgent=True).result()
+        )
+    tts_model.start_loading()
+
+
+def get_executor() -> Executor:
+    """
+    Возвращает общий исполнитель синтеза.
+    При TTS_WORKERS > 1 — пул процессов; с TTS_SHARE_MODEL они
+    порождаются forkserver'ом с уже загруженной моделью и делят веса
+    copy-on-write, иначе (или без fork, как в Windows) каждый грузит свою копию.
+    При TTS_WORKERS == 1 — один поток с моделью основного процесса.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            if TTS_WORKERS > 1:
+                _executor = ProcessPoolExecutor(
+                    max_workers=TTS_WORKERS,
+                    mp_context=_worker_context(),
+                    initializer=_init_worker,
+                    initargs=(TTS_WORKER_THREADS,),
+                )
+            else:
+                _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="tts")
+        return _executor
+
+
+# Все фрагменты и превью попадают в исполнитель только через планировщик:
+# не больше TTS_WORKERS одновременно, задания чередуются по фрагменту
+scheduler = ChunkScheduler(get_executor, TTS_WORKERS)
+admission = JobAdmission(MAX_ACTIVE_JOBS)
+
+
+def _worker_context():
+    if TTS_SHARE_MODEL and "forkserver" in mp.get_all_start_methods():
+        ctx = mp.get_context("forkserver")
+        ctx.set_forkserver_preload(["model_preload"])
+        return ctx
+    return mp.get_context("spawn")
+
+
+def _read_smaps_rollup(pid) -> dict | None:
+    """Rss/Pss/Shared/Private и пиковый RSS процесса в МБ из /proc (только Linux)."""
+    try:
+        with open(f"/proc/{pid}/smaps_rollup", "r") as f:
+            lines = f.read().splitlines()[1:]
+        # Пиковый RSS (VmHWM) есть только в status
+        with open(f"/proc/{pid}/status", "r") as f:
+            lines += [line for line in f if line.startswith("VmHWM")]
+    except OSError:
+        return None
+    kb = {}
+    for line in lines:
+        name, _, value = line.partition(":")
+        parts = value.split()
+        if parts and parts[-1] == "kB":
+            kb[name] = int(parts[0])
+    return {
+        "rss_mb": round(kb.get("Rss", 0) / 1024, 1),
+        "pss_mb": round(kb.get("Pss", 0) / 1024, 1),
+        "shared_mb": round((kb.get("Shared_Clean", 0) + kb.get("Shared_Dirty", 0)) / 1024, 1),
+        "private_mb": round((kb.get("Private_Clean", 0) + kb.get("Private_Dirty", 0)) / 1024, 1),
+        "peak_rss_mb": round(kb.get("VmHWM", 0) / 1024, 1),
+    }
+
+
+def memory_report() -> list[dict]:
+    """
+    Память основного процесса, forkserver и воркеров пула.
+    Для оценки контейнера суммируйте pss_mb: общие страницы весов
+    делятся в нём поровну между процессами и не считаются дважды.
+    """
+    processes = [("main", os.getpid())]
+    if isinstance(_executor, ProcessPoolExecutor):
+        from multiprocessing import forkserver
+        server_pid = getattr(forkserver._forkserver, "_forkserver_pid", None)
+        if server_pid:
+            processes.append(("forkserver", server_pid))
+        # Список процессов пула — внутренний атрибут, но другого способа нет
+        for pid in sorted((getattr(_executor, "_processes", None) or {}).keys()):
+            processes.append(("worker", pid))
+
+    report = []
+    for role, pid in processes:
+        usage = _read_smaps_rollup(pid)
+        if usage is not None:
+            report.append({"role": role, "pid": pid, **usage})
+    return report
+
+
+def format_memory_report(report: list[dict]) -> list[str]:
+    """Строки лога с памятью процессов."""
+    if not report:
+        return []
+    lines = [
+        f"[INFO]Память: RSS {sum(p['rss_mb'] for p in report):.0f} MB, "
+        f"PSS {sum(p['pss_mb'] for p in report):.0f} MB в {len(report)} процессах"
+    ]
+    for p in report:
+        lines.append(
+            f"   {p['role']} {p['pid']}: RSS {p['rss_mb']:.0f} MB, общая {p['shared_mb']:.0f} MB, "
+            f"собственная {p['private_mb']:.0f} MB"
+        )
+    return lines
+
+
+def _reset_executor():
+    """Сбрасывает сломанный пул, чтобы следующий запуск создал новый."""
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
+
+
+def render_chunks(
+    chunks: Iterable[str],
+    speaker: str,
+    window: int | None = None,
+    stats: dict | None = None,
+    start: int = 0,
+    memo: ChunkMemo | None = None,
+    flags: dict = APPLY_TTS_FLAGS,
+    owner: str | None = None,
+):
+    """
+    Синтезирует фрагменты параллельно и отдаёт результаты строго по порядку.
+    Одновременно в работе не более window фрагментов, поэтому буфер
+    переупорядочивания ограничен и память не растёт с размером книги.
+    Готовые фрагменты берутся из дискового кеша без вызова модели;
+    счётчики попаданий/промахов накапливаются в stats. Повторы внутри
+    задания (memo) берут PCM уже синтезированного или синтезирующегося
+    фрагмента — stats["dedup_hits"].
+    chunks может быть ленивым итератором: фрагменты берутся из него
+    только по мере освобождения окна, так что синтез начинается,
+    пока источник ещё читается.
+    Фрагменты до start пропускаются (уже записаны при возобновлении).
+    flags — параметры разметки apply_tts (ANNOTATED_TTS_FLAGS для текста
+    с готовыми ударениями); входят в ключи кеша и повторов.
+    owner — очередь в планировщике: фрагменты разных владельцев
+    чередуются, главы одной книги передают общего владельца.
+    Генерирует (index, chunk, audio_int16 | None, error | None, timing), где
+    timing = {"started_at", "inference_s", "cached"} для телеметрии.
+    """
+    cache = get_chunk_cache()
+    owner = owner or new_owner()
+    if window is None:
+        window = max(2, TTS_WORKERS * 2)
+    if stats is None:
+        stats = {}
+    stats.setdefault("cache_hits", 0)
+    stats.setdefault("cache_misses", 0)
+    stats.setdefault("dedup_hits", 0)
+
+    def ready(audio: np.ndarray) -> Future:
+        future = Future()
+        future.set_result((audio, None, None))
+        return future
+
+    def submit(chunk: str) -> tuple[Future, str | None, str | None, str]:
+        # Происхождение: "dedup" — повтор в задании, "cache" — диск, "synth" — модель
+        memo_key = memo.key(chunk, speaker, flags) if memo else None
+        found = memo.lookup(memo_key) if memo else None
+        if found is not None:
+            stats["dedup_hits"] += 1
+            return (found if isinstance(found, Future) else ready(found)), None, memo_key, "dedup"
+        key = cache.key(chunk, speaker, flags) if cache else None
+        audio = cache.get(key) if cache else None
+        if audio is not None:
+            stats["cache_hits"] += 1
+            return ready(audio), None, memo_key, "cache"
+        stats["cache_misses"] += 1
+        future = scheduler.submit(owner, _render_chunk_timed, chunk, speaker, flags)
+        if memo:
+            memo.reserve(memo_key, future)
+        return future, key, memo_key, "synth"
+
+    source = enumerate(chunks)
+    for _ in islice(source, start):
+        pass
+    pending = deque()
+    try:
+        while True:
+            for i, chunk in islice(source, window - len(pending)):
+                pending.append((i, chunk, *submit(chunk)))
+            if not pending:
+                break
+
+            i, chunk, future, key, memo_key, origin = pending.popleft()
+            timing = {"started_at": None, "inference_s": None, "cached": origin != "synth"}
+            try:
+                audio, started_at, inference_s = future.result()
+                error = None
+                if origin == "synth":
+                    timing["started_at"], timing["inference_s"] = started_at, inference_s
+                if key is not None:
+                    cache.put(key, audio)
+                if memo and origin != "dedup":
+                    memo.put(memo_key, audio)
+            except BrokenProcessPool as e:
+                # Воркер упал — пересоздаём пул для оставшихся фрагментов
+                _reset_executor()
+                audio, error = None, e
+            except Exception as e:
+                audio, error = None, e
+            if error is not None and memo and origin == "synth":
+                memo.discard(memo_key)
+            yield i, chunk, audio, error, timing
+    finally:
+        # Генератор закрыт досрочно — отменяем то, что ещё не начато.
+        # Чужие Future (повторы из других глав) не трогаем
+        for _, _, future, _, memo_key, origin in pending:
+            if origin == "synth":
+                future.cancel()
+                if memo:
+                    memo.discard(memo_key)